@@ -1,14 +1,20 @@
 
+import os
 from flask import Flask, Response, make_response, jsonify, request
 import json
 from utils import api_success_response
 from flask_cors import CORS
 # from gevent import pywsgi
 from shelters import queryShelters
-from routes import getRoute
+from routes import getRoute, setClosures, listClosures
+from flow import queryFlow
+import metrics
+import profiling
 
 app = Flask(__name__)
 CORS(app)
+# 按需性能分析 Opt-in request profiling (PROFILE_REQUESTS=1, then ?profile=sample or X-Profile: cprofile)
+profiling.install(app)
 
 @app.errorhandler(Exception)
 def handle_database_error(error):
@@ -47,9 +53,11 @@ def get_print():
     print(address)
     try:
         
-        data = queryShelters(address)
+        with metrics.request("query_shelters"):
+            data = queryShelters(address)
 
-        response = api_success_response(data)
+            with metrics.span("json_encode"):
+                response = api_success_response(data)
         return response
     except Exception as e:
         raise e
@@ -59,20 +67,67 @@ def get_print():
 def test():
     address = request.args.get("address")
     shelter_id = request.args.get("shelter_id")
+    # 可选灾害图层 Optional extra hazard layers, e.g. hazards=flood:2,earthquake
+    hazards = request.args.get("hazards")
+
+    try:
+
+        with metrics.request("query_routes"):
+            data = getRoute(address, int(shelter_id), hazards)
+
+            with metrics.span("json_encode"):
+                response = api_success_response(data)
+        return response
+    except Exception as e:
+        raise e
+
+# 封路 Close / penalize / reopen edges: JSON {"district": "Nihonbashi", "network": "walk", "edge_ids": [...], "geometry": GeoJSON, "factor": 3}
+@app.route("/closures", methods=["GET", "POST"])
+def closures():
+    try:
+
+        if request.method == "GET":
+            data = listClosures()
+        else:
+            body = request.get_json(silent=True) or {}
+            data = setClosures(body.get("network", "walk"), body.get("edge_ids"), body.get("geometry"), body.get("factor"),
+                               body.get("district"))
 
+        response = api_success_response(data)
+        return response
+    except Exception as e:
+        raise e
+
+# 人流查询 Flow cube query
+@app.get("/query-flow")
+def query_flow():
+    nodes = request.args.get("nodes")
     try:
 
-        data = getRoute(address, int(shelter_id))
+        data = queryFlow(
+            request.args.get("start"),
+            request.args.get("end"),
+            agg=request.args.get("agg", "sum"),
+            k=int(request.args.get("k", 10)),
+            nodes=[int(n) for n in nodes.split(",")] if nodes else None,
+            resolution=request.args.get("resolution")
+        )
 
         response = api_success_response(data)
         return response
     except Exception as e:
         raise e
 
+# 性能指标 Stage latencies and counters in Prometheus text format
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 # Press the green button in the gutter to run the script.
 if __name__ == '__main__':
-    print("The Server Started at 8083!")
-    app.run(host='0.0.0.0', port=8083)
+    port = int(os.environ.get("PORT", 8083))
+    print(f"The Server Started at {port}!")
+    app.run(host='0.0.0.0', port=port)
     
     # server = pywsgi.WSGIServer(('0.0.0.0', 8083), app)
     # server.serve_forever()
@@ -0,0 +1,328 @@
+"""Load test for the routing server with local stand-ins for Google geocoding and OpenWeatherMap.
+
+Starts two stub HTTP servers (configurable latency, jitter and error rate), launches app.py
+with GEOCODE_URL / WEATHER_URL pointing at them (or targets a running server with --url), and
+drives /query-shelters and /query-routes with a mix of Nihonbashi addresses at a fixed
+concurrency. Reports throughput, latency percentiles per endpoint and server memory, and
+writes everything to a JSON file that --compare can diff against an earlier run.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import requests
+from colorama import Fore, Style
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Addresses inside Nihonbashi with their coordinates, served by the stub geocoder
+ADDRESSES = {
+    "Nihonbashi Station": (35.6823, 139.7740),
+    "Mitsukoshimae Station": (35.6873, 139.7735),
+    "Ningyocho Station": (35.6862, 139.7823),
+    "Kayabacho Station": (35.6797, 139.7800),
+    "Coredo Muromachi": (35.6869, 139.7737),
+    "Nihonbashi Bridge": (35.6840, 139.7750),
+    "Bakurocho Station": (35.6932, 139.7826),
+    "Kodenmacho Station": (35.6913, 139.7782),
+    "Hamacho Park": (35.6868, 139.7898),
+    "Suitengumae Station": (35.6826, 139.7850),
+    "Tokyo Stock Exchange": (35.6822, 139.7780),
+    "Takashimaya Nihonbashi": (35.6809, 139.7731),
+}
+OUTSIDE_ADDRESSES = {"Shinjuku Station": (35.6896, 139.7006)}  # Rejected by the boundary check
+UNKNOWN_ADDRESSES = ["Nowhere 1-2-3"]  # Stub geocoder answers ZERO_RESULTS
+ADDRESS_MIX = (0.9, 0.07, 0.03)  # inside / outside / unknown
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Stub:
+    """Threaded HTTP stand-in for one upstream API: respond(query) -> JSON after a simulated delay."""
+
+    def __init__(self, name, respond, latency_ms=50.0, jitter_ms=20.0, error_rate=0.0, seed=0):
+        self.name = name
+        self.respond = respond
+        self.latency_ms, self.jitter_ms, self.error_rate = latency_ms, jitter_ms, error_rate
+        self.calls = self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.calls += 1
+                    delay = max(0.0, stub._rng.gauss(stub.latency_ms, stub.jitter_ms)) / 1000
+                    fail = stub._rng.random() < stub.error_rate
+                    stub.errors += fail
+                time.sleep(delay)
+                body = b'{"error": "stub failure"}' if fail else \
+                    json.dumps(stub.respond(parse_qs(urlparse(self.path).query))).encode()
+                self.send_response(500 if fail else 200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/{name}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def stats(self):
+        return {"calls": self.calls, "errors": self.errors, "latency_ms": self.latency_ms,
+                "jitter_ms": self.jitter_ms, "error_rate": self.error_rate}
+
+
+def geocode_response(query):
+    """Google Geocoding API shape: results[0].geometry.location for known addresses."""
+    address = query.get("address", [""])[0].strip().lower()
+    known = {name.lower(): coords for name, coords in {**ADDRESSES, **OUTSIDE_ADDRESSES}.items()}
+    if address not in known:
+        return {"status": "ZERO_RESULTS", "results": []}
+    lat, lng = known[address]
+    return {"status": "OK", "results": [{"geometry": {"location": {"lat": lat, "lng": lng}}}]}
+
+
+def weather_response(query):
+    """OpenWeatherMap current weather shape with a plausible Tokyo summer afternoon."""
+    temp = random.uniform(27, 36)
+    return {"main": {"temp": temp, "temp_max": temp + random.uniform(0, 2), "temp_min": temp - random.uniform(2, 6),
+                     "humidity": random.uniform(50, 85)},
+            "wind": {"speed": random.uniform(0.5, 6)}, "clouds": {"all": random.uniform(0, 100)}}
+
+
+def rss_mb(pid):
+    """Resident memory of a process in MB (Linux /proc), None elsewhere."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+class MemorySampler:
+    """Peak RSS of a process, sampled in the background."""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid, self.interval = pid, interval
+        self.start_mb = rss_mb(pid)
+        self.peak_mb = self.start_mb
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            current = rss_mb(self.pid)
+            if current is not None:
+                self.peak_mb = max(self.peak_mb or 0, current)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end_mb = rss_mb(self.pid)
+
+
+def start_app(port, env, timeout):
+    """Launch app.py on `port` with the given environment and wait until /get-test answers."""
+    process = subprocess.Popen([sys.executable, "app.py"], cwd=HERE, env={**os.environ, **env, "PORT": str(port)})
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"app.py exited with code {process.returncode} during startup")
+        try:
+            if requests.get(f"{url}/get-test", timeout=2).ok:
+                return process, url
+        except requests.RequestException:
+            time.sleep(1)
+    process.terminate()
+    raise TimeoutError(f"app.py did not start within {timeout} s")
+
+
+def request_plan(n, routes_share, seed):
+    """(endpoint, params) for n requests: a seeded mix of shelters / routes calls and address kinds."""
+    rng = random.Random(seed)
+    kinds = [list(ADDRESSES), list(OUTSIDE_ADDRESSES), UNKNOWN_ADDRESSES]
+    plan = []
+    for _ in range(n):
+        address = rng.choice(rng.choices(kinds, weights=ADDRESS_MIX)[0])
+        if rng.random() < routes_share:
+            plan.append(("query-routes", {"address": address, "shelter_id": rng.randint(1, 5)}))
+        else:
+            plan.append(("query-shelters", {"address": address}))
+    return plan
+
+
+def run_load(url, plan, concurrency, timeout):
+    """Send the plan with `concurrency` workers; one record per request."""
+    local = threading.local()
+
+    def send(item):
+        endpoint, params = item
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = local.session.get(f"{url}/{endpoint}", params=params, timeout=timeout)
+            status = response.status_code
+            data = response.json().get("data") if status == 200 else None
+        except (requests.RequestException, ValueError):
+            status, data = None, None
+        # The app answers expected failures (outside boundary, geocoding failed) with a message string
+        return {"endpoint": endpoint, "seconds": time.perf_counter() - start, "status": status,
+                "app_error": data if isinstance(data, str) else None}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        records = list(pool.map(send, plan))
+    return records, time.perf_counter() - start
+
+
+def summarize(records, wall_s):
+    """Throughput and latency percentiles (ms) overall and per endpoint."""
+    def stats(rows):
+        ms = np.array([r["seconds"] for r in rows]) * 1000
+        errors = {}
+        for r in rows:
+            key = r["app_error"] or (None if r["status"] == 200 else f"http_{r['status']}")
+            if key:
+                errors[key] = errors.get(key, 0) + 1
+        return {"requests": len(rows), "throughput_rps": round(len(rows) / wall_s, 2),
+                "http_errors": sum(r["status"] != 200 for r in rows), "app_errors": errors,
+                "latency_ms": {"mean": round(float(ms.mean()), 1), "max": round(float(ms.max()), 1),
+                               **{f"p{p}": round(float(v), 1) for p, v in zip(PERCENTILES, np.percentile(ms, PERCENTILES))}}}
+
+    endpoints = sorted({r["endpoint"] for r in records})
+    return {"overall": stats(records), **{e: stats([r for r in records if r["endpoint"] == e]) for e in endpoints}}
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=HERE, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(current, baseline):
+    """Print throughput and latency changes against a baseline result file."""
+    print(f"\nCompared with {baseline.get('version')} ({baseline.get('timestamp')}):")
+    for endpoint, now in current["results"].items():
+        before = baseline["results"].get(endpoint)
+        if not before:
+            continue
+        cells = []
+        for label, a, b in [("rps", before["throughput_rps"], now["throughput_rps"])] + \
+                           [(p, before["latency_ms"][p], now["latency_ms"][p]) for p in ("p50", "p95", "p99")]:
+            change = (b - a) / a * 100 if a else 0.0
+            worse = change < 0 if label == "rps" else change > 0
+            color = Fore.RED if worse and abs(change) > 10 else Fore.GREEN
+            cells.append(f"{label} {a:g} -> {b:g} ({color}{change:+.1f}%{Style.RESET_ALL})")
+        print(f"  {endpoint:15s} " + "  ".join(cells))
+
+
+def print_summary(results, memory):
+    for endpoint, s in results.items():
+        lat = s["latency_ms"]
+        print(f"{endpoint:15s} {s['requests']:5d} req  {s['throughput_rps']:7.2f} req/s  "
+              f"p50 {lat['p50']:8.1f}  p95 {lat['p95']:8.1f}  p99 {lat['p99']:8.1f}  max {lat['max']:8.1f} ms  "
+              f"http errors {s['http_errors']}  app errors {sum(s['app_errors'].values())}")
+    if memory.get("server_rss_peak_mb") is not None:
+        print(f"Server RSS {memory['server_rss_start_mb']:.0f} MB at start, {memory['server_rss_peak_mb']:.0f} MB peak")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test /query-shelters and /query-routes against stub upstream APIs")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5, help="requests sent before measuring")
+    parser.add_argument("--routes-share", type=float, default=0.3, help="share of /query-routes calls")
+    parser.add_argument("--geocode-latency-ms", type=float, default=80)
+    parser.add_argument("--weather-latency-ms", type=float, default=120)
+    parser.add_argument("--jitter-ms", type=float, default=30)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub calls answered with HTTP 500")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8093, help="port for the launched app.py")
+    parser.add_argument("--url", help="target an already running server instead of launching app.py "
+                                      "(start it with GEOCODE_URL / WEATHER_URL from --stubs-only)")
+    parser.add_argument("--stubs-only", action="store_true", help="only run the stub servers until interrupted")
+    parser.add_argument("--startup-timeout", type=float, default=900, help="seconds to wait for app.py (graph download)")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    geocoder = Stub("geocode", geocode_response, args.geocode_latency_ms, args.jitter_ms, args.error_rate, args.seed).start()
+    weather = Stub("weather", weather_response, args.weather_latency_ms, args.jitter_ms, args.error_rate, args.seed + 1).start()
+    stub_env = {"GEOCODE_URL": geocoder.url, "WEATHER_URL": weather.url}
+    if args.stubs_only:
+        print(" ".join(f"{k}={v}" for k, v in stub_env.items()))
+        threading.Event().wait()
+
+    process = None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        print(f"{Fore.CYAN}Starting app.py on port {args.port} ...{Style.RESET_ALL}")
+        process, url = start_app(args.port, stub_env, args.startup_timeout)
+    try:
+        run_load(url, request_plan(args.warmup, args.routes_share, args.seed + 100), args.concurrency, args.timeout)
+        plan = request_plan(args.requests, args.routes_share, args.seed)
+        memory = {}
+        if process:
+            with MemorySampler(process.pid) as sampler:
+                records, wall_s = run_load(url, plan, args.concurrency, args.timeout)
+            memory = {"server_rss_start_mb": sampler.start_mb, "server_rss_peak_mb": sampler.peak_mb,
+                      "server_rss_end_mb": sampler.end_mb}
+        else:
+            records, wall_s = run_load(url, plan, args.concurrency, args.timeout)
+        memory["client_maxrss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        geocoder.stop()
+        weather.stop()
+
+    result = {
+        "version": git_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "wall_s": round(wall_s, 3),
+        "results": summarize(records, wall_s),
+        "memory": memory,
+        "upstream": {"geocode": geocoder.stats(), "weather": weather.stats()},
+    }
+    print_summary(result["results"], memory)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults saved to '{args.output}'")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(result, json.load(f))
@@ -0,0 +1,182 @@
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from colorama import Fore, Style
+
+from geodata import boundary_polygon
+from spatial_index import SpatialIndex
+import metrics
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data")
+CACHE_DIR = os.path.join(DATA_DIR, "shade_cache")
+METRIC_CRS = "EPSG:2451"
+LOCAL_TZ = "Asia/Tokyo"
+SUMMER_DAY = "2025-08-01"  # Representative summer day for the sun path
+FLOOR_HEIGHT_M = 3.5  # Used when a building has NFloor but no Height
+MIN_SUN_ELEVATION = 3.0  # degrees; below this the sun is treated as down (no shade layer)
+SHADE_HEAT_RELIEF = 0.5  # A fully shaded edge gets the same heat reduction as a park edge
+
+
+def sun_position(when, lat, lon):
+    """Solar elevation and azimuth (degrees, azimuth clockwise from north) for a tz-aware time (NOAA)."""
+    ts = pd.Timestamp(when).tz_convert("UTC")
+    hour = ts.hour + ts.minute / 60 + ts.second / 3600
+    g = 2 * np.pi / 365 * (ts.dayofyear - 1 + (hour - 12) / 24)
+    eqtime = 229.18 * (0.000075 + 0.001868 * np.cos(g) - 0.032077 * np.sin(g)
+                       - 0.014615 * np.cos(2 * g) - 0.040849 * np.sin(2 * g))
+    decl = (0.006918 - 0.399912 * np.cos(g) + 0.070257 * np.sin(g) - 0.006758 * np.cos(2 * g)
+            + 0.000907 * np.sin(2 * g) - 0.002697 * np.cos(3 * g) + 0.00148 * np.sin(3 * g))
+    hour_angle = np.radians((hour * 60 + eqtime + 4 * lon) / 4 - 180)
+    lat = np.radians(lat)
+    cos_zenith = np.sin(lat) * np.sin(decl) + np.cos(lat) * np.cos(decl) * np.cos(hour_angle)
+    elevation = 90 - np.degrees(np.arccos(np.clip(cos_zenith, -1, 1)))
+    azimuth = np.degrees(np.arctan2(np.sin(hour_angle),
+                                    np.cos(hour_angle) * np.sin(lat) - np.tan(decl) * np.cos(lat))) + 180
+    return float(elevation), float(azimuth % 360)
+
+
+def load_buildings(path):
+    """Building footprints in the metric CRS with a `height` column (Height, else NFloor x 3.5 m)."""
+    buildings = gpd.read_file(path).to_crs(METRIC_CRS)
+    height = pd.to_numeric(buildings["Height"], errors="coerce") if "Height" in buildings else pd.Series(np.nan, index=buildings.index)
+    if "NFloor" in buildings:
+        height = height.fillna(pd.to_numeric(buildings["NFloor"], errors="coerce") * FLOOR_HEIGHT_M)
+    buildings["height"] = height
+    buildings = buildings[(buildings["height"] > 0) & buildings.geometry.notna()]
+    return buildings[["height", "geometry"]].reset_index(drop=True)
+
+
+def shadow_polygons(footprints, heights, elevation, azimuth):
+    """
+    Ground shadows of extruded footprints: the convex hull of each footprint and its copy moved
+    height / tan(elevation) away from the sun (exact for convex footprints, slightly generous otherwise).
+    """
+    length = np.asarray(heights, dtype=float) / np.tan(np.radians(elevation))
+    offsets = np.column_stack([-np.sin(np.radians(azimuth)) * length, -np.cos(np.radians(azimuth)) * length])
+    coords, index = shapely.get_coordinates(footprints, return_index=True)
+    moved = shapely.set_coordinates(np.array(footprints, dtype=object).copy(), coords + offsets[index])
+    return shapely.convex_hull(shapely.union(footprints, moved))
+
+
+def shaded_fraction(edge_index, shadows):
+    """
+    Fraction of each edge's length inside any shadow. Shadows are matched to edges through the
+    edge SpatialIndex; the shaded pieces of an edge become intervals along it, merged so
+    overlapping shadows are not counted twice.
+    """
+    edge_geoms = edge_index.geoms
+    shadow_idx, edge_idx = edge_index.intersects(shadows)
+    pieces, piece_of = shapely.get_parts(shapely.intersection(edge_geoms[edge_idx], shadows[shadow_idx]), return_index=True)
+    lines = shapely.get_type_id(pieces) == 1
+    owner = edge_idx[piece_of[lines]]
+    start = shapely.line_locate_point(edge_geoms[owner], shapely.get_point(pieces[lines], 0))
+    end = shapely.line_locate_point(edge_geoms[owner], shapely.get_point(pieces[lines], -1))
+    intervals = pd.DataFrame({"edge": owner, "lo": np.minimum(start, end), "hi": np.maximum(start, end)})
+    intervals = intervals.sort_values(["edge", "lo"], kind="stable")
+    reach = intervals.groupby("edge")["hi"].cummax().groupby(intervals["edge"]).shift().fillna(-np.inf)
+    covered = np.clip(intervals["hi"] - np.maximum(intervals["lo"], reach), 0, None)
+    shaded = np.bincount(intervals["edge"], weights=covered, minlength=len(edge_geoms))
+    total = shapely.length(edge_geoms)
+    return np.clip(np.divide(shaded, total, out=np.zeros_like(shaded), where=total > 0), 0, 1).astype(np.float32)
+
+
+class ShadeCache:
+    """
+    Per-hour shaded fraction of every walk edge for one summer day, cached on disk as one .npy
+    per hour under Data/shade_cache/<key>/. The key hashes the building file, the edge list,
+    the day and the model constants, so a changed input gets a fresh cache.
+    """
+
+    def __init__(self, edges, buildings_path, day=SUMMER_DAY, cache_dir=CACHE_DIR, edge_index=None):
+        self.edges = edges
+        self.buildings_path = buildings_path
+        self.day = day
+        self._edge_index = edge_index or SpatialIndex(edges, "walk_edges", METRIC_CRS)
+        centre = edges.geometry.to_crs("EPSG:4326").union_all().centroid
+        self.lat, self.lon = centre.y, centre.x
+        self.path = os.path.join(cache_dir, self._key())
+        self._buildings = None
+        self._fractions = {}
+
+    def _key(self):
+        digest = hashlib.sha1()
+        with open(self.buildings_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(np.array(self.edges.index.to_list(), dtype=np.int64).tobytes())
+        digest.update(f"{self.day}|{FLOOR_HEIGHT_M}|{MIN_SUN_ELEVATION}".encode())
+        return digest.hexdigest()[:16]
+
+    def sun(self, hour):
+        """Sun elevation and azimuth at hh:30 local time on the cached day."""
+        return sun_position(pd.Timestamp(f"{self.day} {hour:02d}:30", tz=LOCAL_TZ), self.lat, self.lon)
+
+    def _compute(self, hour):
+        elevation, azimuth = self.sun(hour)
+        if self._buildings is None:
+            self._buildings = load_buildings(self.buildings_path)
+        shadows = shadow_polygons(self._buildings.geometry.values, self._buildings["height"].to_numpy(), elevation, azimuth)
+        return shaded_fraction(self._edge_index, shadows)
+
+    def fraction(self, hour):
+        """Shaded fraction per edge (ox.graph_to_gdfs order) for a local hour; None when the sun is down."""
+        if hour in self._fractions:
+            metrics.inc("cache_requests_total", cache="shade", result="hit")
+            return self._fractions[hour]
+        if self.sun(hour)[0] < MIN_SUN_ELEVATION:
+            self._fractions[hour] = None
+            return None
+        file = os.path.join(self.path, f"hour_{hour:02d}.npy")
+        if os.path.exists(file):
+            metrics.inc("cache_requests_total", cache="shade", result="disk")
+            fraction = np.load(file, mmap_mode="r")
+        else:
+            metrics.inc("cache_requests_total", cache="shade", result="miss")
+            fraction = self._compute(hour)
+            os.makedirs(self.path, exist_ok=True)
+            np.save(file, fraction)
+        self._fractions[hour] = fraction
+        return fraction
+
+    def precompute(self, hours=range(24)):
+        """Fill the cache for the given hours; returns {hour: seconds spent}."""
+        timings = {}
+        for hour in hours:
+            start = time.perf_counter()
+            if self.fraction(hour) is not None:
+                timings[hour] = time.perf_counter() - start
+        return timings
+
+    def heat_factors(self):
+        """Heat factor per edge for every sunlit hour: 1 - SHADE_HEAT_RELIEF x shaded fraction."""
+        return {hour: 1 - SHADE_HEAT_RELIEF * np.asarray(self.fraction(hour))
+                for hour in range(24) if self.fraction(hour) is not None}
+
+
+if __name__ == "__main__":
+    import osmnx as ox
+
+    parser = argparse.ArgumentParser(description="Precompute per-hour building shade on the walk graph")
+    parser.add_argument("buildings", help="building footprints with Height (or NFloor)")
+    parser.add_argument("--day", default=SUMMER_DAY)
+    parser.add_argument("--graph", help="walk graph as GraphML (default: download the Nihonbashi walk graph)")
+    args = parser.parse_args()
+
+    if args.graph:
+        G_walk = ox.load_graphml(args.graph)
+    else:
+        G_walk = ox.graph_from_polygon(boundary_polygon(), network_type='walk')
+
+    shade = ShadeCache(ox.graph_to_gdfs(G_walk, nodes=False), args.buildings, args.day)
+    timings = shade.precompute()
+    print(f"{Fore.GREEN}Shade cache: {shade.path}{Style.RESET_ALL}")
+    for hour, seconds in timings.items():
+        elevation, azimuth = shade.sun(hour)
+        print(f"{hour:02d}:30  sun {elevation:5.1f}° / {azimuth:5.1f}°  "
+              f"mean shade {float(np.mean(shade.fraction(hour))):.2f}  ({seconds:.2f} s)")
@@ -0,0 +1,267 @@
+"""District registry: one routing shard per boundary, loaded lazily and evicted LRU.
+
+Districts are listed in Data/districts.json (or DISTRICTS_FILE) as
+`[{"name": "Nihonbashi", "boundary": "Nihonbashi_Line.shp"}, ...]`, boundary paths relative
+to Data/; without the file only Nihonbashi is served. Addresses are matched to a district
+through an STRtree over the boundaries. A District holds the walk and drive networks of its
+boundary buffered by DISTRICT_OVERLAP_M, so routes near the edge can cross into the
+neighbouring district, plus its hazard layers, drive weights, closures and the shelters
+inside the buffered area with their shortest-path trees. The networks are GraphStores
+saved in the district snapshot with the parks and memory-mapped on load, so worker
+processes share their pages and no networkx graph or edge frame is kept; Overpass and
+networkx are only used the first time a district is built, and a shard evicted under
+DISTRICT_MEMORY_MB reloads from disk.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import osmnx as ox
+import shapely
+from colorama import Fore, Style
+
+import metrics
+from building_shade import ShadeCache
+from closures import Closures, ShelterTrees
+from drive_weights import DriveWeights, drive_store
+from geodata import DATA_DIR, BOUNDARY_SHP, METRIC_CRS, VULNERABILITY_FACTORS, boundary_polygon
+from graph_store import GraphStore
+from hazard_layers import HazardRegistry, PARK_HEAT_FACTOR, default_layer_path
+from spatial_index import SpatialIndex
+
+DISTRICTS_FILE = os.environ.get("DISTRICTS_FILE") or os.path.join(DATA_DIR, "districts.json")
+SNAPSHOT_DIR = os.environ.get("DISTRICT_CACHE") or os.path.join(DATA_DIR, "cache", "districts")
+OVERLAP_M = float(os.environ.get("DISTRICT_OVERLAP_M", "500"))  # Graph and shelters extend this far past the boundary
+MEMORY_BUDGET_MB = float(os.environ.get("DISTRICT_MEMORY_MB", "1024"))
+
+# 热路线默认代价 Heat route cost: length x heat hazard (halved in parks) x vulnerability factor
+HEAT_ROUTE_LAYERS = {'heat': 1.0, 'vulnerability': 1.0}
+
+
+def load_districts(path=DISTRICTS_FILE):
+    """{name: boundary polygon (EPSG:4326)} from the districts file, else Nihonbashi alone."""
+    if not os.path.exists(path):
+        return {"Nihonbashi": boundary_polygon(BOUNDARY_SHP)}
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    return {entry["name"]: boundary_polygon(os.path.join(DATA_DIR, entry["boundary"])) for entry in entries}
+
+
+def buffered(polygon, distance_m):
+    """EPSG:4326 polygon grown by distance_m (buffered in the metric CRS)."""
+    if distance_m <= 0:
+        return polygon
+    metric = gpd.GeoSeries([polygon], crs="EPSG:4326").to_crs(METRIC_CRS)
+    return metric.buffer(distance_m).to_crs("EPSG:4326").iloc[0]
+
+
+def _snapshot(name, area):
+    """Snapshot directory of a district, keyed by the buffered area (a changed boundary or overlap gets a new one)."""
+    key = hashlib.sha1(shapely.to_wkb(area)).hexdigest()[:12]
+    slug = "".join(c if c.isalnum() else "_" for c in name.lower())
+    return os.path.join(SNAPSHOT_DIR, f"{slug}_{key}")
+
+
+def _graph(area, network_type, path):
+    if os.path.exists(path):
+        return ox.load_graphml(path)
+    G = ox.graph_from_polygon(area, network_type=network_type)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ox.save_graphml(G, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return G
+
+
+def _store(area, network_type, path, build=GraphStore.from_graph):
+    """Memory-mapped GraphStore of the snapshot, built from the (GraphML-cached) graph and saved on first use."""
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        build(_graph(area, network_type, os.path.join(os.path.dirname(path), f"{network_type}.graphml"))).save(path)
+    return GraphStore.load(path, mmap=True)
+
+
+def _parks(area, path):
+    if os.path.exists(path):
+        return gpd.read_parquet(path)
+    parks = ox.features.features_from_polygon(area, tags={'leisure': 'park'})
+    parks = parks.loc[parks.geometry.type.isin(['Polygon', 'MultiPolygon']), ['geometry']].reset_index(drop=True)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    parks.to_parquet(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return parks
+
+
+class District:
+    """Routing shard of one district (see module docstring)."""
+
+    def __init__(self, name, boundary, area, walk_store, drive_store, parks, evac_data, pop_data):
+        self.name = name
+        self.boundary = boundary
+        self.area = area
+        # 数组路网 Array stores of the networks for routing (edge order = hazard / drive weight arrays)
+        self.walk_store = walk_store
+        self.drive_store = drive_store
+
+        # 驾车行程时间权重 Drive travel-time weights with congestion multipliers, refreshed in the background
+        self.drive_weights = DriveWeights(drive_store)
+        self.drive_weights.start_auto_refresh()
+
+        # 步行灾害图层 Walking hazard layers, matched to the walk edges once per load
+        self.hazard_layers = HazardRegistry(walk_store)
+        self.hazard_layers.register('heat', self.hazard_layers.polygon_factors(parks, PARK_HEAT_FACTOR, name='parks'))
+        self.hazard_layers.register('vulnerability', self.hazard_layers.polygon_factors(
+            pop_data, pop_data['vulnerability_factor'], name='parcels'))
+        # 可选图层 Optional layers, e.g. FLOOD_LAYER=Data/flood_depth.gpkg (polygons with a 'factor' column) or a GeoTIFF
+        for layer in ('flood', 'earthquake'):
+            if default_layer_path(layer):
+                self.hazard_layers.register_file(layer, default_layer_path(layer))
+        # 建筑阴影 Building shade per hour of a summer day (cached on disk)
+        if default_layer_path('buildings'):
+            shade = ShadeCache(walk_store.edge_frame(), default_layer_path('buildings'), edge_index=self.hazard_layers.index)
+            for hour, factors in shade.heat_factors().items():
+                self.hazard_layers.register(f'shade_{hour:02d}', factors)
+        level_of_factor = {factor: level for level, factor in VULNERABILITY_FACTORS.items()}
+        self.walk_vulnerability_levels = pd.Series(self.hazard_layers.layers['vulnerability']) \
+            .map(level_of_factor).fillna('Low').to_numpy()
+
+
+        # 避难所 Shelters inside the buffered area, snapped once; trees for walk distance and default heat cost
+        inside = shapely.contains_xy(area, evac_data['longitude'].to_numpy(), evac_data['latitude'].to_numpy())
+        self.shelters = evac_data[inside].reset_index(drop=True)
+        self.shelter_nodes = self.walk_store.nearest_nodes(self.shelters['longitude'].to_numpy(),
+                                                           self.shelters['latitude'].to_numpy())
+        self.walk_closures = Closures(self.walk_store, index=self.hazard_layers.index)
+        self.drive_closures = Closures(self.drive_store, index=self.drive_weights.index)
+        self.heat_route_cost = self.hazard_layers.cost(HEAT_ROUTE_LAYERS)
+        self.walk_trees = {
+            'length': ShelterTrees(self.walk_store, self.walk_store.length, self.shelter_nodes),
+            'heat': ShelterTrees(self.walk_store, self.heat_route_cost, self.shelter_nodes),
+        }
+        self.walk_closures.attach(self.walk_store.length, self.walk_trees['length'])
+        self.walk_closures.attach(self.heat_route_cost, self.walk_trees['heat'])
+        self.closures = {'walk': self.walk_closures, 'drive': self.drive_closures}
+        self._trees_lock = threading.Lock()
+
+        # Edge geometries of the spatial indexes are measured once; the arrays are summed on demand
+        self._object_bytes = sum(int(16 * shapely.get_num_coordinates(index.geoms).sum() + 64 * len(index))
+                                 for index in (self.hazard_layers.index, self.drive_weights.index))
+
+    @classmethod
+    def load(cls, name, boundary, evac_data, pop_data, fallback_kmh=None, overlap_m=OVERLAP_M):
+        """Build a shard from its disk snapshot, downloading graphs and parks for the buffered area on first use."""
+        area = buffered(boundary, overlap_m)
+        snapshot = _snapshot(name, area)
+        walk = _store(area, 'walk', os.path.join(snapshot, "walk_store"))
+        drive = _store(area, 'drive', os.path.join(snapshot, f"drive_store_{fallback_kmh or 'osm'}"),
+                       build=lambda G: drive_store(G, fallback_kmh))
+        parks = _parks(area, os.path.join(snapshot, "parks.parquet"))
+        return cls(name, boundary, area, walk, drive, parks, evac_data, pop_data)
+
+    def heat_trees(self, shade_layer=None):
+        """
+        Shelter trees for the heat route cost, with the shade layer of one hour when given. The
+        trees of the current shade hour are built on first use and replace the previous hour's.
+        """
+        if shade_layer is None:
+            return self.walk_trees['heat']
+        key = f'heat+{shade_layer}'
+        with self._trees_lock:
+            if key not in self.walk_trees:
+                for old in [k for k in self.walk_trees if k.startswith('heat+')]:
+                    self.walk_closures.detach(self.walk_trees.pop(old))
+                cost = self.hazard_layers.cost({**HEAT_ROUTE_LAYERS, shade_layer: 1.0})
+                self.walk_trees[key] = self.walk_closures.build_trees(cost, self.shelter_nodes)
+            return self.walk_trees[key]
+
+    def nbytes(self):
+        """Approximate memory held by the shard."""
+        arrays = self.walk_store.nbytes() + self.drive_store.nbytes()
+        arrays += sum(a.nbytes for a in self.hazard_layers.layers.values())
+        arrays += sum(a.nbytes for a in self.hazard_layers._costs.values())
+        arrays += sum(t.cost.nbytes + t.next_edge.nbytes + t.weights.nbytes for t in list(self.walk_trees.values()))
+        return arrays + self._object_bytes
+
+    def close(self):
+        self.drive_weights.stop_auto_refresh()
+
+
+class DistrictRegistry:
+    """Point-in-district lookup and an LRU of loaded District shards under a memory budget."""
+
+    def __init__(self, boundaries, load, budget_mb=MEMORY_BUDGET_MB):
+        self.boundaries = dict(boundaries)  # name -> EPSG:4326 polygon
+        self.names = list(self.boundaries)
+        self.index = SpatialIndex(gpd.GeoSeries(list(self.boundaries.values()), crs="EPSG:4326"), "districts", crs=None)
+        self.load = load  # load(name, boundary) -> District
+        self.budget = budget_mb * 2 ** 20
+        self._loaded = OrderedDict()
+        self._loading = {}
+        self._closures = {}  # name -> {network: (edges, factors)} kept across evictions
+        self._lock = threading.Lock()
+
+    def locate(self, lon, lat):
+        """Name of the district containing a point (the first listed on a shared border), None outside all."""
+        _, hits = self.index.intersects(self.index.points([lon], [lat]))
+        return self.names[hits.min()] if len(hits) else None
+
+    def get(self, name):
+        """The loaded shard of a district, loading it (and evicting the least recently used) on a miss."""
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                metrics.inc("cache_requests_total", cache="district", result="hit")
+                return self._loaded[name]
+            loading = self._loading.setdefault(name, threading.Lock())
+        with loading:  # One load per district; other requests for it wait here
+            with self._lock:
+                if name in self._loaded:
+                    self._loaded.move_to_end(name)
+                    return self._loaded[name]
+            metrics.inc("cache_requests_total", cache="district", result="miss")
+            start = time.perf_counter()
+            with metrics.span("district_load"):
+                district = self.load(name, self.boundaries[name])
+            for network, (edges, factors) in self._closures.pop(name, {}).items():
+                for factor in np.unique(factors):
+                    district.closures[network].set_factor(edges[factors == factor], factor)
+            print(f"{Fore.GREEN}District '{name}' loaded in {time.perf_counter() - start:.1f} s "
+                  f"({district.nbytes() / 2 ** 20:.0f} MB){Style.RESET_ALL}")
+            with self._lock:
+                self._loaded[name] = district
+                self._evict()
+        return district
+
+    def _evict(self):
+        """Drop least recently used shards (never the newest) until the loaded ones fit the budget."""
+        while len(self._loaded) > 1 and sum(d.nbytes() for d in self._loaded.values()) > self.budget:
+            name, district = self._loaded.popitem(last=False)
+            saved = {network: closures.closed() for network, closures in district.closures.items()
+                     if len(closures.closed()[0])}
+            if saved:
+                self._closures[name] = saved
+            district.close()
+            metrics.inc("district_evictions_total", district=name)
+            print(f"{Fore.YELLOW}District '{name}' evicted{Style.RESET_ALL}")
+
+    def closed(self):
+        """{district: {network: (edges, factors)}} of closed/penalized edges, loaded or evicted."""
+        with self._lock:
+            listing = {name: dict(saved) for name, saved in self._closures.items()}
+            for name, district in self._loaded.items():
+                listing[name] = {network: closures.closed() for network, closures in district.closures.items()}
+        return listing
+
+    def loaded(self):
+        """Loaded districts, least recently used first, with their approximate size in MB."""
+        with self._lock:
+            return {name: round(float(d.nbytes()) / 2 ** 20, 1) for name, d in self._loaded.items()}
+
+    def area(self):
+        """Union of all district boundaries."""
+        return shapely.union_all(list(self.boundaries.values()))
@@ -0,0 +1,139 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import osmnx as ox
+import shapely
+from colorama import Fore, Style
+
+from geodata import load_congestion
+from graph_store import GraphStore
+from spatial_index import SpatialIndex
+
+FLOW_ANALYSIS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "flow_analysis")
+METRIC_CRS = "EPSG:2451"
+TIME_BIN = "15min"  # Same bins as flow_analysis/congestion_detection.py (UTC time of day)
+MATCH_BUFFER_M = 15  # Congestion lines are matched to edges within this distance
+MIN_OVERLAP = 0.5  # Share of an edge that must lie inside the buffered congestion line
+DEFAULT_CONGESTION_MULTIPLIER = 2.0  # Hand-drawn lines carry no measured speed
+MAX_CONGESTION_MULTIPLIER = 5.0
+REFRESH_SECONDS = 300
+
+
+def default_congestion_path():
+    """GPS-derived congestion layer if it exists, otherwise the hand-drawn congestion.csv."""
+    if os.environ.get("CONGESTION_CSV"):
+        return os.environ["CONGESTION_CSV"]
+    detected = os.path.join(FLOW_ANALYSIS_DIR, "congestion_detected.csv")
+    return detected if os.path.exists(detected) else os.path.join(FLOW_ANALYSIS_DIR, "congestion.csv")
+
+
+def drive_store(G, fallback_kmh=None):
+    """GraphStore of a drive graph with `speed_kph` and `travel_time` per edge.
+
+    Speeds come from OSM maxspeed, imputed per highway type, fallback_kmh where nothing is known.
+    """
+    return GraphStore.from_graph(ox.routing.add_edge_travel_times(ox.routing.add_edge_speeds(G, fallback=fallback_kmh)))
+
+
+def congestion_multipliers(congestion):
+    """Travel-time multiplier per congestion row: 1 / speed_ratio when measured, else the default."""
+    if "speed_ratio" in congestion:
+        ratio = pd.to_numeric(congestion["speed_ratio"], errors="coerce").to_numpy()
+        with np.errstate(divide="ignore"):
+            multiplier = np.where(ratio > 0, 1.0 / ratio, MAX_CONGESTION_MULTIPLIER)
+        multiplier = np.where(np.isnan(ratio), DEFAULT_CONGESTION_MULTIPLIER, multiplier)
+    else:
+        multiplier = np.full(len(congestion), DEFAULT_CONGESTION_MULTIPLIER)
+    return np.clip(multiplier, 1.0, MAX_CONGESTION_MULTIPLIER)
+
+
+class DriveWeights:
+    """Per-edge drive travel times (seconds) of a drive_store() with congestion multipliers per time bin.
+
+    All arrays for one congestion snapshot live in a single dict that is replaced in one
+    assignment on refresh, so a route search always reads a consistent table and never
+    waits for the recomputation.
+    """
+
+    def __init__(self, store, congestion_path=None):
+        self.base_time = np.asarray(store.travel_time, dtype=np.float64)
+        self.index = SpatialIndex(store.edge_frame(), "drive_edges", METRIC_CRS)
+        self._edge_length = shapely.length(self.index.geoms)
+        self.congestion_path = congestion_path or default_congestion_path()
+        self._mtime = None
+        self._stop = None
+        self._table = {"all_day": self.base_time, "bins": {}}
+        self.refresh()
+
+    def match(self, congestion):
+        """(congestion row, edge) pairs where the edge lies mostly inside the buffered line."""
+        lines = congestion.to_crs(METRIC_CRS).geometry.values
+        buffers = shapely.buffer(lines, MATCH_BUFFER_M)
+        rows, edges = self.index.intersects(buffers)
+        inside = shapely.length(shapely.intersection(self.index.geoms[edges], buffers[rows]))
+        keep = inside >= MIN_OVERLAP * np.maximum(self._edge_length[edges], 1e-9)
+        return rows[keep], edges[keep]
+
+    def refresh(self):
+        """Rebuild the weight table from the congestion layer and swap it in."""
+        if not os.path.exists(self.congestion_path):
+            return False
+        mtime = os.path.getmtime(self.congestion_path)
+        congestion = load_congestion(self.congestion_path)
+        rows, edges = self.match(congestion)
+        multiplier = congestion_multipliers(congestion)[rows]
+
+        if "time_bin" in congestion:
+            labels = pd.to_datetime(congestion["time_bin"], errors="coerce", utc=True) \
+                .dt.strftime("%H:%M").to_numpy()[rows]
+        else:
+            labels = np.full(len(rows), None, dtype=object)
+        all_day_rows = pd.isna(labels)
+
+        all_day = np.ones(len(self.base_time))
+        np.maximum.at(all_day, edges[all_day_rows], multiplier[all_day_rows])
+        bins = {}
+        for label in np.unique(labels[~all_day_rows]):
+            in_bin = labels == label
+            bin_multiplier = all_day.copy()
+            np.maximum.at(bin_multiplier, edges[in_bin], multiplier[in_bin])
+            bins[label] = self.base_time * bin_multiplier
+
+        self._table = {"all_day": self.base_time * all_day, "bins": bins}
+        self._mtime = mtime
+        print(f"{Fore.GREEN}Drive weights refreshed: {len(np.unique(edges))} congested edges, "
+              f"{len(bins)} time bins{Style.RESET_ALL}")
+        return True
+
+    def start_auto_refresh(self, interval=REFRESH_SECONDS):
+        """Poll the congestion file in a daemon thread and refresh when it changes."""
+        self._stop = threading.Event()
+
+        def poll():
+            while not self._stop.wait(interval):
+                try:
+                    if os.path.exists(self.congestion_path) and \
+                            os.path.getmtime(self.congestion_path) != self._mtime:
+                        self.refresh()
+                except Exception as e:
+                    print(f"{Fore.RED}Drive weight refresh failed: {e}{Style.RESET_ALL}")
+        thread = threading.Thread(target=poll, daemon=True)
+        thread.start()
+        return thread
+
+    def stop_auto_refresh(self):
+        """Stop the polling thread (e.g. when a district shard is evicted)."""
+        if self._stop is not None:
+            self._stop.set()
+
+    def weights_at(self, when=None):
+        """Travel-time array for the time bin containing `when` (default: now)."""
+        table = self._table
+        when = pd.Timestamp.now(tz="UTC") if when is None else pd.Timestamp(when)
+        if when.tzinfo is None:
+            when = when.tz_localize("UTC")
+        label = when.tz_convert("UTC").floor(TIME_BIN).strftime("%H:%M")
+        return table["bins"].get(label, table["all_day"])
+
@@ -0,0 +1,267 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+import osmnx as ox
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from colorama import Fore, Style
+
+from geodata import boundary_polygon, load_parcels
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data")
+POP_COLUMN = "Pop20_75"  # Population per parcel used to seed agents
+HEAT_WALKING_SPEEDS_KMH = {'Low': 5.0, 'Moderate': 4.0, 'High': 3.0}  # Same as adjust_walking_speed
+SPEED_SPREAD = 0.15  # Lognormal sigma of individual walking speeds
+EDGE_WIDTH_M = 3.0  # Walkable width used to turn agents per edge into a density
+JAM_DENSITY = 5.4  # persons/m², walking stops (Weidmann)
+MIN_SPEED_FACTOR = 0.05
+SHELTER_INTAKE_PER_MIN = 60  # Persons a shelter can admit per minute
+TIME_STEP_S = 5.0
+HORIZON_S = 2 * 3600
+MAX_EDGE_HOPS = 8  # Edges an agent may finish within one time step
+
+# Agent states
+MOVING, QUEUED, SHELTERED, STRANDED = 0, 1, 2, 3
+
+
+def adjust_walking_speed(scenario):
+    """Adjust walking speed based on heat scenario (km/h to m/s)."""
+    return HEAT_WALKING_SPEEDS_KMH[scenario] / 3.6
+
+
+class WalkNetwork:
+    """Walk graph as flat arrays: edge tails/heads/lengths and a (tail, head) -> edge lookup."""
+
+    def __init__(self, G):
+        self.nodes = np.array(list(G.nodes))
+        position = {n: i for i, n in enumerate(self.nodes)}
+        self.x = np.array([G.nodes[n]['x'] for n in self.nodes])
+        self.y = np.array([G.nodes[n]['y'] for n in self.nodes])
+        edges = [(position[u], position[v], d.get('length', 1.0)) for u, v, d in G.edges(data=True)]
+        tail, head, length = (np.array(a) for a in zip(*edges))
+        # Parallel edges: keep the shortest for each (tail, head)
+        order = np.lexsort((length, head, tail))
+        tail, head, length = tail[order], head[order], length[order]
+        first = np.r_[True, (tail[1:] != tail[:-1]) | (head[1:] != head[:-1])]
+        self.tail, self.head = tail[first].astype(np.int32), head[first].astype(np.int32)
+        self.length = np.maximum(length[first], 0.1).astype(np.float32)
+        self.n_nodes = len(self.nodes)
+        self._keys = self.tail.astype(np.int64) * self.n_nodes + self.head
+        # Reversed graph: distances from every node *to* the nearest shelter
+        self.reverse = csr_matrix((self.length.astype(np.float64), (self.head, self.tail)),
+                                  shape=(self.n_nodes, self.n_nodes))
+
+    def edge_ids(self, tail, head):
+        return np.searchsorted(self._keys, tail.astype(np.int64) * self.n_nodes + head)
+
+    def routes(self, shelter_nodes, open_shelters):
+        """
+        Next edge toward the nearest open shelter for every node, the shelter reached and the
+        remaining distance (inf where no open shelter is reachable).
+        """
+        sources = shelter_nodes[open_shelters]
+        shelter_of_node = np.full(self.n_nodes, -1)
+        if len(sources) == 0:
+            return np.full(self.n_nodes, -1), shelter_of_node, np.full(self.n_nodes, np.inf)
+        dist, pred, source = dijkstra(self.reverse, indices=np.unique(sources), min_only=True,
+                                      return_predecessors=True)
+        open_idx = np.flatnonzero(open_shelters)
+        node_to_shelter = dict(zip(shelter_nodes[open_idx], open_idx))
+        reached = source >= 0
+        shelter_of_node[reached] = [node_to_shelter[s] for s in source[reached]]
+        next_edge = np.full(self.n_nodes, -1)
+        step = pred >= 0
+        next_edge[step] = self.edge_ids(np.flatnonzero(step), pred[step])
+        return next_edge, shelter_of_node, dist
+
+
+def seed_agents(pop_data, n_agents, G, rng, column=POP_COLUMN):
+    """Start nodes of n_agents drawn in proportion to parcel population (nearest walk node of the parcel)."""
+    pop = pd.to_numeric(pop_data[column], errors='coerce').fillna(0).clip(lower=0).to_numpy()
+    counts = rng.multinomial(n_agents, pop / pop.sum())
+    points = pop_data.to_crs(epsg=4326).geometry.representative_point()
+    parcel_nodes = ox.distance.nearest_nodes(G, points.x.to_numpy(), points.y.to_numpy())
+    return np.repeat(np.asarray(parcel_nodes), counts)
+
+
+def simulate(network, start_nodes, shelter_nodes, capacity, walking_speed, seed=0,
+             horizon_s=HORIZON_S, dt=TIME_STEP_S):
+    """
+    Move agents (structure of arrays) along shortest paths to the nearest open shelter.
+
+    Each step: agents on the same edge slow each other down (Weidmann speed-density), agents
+    that reach a shelter queue at its door and are admitted at SHELTER_INTAKE_PER_MIN, and when
+    a shelter fills up everyone heading to it or waiting there is re-routed to the next one.
+    """
+    rng = np.random.default_rng(seed)
+    position = {n: i for i, n in enumerate(network.nodes)}
+    node = np.array([position[n] for n in start_nodes], dtype=np.int32)
+    shelter_nodes = np.array([position[n] for n in shelter_nodes], dtype=np.int32)
+    n = len(node)
+
+    speed = (walking_speed * rng.lognormal(0, SPEED_SPREAD, n)).astype(np.float32)
+    state = np.full(n, MOVING, dtype=np.int8)
+    edge = np.full(n, -1, dtype=np.int64)
+    offset = np.zeros(n, dtype=np.float32)  # metres travelled along the current edge
+    target = np.full(n, -1, dtype=np.int32)
+    arrival_s = np.full(n, np.nan, dtype=np.float32)
+    queue_since = np.full(n, np.inf, dtype=np.float32)
+
+    capacity = np.asarray(capacity, dtype=np.int64)
+    occupancy = np.zeros(len(shelter_nodes), dtype=np.int64)
+    open_shelters = capacity > 0
+    next_edge, shelter_of_node, _ = network.routes(shelter_nodes, open_shelters)
+    intake = max(1, int(round(SHELTER_INTAKE_PER_MIN * dt / 60)))
+    area = network.length * EDGE_WIDTH_M
+    timeline = []
+
+    def assign_routes(mask):
+        """Point agents in mask at the nearest open shelter from their current node."""
+        target[mask] = shelter_of_node[node[mask]]
+        at_target = mask & (target >= 0) & (node == shelter_nodes[np.maximum(target, 0)])
+        edge[mask] = next_edge[node[mask]]
+        offset[mask] = 0
+        state[mask & (target < 0)] = STRANDED
+        state[at_target] = QUEUED
+        queue_since[at_target] = np.minimum(queue_since[at_target], t)
+        state[mask & ~at_target & (target >= 0)] = MOVING
+
+    t = 0.0
+    assign_routes(np.ones(n, dtype=bool))
+    for step in range(int(horizon_s // dt)):
+        t = step * dt
+        moving = np.flatnonzero(state == MOVING)
+        if len(moving):
+            # Density on each edge slows everyone on it
+            density = np.bincount(edge[moving], minlength=len(area)) / area
+            with np.errstate(divide='ignore'):
+                factor = 1 - np.exp(-1.913 * (1 / np.maximum(density[edge[moving]], 1e-6) - 1 / JAM_DENSITY))
+            budget = speed[moving] * np.clip(factor, MIN_SPEED_FACTOR, 1).astype(np.float32) * dt
+
+            for _ in range(MAX_EDGE_HOPS):
+                e = edge[moving]
+                remaining = network.length[e] - offset[moving]
+                done = budget >= remaining
+                offset[moving[~done]] += budget[~done]
+                if not done.any():
+                    break
+                finished = moving[done]
+                budget = budget[done] - remaining[done]
+                node[finished] = network.head[edge[finished]]
+                arrived = node[finished] == shelter_nodes[target[finished]]
+                state[finished[arrived]] = QUEUED
+                queue_since[finished[arrived]] = t + dt
+                moving = finished[~arrived]
+                budget = budget[~arrived]
+                edge[moving] = next_edge[node[moving]]
+                offset[moving] = 0
+
+        # Shelter doors: admit queued agents first come, first served
+        queued = np.flatnonzero(state == QUEUED)
+        if len(queued):
+            queued = queued[np.lexsort((queue_since[queued], target[queued]))]
+            shelter = target[queued]
+            rank = np.arange(len(queued)) - np.searchsorted(shelter, shelter)
+            room = np.minimum(capacity - occupancy, intake)[shelter]
+            admitted = queued[rank < room]
+            state[admitted] = SHELTERED
+            arrival_s[admitted] = t + dt
+            occupancy += np.bincount(target[admitted], minlength=len(capacity))
+
+            full = open_shelters & (occupancy >= capacity)
+            if full.any():
+                open_shelters &= ~full
+                next_edge, shelter_of_node, _ = network.routes(shelter_nodes, open_shelters)
+                redirect = np.isin(target, np.flatnonzero(full)) & ((state == MOVING) | (state == QUEUED))
+                # Agents part-way along an edge finish it, then follow the new routes from its head
+                mid_edge = redirect & (state == MOVING) & (offset > 0)
+                target[mid_edge] = shelter_of_node[network.head[edge[mid_edge]]]
+                state[mid_edge & (target < 0)] = STRANDED
+                assign_routes(redirect & ~mid_edge)
+
+        if step % int(60 // dt) == 0:
+            timeline.append((t / 60, int((state == SHELTERED).sum()), int((state == QUEUED).sum()),
+                             int((state == MOVING).sum())))
+        if not ((state == MOVING) | (state == QUEUED)).any():
+            break
+
+    times = arrival_s[state == SHELTERED]
+    return {
+        'agents': n,
+        'sheltered': int((state == SHELTERED).sum()),
+        'queued_at_end': int((state == QUEUED).sum()),
+        'moving_at_end': int((state == MOVING).sum()),
+        'stranded': int((state == STRANDED).sum()),
+        'mean_evacuation_min': float(np.mean(times) / 60) if len(times) else np.nan,
+        'p90_evacuation_min': float(np.percentile(times, 90) / 60) if len(times) else np.nan,
+        'occupancy': occupancy,
+        'timeline': pd.DataFrame(timeline, columns=['minute', 'sheltered', 'queued', 'moving']),
+    }
+
+
+# Per-process copy of the network and inputs, set by _init_worker
+_worker = {}
+
+
+def _init_worker(G, pop_data, shelter_nodes, capacity):
+    _worker.update(G=G, network=WalkNetwork(G), pop_data=pop_data, shelter_nodes=shelter_nodes, capacity=capacity)
+
+
+def _run_replication(args):
+    seed, n_agents, walking_speed, horizon_s = args
+    rng = np.random.default_rng(seed)
+    start_nodes = seed_agents(_worker['pop_data'], n_agents, _worker['G'], rng)
+    started = time.perf_counter()
+    result = simulate(_worker['network'], start_nodes, _worker['shelter_nodes'], _worker['capacity'],
+                      walking_speed, seed, horizon_s)
+    result['seconds'] = time.perf_counter() - started
+    result['seed'] = seed
+    return result
+
+
+def run_replications(G, pop_data, evac_data, scenario='Moderate', n_agents=100_000, replications=4,
+                     workers=None, horizon_s=HORIZON_S, seed=0):
+    """Run independent replications (different agent seeds and speeds) in a process pool."""
+    shelter_nodes = np.asarray(ox.distance.nearest_nodes(G, evac_data['longitude'].to_numpy(),
+                                                         evac_data['latitude'].to_numpy()))
+    capacity = evac_data['Capacity'].to_numpy(dtype=np.int64)
+    walking_speed = adjust_walking_speed(scenario)
+    jobs = [(seed + i, n_agents, walking_speed, horizon_s) for i in range(replications)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(G, pop_data, shelter_nodes, capacity)) as pool:
+        results = list(pool.map(_run_replication, jobs))
+
+    summary = pd.DataFrame([{k: v for k, v in r.items() if k not in ('occupancy', 'timeline')} for r in results])
+    occupancy = pd.DataFrame([r['occupancy'] for r in results], columns=evac_data['Name']).mean()
+    return summary, occupancy, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agent-based evacuation on the Nihonbashi walk graph")
+    parser.add_argument("--scenario", choices=list(HEAT_WALKING_SPEEDS_KMH), default="Moderate")
+    parser.add_argument("--agents", type=int, default=100_000)
+    parser.add_argument("--replications", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--horizon-min", type=float, default=HORIZON_S / 60)
+    parser.add_argument("--graph", help="walk graph as GraphML (default: download the Nihonbashi walk graph)")
+    args = parser.parse_args()
+
+    evac_data = pd.read_csv(os.path.join(DATA_DIR, "evac_shelters.csv"))
+    pop_data = load_parcels()
+    if args.graph:
+        G_walk = ox.load_graphml(args.graph)
+    else:
+        G_walk = ox.graph_from_polygon(boundary_polygon(), network_type='walk')
+    G_walk = G_walk.subgraph(max(nx.weakly_connected_components(G_walk), key=len)).copy()
+
+    summary, occupancy, _ = run_replications(G_walk, pop_data, evac_data, args.scenario, args.agents,
+                                             args.replications, args.workers, args.horizon_min * 60)
+    print(f"{Fore.GREEN}{args.agents:,} agents, {args.scenario} heat, {args.replications} replications{Style.RESET_ALL}")
+    print(summary.to_string(index=False))
+    print("\nMean shelter occupancy:")
+    print(occupancy.round(0).astype(int).to_string())
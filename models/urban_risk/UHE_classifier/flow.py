@@ -0,0 +1,75 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "flow_analysis"))
+from flow_cube import FlowCube
+
+# 由 flow_analysis_v3.py 生成的人流立方体 Flow cube written by flow_analysis_v3.py
+FLOW_CUBE_DIR = os.environ.get("FLOW_CUBE_DIR") or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "flow_analysis", "05-22-flow-cube")
+
+_flow_cube = None
+
+
+def get_flow_cube():
+    """Open the flow cube once per process; arrays stay memory-mapped."""
+    global _flow_cube
+    if _flow_cube is None:
+        _flow_cube = FlowCube(FLOW_CUBE_DIR)
+    return _flow_cube
+
+
+def queryFlow(start, end, agg="sum", k=10, nodes=None, resolution=None):
+    cube = get_flow_cube()
+    start = pd.Timestamp(start) if start else cube.start
+    end = pd.Timestamp(end) if end else cube.end
+    if start.tzinfo is None:
+        start = start.tz_localize("UTC")
+    if end.tzinfo is None:
+        end = end.tz_localize("UTC")
+    if end <= start:
+        return "Invalid time range"
+    if resolution is not None and resolution not in cube.resolutions:
+        return "Invalid resolution"
+    resolution = resolution or cube.pick_resolution(start, end)
+    if not cube.aligned(start, end, resolution):
+        return "Time range is not aligned to the resolution"
+
+    # 时间序列 Total count per time bin
+    if agg == "series":
+        series = cube.series(start, end, nodes=nodes, resolution=resolution)
+        return {
+            "resolution": resolution,
+            "times": [t.isoformat() for t in series.index],
+            "counts": series.astype(int).tolist()
+        }
+
+    # 指定节点 Totals for a node subset
+    if nodes is not None:
+        values = cube.peaks(start, end, nodes, resolution) if agg == "max" \
+            else cube.totals(start, end, nodes, resolution)
+        cols = cube._columns(nodes)
+        return {
+            "resolution": resolution,
+            "nodes": [
+                {"node": int(cube.nodes[c]), "count": int(v)}
+                for c, v in zip(cols, values)
+            ]
+        }
+
+    # 最繁忙的节点 Top-k busiest nodes
+    top = cube.top_k(start, end, k=int(k), agg=agg, resolution=resolution)
+    return {
+        "resolution": resolution,
+        "nodes": [
+            {
+                "node": int(row["node"]),
+                "count": int(row["count"]),
+                "latitude": float(row["lat"]) if "lat" in row else None,
+                "longitude": float(row["lon"]) if "lon" in row else None
+            }
+            for _, row in top.iterrows()
+        ]
+    }
@@ -0,0 +1,131 @@
+"""Cached loading of the shared GIS inputs.
+
+Shapefiles (and the congestion CSV) are converted once into GeoParquet under a `cache/`
+folder next to the source (or GEODATA_CACHE), keyed by a hash of the source files. The
+cached file holds the geometry in EPSG:4326 and in the metric CRS plus derived columns, so
+later loads skip parsing, reprojection and row-wise processing, and read only the columns asked for.
+"""
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow.parquet as pq
+import shapely
+from shapely.geometry import LineString, Polygon
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data")
+BOUNDARY_SHP = os.path.join(DATA_DIR, "Nihonbashi_Line.shp")
+PARCELS_SHP = os.path.join(DATA_DIR, "elder_pop_parcel_2020_2050.shp")
+METRIC_CRS = "EPSG:2451"
+BOUNDARY_CRS = "EPSG:2451"  # Nihonbashi_Line.shp ships without a .prj
+POP_COLUMN = "Pop20_75"
+VULNERABILITY_LEVELS = ['Low', 'Medium', 'High']
+VULNERABILITY_BINS = [-np.inf, 5, 15, np.inf]  # get_vulnerability_level: <= 5 Low, <= 15 Medium, else High
+VULNERABILITY_FACTORS = {'Low': 1.0, 'Medium': 1.5, 'High': 2.0}
+SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+CACHE_VERSION = 1  # Bump when a converter changes, so old cache files are not reused
+
+
+def source_hash(path):
+    """SHA-1 of a source file (all shapefile parts for a .shp) and the cache version."""
+    digest = hashlib.sha1(f"v{CACHE_VERSION}".encode())
+    stem, ext = os.path.splitext(path)
+    parts = [stem + part for part in SHAPEFILE_PARTS] if ext.lower() == ".shp" else [path]
+    for part in parts:
+        if os.path.exists(part):
+            with open(part, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def _cache_file(path, kind):
+    cache_dir = os.environ.get("GEODATA_CACHE") or os.path.join(os.path.dirname(os.path.abspath(path)), "cache")
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return cache_dir, f"{stem}.{kind}.", f"{source_hash(path)}.parquet"
+
+
+def cached(path, kind, build, columns=None, crs="EPSG:4326"):
+    """
+    Load `kind` of `path` from the GeoParquet cache, building it with build() (a GeoDataFrame
+    in EPSG:4326) on a miss. Only `columns` (default all) and the geometry in `crs` are read.
+    """
+    cache_dir, prefix, suffix = _cache_file(path, kind)
+    file = os.path.join(cache_dir, prefix + suffix)
+    if not os.path.exists(file):
+        gdf = build()
+        gdf["geometry_metric"] = gdf.geometry.to_crs(METRIC_CRS)
+        os.makedirs(cache_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(cache_dir, prefix + "*.parquet")):
+            os.remove(stale)
+        gdf.to_parquet(file + ".tmp")
+        os.replace(file + ".tmp", file)
+
+    # Read with pyarrow and decode the WKB directly: the cache's CRSs are known, which skips
+    # parsing the stored PROJJSON and the geometry column that is not needed
+    geometry = "geometry_metric" if crs == METRIC_CRS else "geometry"
+    names = pq.read_schema(file).names
+    keep = [c for c in names if c not in ("geometry", "geometry_metric") and (columns is None or c in columns)]
+    df = pq.read_table(file, columns=keep + [geometry]).to_pandas()
+    gdf = gpd.GeoDataFrame(df[keep], geometry=shapely.from_wkb(df[geometry].to_numpy()),
+                           crs=METRIC_CRS if geometry == "geometry_metric" else "EPSG:4326")
+    return gdf if crs in ("EPSG:4326", METRIC_CRS) else gdf.to_crs(crs)
+
+
+def _build_boundary(path):
+    boundary = gpd.read_file(path)
+    if boundary.crs is None:  # Nihonbashi_Line.shp has no .prj; other district files carry their CRS
+        boundary = boundary.set_crs(BOUNDARY_CRS)
+    boundary = boundary.to_crs(epsg=4326)
+    line = boundary.geometry.iloc[0]
+    if isinstance(line, LineString):
+        coords = list(line.coords)
+        if coords[0] != coords[-1]:
+            coords.append(coords[0])
+        line = Polygon(coords)
+    return gpd.GeoDataFrame(boundary.drop(columns="geometry").iloc[:1], geometry=[line], crs="EPSG:4326")
+
+
+def load_boundary(path=BOUNDARY_SHP, crs="EPSG:4326"):
+    """A district boundary (Nihonbashi by default) as a one-row GeoDataFrame, a line ring closed into a polygon."""
+    return cached(path, "boundary", lambda: _build_boundary(path), crs=crs)
+
+
+def boundary_polygon(path=BOUNDARY_SHP, crs="EPSG:4326"):
+    """A district boundary polygon (Nihonbashi by default)."""
+    return load_boundary(path, crs).geometry.iloc[0]
+
+
+def vulnerability_levels(pop):
+    """Vulnerability level per parcel from its 75+ population (missing counts as High, as before)."""
+    pop = pd.to_numeric(pop, errors="coerce")
+    return pd.cut(pop, VULNERABILITY_BINS, labels=VULNERABILITY_LEVELS).astype(object).fillna('High')
+
+
+def _build_parcels(path):
+    parcels = gpd.read_file(path).to_crs(epsg=4326)
+    if POP_COLUMN in parcels:
+        parcels[POP_COLUMN] = pd.to_numeric(parcels[POP_COLUMN], errors="coerce")
+        parcels["vulnerability_level"] = vulnerability_levels(parcels[POP_COLUMN])
+        parcels["vulnerability_factor"] = parcels["vulnerability_level"].map(VULNERABILITY_FACTORS)
+    return parcels
+
+
+def load_parcels(path=PARCELS_SHP, columns=None, crs="EPSG:4326"):
+    """Elderly population parcels with numeric Pop20_75, vulnerability_level and vulnerability_factor."""
+    return cached(path, "parcels", lambda: _build_parcels(path), columns, crs)
+
+
+def _build_congestion(path):
+    df = pd.read_csv(path)
+    geometry = shapely.force_2d(shapely.from_wkt(df["geometry"]))
+    return gpd.GeoDataFrame(df.drop(columns="geometry"), geometry=geometry, crs="EPSG:4326")
+
+
+def load_congestion(path, columns=None, crs="EPSG:4326"):
+    """A congestion.csv-style layer (LINESTRING Z WKT) as 2D lines."""
+    return cached(path, "congestion", lambda: _build_congestion(path), columns, crs)
@@ -0,0 +1,251 @@
+"""Array-backed street network store.
+
+Nodes are positions 0..n-1 with their OSM ids and float64 x/y. Edges keep the
+ox.graph_to_gdfs order (the order of the hazard_layers and drive_weights arrays, so any
+per-edge cost array applies directly) as int32 tail/head arrays, an int32 CSR over
+tails, typed attribute columns and one packed float64 coordinate buffer with offsets for
+the geometries. save() writes one .npy per array; load() memory-maps them, so every
+worker process shares the same pages instead of holding its own networkx graph.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data", "graph_store")
+MIN_WEIGHT = 1e-3  # scipy's csgraph treats stored zeros as missing edges
+MAX_CACHED_WEIGHTS = 8
+NUMERIC_COLUMNS = {"length": np.float32, "speed_kph": np.float32, "travel_time": np.float32,
+                   "lanes": np.float32, "width": np.float32}
+CATEGORY_COLUMNS = ("highway", "name", "junction", "access", "service")
+BOOL_COLUMNS = ("oneway", "reversed", "bridge", "tunnel")
+
+
+def _first(value):
+    """OSM attributes merged by simplification are lists; keep the first value."""
+    return value[0] if isinstance(value, list) and value else value
+
+
+class GraphStore:
+    """Read-only street network as flat typed arrays (see module docstring)."""
+
+    def __init__(self, arrays, meta):
+        self.arrays = arrays
+        self.meta = meta
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        self.n_nodes = len(self.node_id)
+        self.n_edges = len(self.tail)
+        self._position = None
+        self._pairs = {}  # id(weights) -> (weights, (keys, edge, matrix))
+
+    @classmethod
+    def from_graph(cls, G, edges=None):
+        """Build from an osmnx graph; `edges` is its ox.graph_to_gdfs edge frame when already at hand."""
+        import osmnx as ox
+        if edges is None:
+            edges = ox.graph_to_gdfs(G, nodes=False)
+        node_id = np.fromiter(G.nodes, dtype=np.int64, count=len(G))
+        position = pd.Series(np.arange(len(node_id), dtype=np.int32), index=node_id)
+        u, v, k = (np.asarray(level) for level in zip(*edges.index))
+        tail, head = position[u].to_numpy(), position[v].to_numpy()
+        order = np.argsort(tail, kind="stable")
+
+        coords, owner = shapely.get_coordinates(edges.geometry.values, return_index=True)
+        arrays = {
+            "node_id": node_id,
+            "x": np.array([G.nodes[n]["x"] for n in node_id], dtype=np.float64),
+            "y": np.array([G.nodes[n]["y"] for n in node_id], dtype=np.float64),
+            "tail": tail, "head": head, "key": k.astype(np.int16),
+            "indptr": np.searchsorted(tail[order], np.arange(len(node_id) + 1)).astype(np.int32),
+            "csr_edge": order.astype(np.int32),
+            "coords": coords.astype(np.float64),
+            "coord_offsets": np.searchsorted(owner, np.arange(len(edges) + 1)).astype(np.int64),
+        }
+        meta = {"crs": str(G.graph.get("crs", "epsg:4326")), "categories": {}, "columns": []}
+        for column, dtype in NUMERIC_COLUMNS.items():
+            if column in edges:
+                values = pd.to_numeric(edges[column].map(_first), errors="coerce")
+                arrays[column] = values.to_numpy(dtype=dtype, na_value=np.nan)
+                meta["columns"].append(column)
+        for column in CATEGORY_COLUMNS:
+            if column in edges:
+                codes, categories = pd.factorize(edges[column].map(_first).astype("string"), use_na_sentinel=True)
+                arrays[column] = codes.astype(np.int16 if len(categories) < 2 ** 15 else np.int32)
+                meta["categories"][column] = [str(c) for c in categories]
+                meta["columns"].append(column)
+        for column in BOOL_COLUMNS:
+            if column in edges:
+                arrays[column] = edges[column].map(_first).astype(str).str.lower().isin(["true", "yes", "1"]).to_numpy()
+                meta["columns"].append(column)
+        return cls(arrays, meta)
+
+    def save(self, path):
+        """One .npy per array plus meta.json, written to a temp dir and swapped in."""
+        tmp = path.rstrip("/\\") + ".tmp"
+        os.makedirs(tmp, exist_ok=True)
+        for name, array in self.arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({**self.meta, "arrays": sorted(self.arrays)}, f)
+        if os.path.exists(path):
+            for file in os.listdir(path):
+                os.remove(os.path.join(path, file))
+            os.rmdir(path)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a saved store; with mmap the arrays are read-only views of the files (shared page cache)."""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                  for name in meta.pop("arrays")}
+        return cls(arrays, meta)
+
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def positions(self, node_ids):
+        """Node positions (0..n-1) of OSM node ids."""
+        if self._position is None:
+            self._position = pd.Series(np.arange(self.n_nodes), index=np.asarray(self.node_id))
+        return self._position[np.atleast_1d(node_ids)].to_numpy()
+
+    def nearest_nodes(self, x, y):
+        """Positions of the nodes closest to points (equirectangular for lon/lat, which is fine at district scale)."""
+        x, y = np.atleast_1d(np.asarray(x, dtype=float)), np.atleast_1d(np.asarray(y, dtype=float))
+        scale = np.cos(np.radians(np.mean(self.y))) if "4326" in self.meta["crs"] else 1.0
+        dx = (self.x[None, :] - x[:, None]) * scale
+        dy = self.y[None, :] - y[:, None]
+        return np.argmin(dx * dx + dy * dy, axis=1)
+
+    def pairs(self, weights):
+        """
+        (tail, head) node pairs with the cheapest parallel edge under `weights` (per edge, edge_idx
+        order): the pair keys (tail * n + head, sorted), the chosen edge per pair and the CSR
+        adjacency over those edges. Kept for the last few weight arrays, which are long-lived
+        (hazard_layers and drive_weights cache theirs).
+        """
+        for cached_weights, result in self._pairs.values():
+            if cached_weights is weights:
+                return result
+        weights_array = np.asarray(weights)
+        order = np.lexsort((weights_array, self.head, self.tail))
+        keys = self.tail[order].astype(np.int64) * self.n_nodes + self.head[order]
+        # Cheapest edge per pair; self-loops and pairs whose edges are all closed (inf) are dropped
+        keep = np.r_[True, keys[1:] != keys[:-1]] & (self.tail[order] != self.head[order]) & \
+            np.isfinite(weights_array[order])
+        keys, edge = keys[keep], order[keep].astype(np.int32)
+        data = np.maximum(weights_array[edge].astype(np.float64), MIN_WEIGHT)
+        matrix = csr_matrix((data, (keys // self.n_nodes, keys % self.n_nodes)), shape=(self.n_nodes, self.n_nodes))
+        result = (keys, edge, matrix)
+        if len(self._pairs) >= MAX_CACHED_WEIGHTS:
+            self._pairs.pop(next(iter(self._pairs)))
+        self._pairs[id(weights)] = (weights, result)
+        return result
+
+    def matrix(self, weights, reverse=False):
+        """scipy CSR adjacency with the cheapest parallel edge per pair (transposed with reverse)."""
+        matrix = self.pairs(weights)[2]
+        return matrix.T.tocsr() if reverse else matrix
+
+    def path_edges(self, path, weights):
+        """Edge indices along a path of node positions, taking the cheapest parallel edge."""
+        keys, edge, _ = self.pairs(weights)
+        path = np.asarray(path, dtype=np.int64)
+        return edge[np.searchsorted(keys, path[:-1] * self.n_nodes + path[1:])]
+
+    def shortest_path(self, source, target, weights):
+        """(node positions, edge indices) of the cheapest path, or None when unreachable."""
+        _, pred = dijkstra(self.matrix(weights), indices=source, return_predecessors=True)
+        if source != target and pred[target] < 0:
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(pred[path[-1]])
+        path = np.array(path[::-1])
+        return path, self.path_edges(path, weights)
+
+    def geometries(self, edge_ids):
+        """Shapely LineStrings of edges from the packed coordinate buffer."""
+        edge_ids = np.atleast_1d(edge_ids)
+        start, end = self.coord_offsets[edge_ids], self.coord_offsets[edge_ids + 1]
+        counts = end - start
+        index = np.repeat(np.arange(len(edge_ids)), counts)
+        rows = np.repeat(start - np.r_[0, np.cumsum(counts)[:-1]], counts) + np.arange(counts.sum())
+        return shapely.linestrings(np.asarray(self.coords)[rows], indices=index)
+
+    def edge_frame(self):
+        """Edge GeoDataFrame in ox.graph_to_gdfs layout ((u, v, key) index, geometry), built on demand."""
+        import geopandas as gpd
+        index = pd.MultiIndex.from_arrays([np.asarray(self.node_id)[self.tail], np.asarray(self.node_id)[self.head],
+                                           np.asarray(self.key, dtype=np.int64)], names=["u", "v", "key"])
+        return gpd.GeoDataFrame(geometry=self.geometries(np.arange(self.n_edges)), crs=self.meta["crs"], index=index)
+
+    def category(self, column, edge_ids):
+        """Decoded values of a categorical column (None where missing)."""
+        categories = np.array(self.meta["categories"][column] + [None], dtype=object)
+        return categories[np.asarray(self.arrays[column])[edge_ids]]
+
+
+def deep_size(obj, seen=None):
+    """Bytes held by a Python object graph (dicts, lists, strings, numbers, shapely coordinates)."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, shapely.Geometry):
+        return size + 16 * shapely.get_num_coordinates(obj) + 64  # GEOS coordinate sequence, estimated
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def memory_report(G, store, edges=None):
+    """Bytes of the networkx graph (and edge GeoDataFrame) against the array store."""
+    rows = [("networkx MultiDiGraph", deep_size(G))]
+    if edges is not None:
+        geometry = int(16 * shapely.get_num_coordinates(edges.geometry.values).sum() + 64 * len(edges))
+        rows.append(("edge GeoDataFrame", int(edges.drop(columns="geometry").memory_usage(deep=True).sum()) + geometry))
+    rows.append(("GraphStore arrays", store.nbytes()))
+    report = pd.DataFrame(rows, columns=["layout", "bytes"])
+    report["MB"] = (report["bytes"] / 2 ** 20).round(2)
+    report["per edge (B)"] = (report["bytes"] / store.n_edges).round(1)
+    return report
+
+
+if __name__ == "__main__":
+    import osmnx as ox
+    from geodata import boundary_polygon
+
+    parser = argparse.ArgumentParser(description="Build the array graph store and compare memory with networkx")
+    parser.add_argument("--graph", help="graph as GraphML (default: download the Nihonbashi graph)")
+    parser.add_argument("--network-type", default="walk")
+    parser.add_argument("--output", help=f"store directory (default {STORE_DIR}/<network type>)")
+    args = parser.parse_args()
+
+    G = ox.load_graphml(args.graph) if args.graph else ox.graph_from_polygon(boundary_polygon(), network_type=args.network_type)
+    edges = ox.graph_to_gdfs(G, nodes=False)
+    start = time.perf_counter()
+    store = GraphStore.from_graph(G, edges)
+    path = store.save(args.output or os.path.join(STORE_DIR, args.network_type))
+    print(f"Built and saved {store.n_nodes} nodes / {store.n_edges} edges in {time.perf_counter() - start:.2f} s: {path}")
+    start = time.perf_counter()
+    GraphStore.load(path)
+    print(f"Memory-mapped load: {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(memory_report(G, store, edges).to_string(index=False))
@@ -0,0 +1,113 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import geopandas as gpd
+import shapely
+from colorama import Fore, Style
+
+from spatial_index import SpatialIndex
+import metrics
+
+METRIC_CRS = "EPSG:2451"
+PARK_HEAT_FACTOR = 0.5  # Heat hazard on edges through parks, relative to open streets
+MAX_CACHED_COSTS = 32
+RASTER_SUFFIXES = (".tif", ".tiff", ".vrt", ".img")
+
+
+class HazardRegistry:
+    """Per-edge hazard factor arrays for one GraphStore, combined into routing costs on demand.
+
+    Each layer is a float32 array in ox.graph_to_gdfs edge order (1.0 = no extra hazard),
+    matched to the edges once when it is registered. A cost combines the selected layers as
+    length x prod(factor ** weight) x scale. Combined arrays are cached per selection, so
+    switching hazards at request time is a dictionary lookup (or one NumPy product the first time).
+    """
+
+    def __init__(self, store):
+        self.length = np.asarray(store.length, dtype=np.float32)
+        self.index = SpatialIndex(store.edge_frame(), "walk_edges", METRIC_CRS)
+        self._edge_geoms = self.index.geoms
+        self.layers = {}
+        self._costs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name, factors):
+        """Add or replace a layer; cached costs that used it are dropped."""
+        factors = np.asarray(factors, dtype=np.float32)
+        if factors.shape != self.length.shape:
+            raise ValueError(f"Layer '{name}' has {factors.shape[0]} values for {len(self.length)} edges")
+        with self._lock:
+            self.layers[name] = factors
+            for key in [k for k in self._costs if name in dict(k[0])]:
+                del self._costs[key]
+        print(f"{Fore.GREEN}Hazard layer '{name}': {int((factors != 1).sum())} edges affected{Style.RESET_ALL}")
+        return factors
+
+    def polygon_factors(self, polygons, values, default=1.0, name="polygons"):
+        """
+        Per-edge factor from polygons: the largest value among intersecting polygons, else default.
+        The edge x polygon incidence is persisted, so the join runs once per pair of layers.
+        """
+        values = np.broadcast_to(np.asarray(values, dtype=np.float32), (len(polygons),))
+        factors = np.full(len(self.length), np.nan, dtype=np.float32)
+        edge_idx, poly_idx = self.index.incidence(SpatialIndex(polygons, name, METRIC_CRS)).nonzero()
+        np.fmax.at(factors, edge_idx, values[poly_idx])
+        return np.where(np.isnan(factors), default, factors).astype(np.float32)
+
+    def raster_factors(self, path, to_factor=None, band=1, default=1.0):
+        """Per-edge factor from a raster sampled at each edge's midpoint (needs rasterio)."""
+        try:
+            import rasterio
+        except ImportError:
+            raise ImportError("rasterio is required for raster hazard layers (pip install rasterio)")
+        with rasterio.open(path) as src:
+            midpoints = gpd.GeoSeries(shapely.line_interpolate_point(self._edge_geoms, 0.5, normalized=True),
+                                      crs=METRIC_CRS).to_crs(src.crs)
+            values = np.array([v[0] for v in src.sample(zip(midpoints.x, midpoints.y), indexes=band)], dtype=np.float64)
+            if src.nodata is not None:
+                values[values == src.nodata] = np.nan
+        factors = to_factor(values) if to_factor else values
+        return np.where(np.isnan(factors), default, factors).astype(np.float32)
+
+    def register_file(self, name, path, column="factor"):
+        """Register a raster (values used as factors) or a vector layer (factor taken from `column`)."""
+        if path.lower().endswith(RASTER_SUFFIXES):
+            return self.register(name, self.raster_factors(path))
+        polygons = gpd.read_file(path)
+        return self.register(name, self.polygon_factors(polygons, polygons[column].to_numpy(dtype=float), name=name))
+
+    def parse_weights(self, text):
+        """'heat,flood:0.5' -> {'heat': 1.0, 'flood': 0.5}; raises KeyError for unknown layers."""
+        weights = {}
+        for item in filter(None, (part.strip() for part in (text or "").split(","))):
+            name, _, weight = item.partition(":")
+            if name not in self.layers:
+                raise KeyError(name)
+            weights[name] = float(weight) if weight else 1.0
+        return weights
+
+    def cost(self, weights, scale=1.0):
+        """length x prod(layer ** weight) x scale for the selected layers (cached)."""
+        key = (tuple(sorted(weights.items())), float(scale))
+        with self._lock:
+            cached = self._costs.get(key)
+            if cached is not None:
+                self._costs.move_to_end(key)
+                metrics.inc("cache_requests_total", cache="hazard_cost", result="hit")
+                return cached
+        metrics.inc("cache_requests_total", cache="hazard_cost", result="miss")
+        cost = self.length * np.float32(scale)
+        for name, weight in key[0]:
+            cost = cost * (self.layers[name] if weight == 1 else self.layers[name] ** np.float32(weight))
+        with self._lock:
+            self._costs[key] = cost
+            while len(self._costs) > MAX_CACHED_COSTS:
+                self._costs.popitem(last=False)
+        return cost
+
+
+def default_layer_path(name):
+    """Path of an optional hazard layer from <NAME>_LAYER, e.g. FLOOD_LAYER=Data/flood_depth.gpkg."""
+    return os.environ.get(f"{name.upper()}_LAYER")
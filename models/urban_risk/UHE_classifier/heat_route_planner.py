@@ -4,11 +4,12 @@ import osmnx as ox
 import networkx as nx
 import geopandas as gpd
 import requests
-from shapely.geometry import Point, LineString, Polygon
+from shapely.geometry import Point
 from colorama import init, Fore, Style
 from tqdm import tqdm
 import time
 from heat_scenario_classifier import load_and_preprocess_data, train_classifier, predict_scenario
+from geodata import load_boundary
 import matplotlib.pyplot as plt
 
 # Initialize colorama for colored output
@@ -73,24 +74,8 @@ def estimate_resources(scenario, distance):
     water_per_km = {'Low': 0.2, 'Moderate': 0.4, 'High': 0.6}
     return water_per_km[scenario] * (distance / 1000)
 
-# Load Nihonbashi boundary
-nihonbashi_boundary = gpd.read_file("UHE_classifier/Nihonbashi_Line.shp")
-nihonbashi_boundary.set_crs(epsg=2451, inplace=True)
-nihonbashi_boundary = nihonbashi_boundary.to_crs(epsg=4326)
-
-# Convert line to polygon if necessary
-line = nihonbashi_boundary.geometry.iloc[0]
-if not line.is_ring:
-    line_coords = list(line.coords)
-    if line_coords[0] != line_coords[-1]:
-        line_coords.append(line_coords[0])
-    line = LineString(line_coords)
-try:
-    polygon = Polygon(line)
-    nihonbashi_boundary.at[nihonbashi_boundary.index[0], 'geometry'] = polygon
-except Exception as e:
-    print(f"{Fore.RED}Failed to convert line to polygon: {e}{Style.RESET_ALL}")
-    exit()
+# Load Nihonbashi boundary (cached GeoParquet, line ring already closed into a polygon)
+nihonbashi_boundary = load_boundary("UHE_classifier/Nihonbashi_Line.shp")
 polygon = nihonbashi_boundary.geometry.iloc[0]
 
 # Load evacuation shelters
@@ -4,11 +4,12 @@ import osmnx as ox
 import networkx as nx
 import geopandas as gpd
 import requests
-from shapely.geometry import Point, LineString, Polygon
+from shapely.geometry import Point
 from colorama import init, Fore, Style
 from tqdm import tqdm
 import time
 from heat_scenario_classifier import load_and_preprocess_data, train_classifier, predict_scenario
+from geodata import load_boundary, load_parcels
 import matplotlib.pyplot as plt
 from collections import defaultdict
 
@@ -88,35 +89,16 @@ def estimate_resources(scenario, distance):
     water_per_km = {'Low': 0.2, 'Moderate': 0.4, 'High': 0.6}
     return water_per_km[scenario] * (distance / 1000)
 
-# Load Nihonbashi boundary
-nihonbashi_boundary = gpd.read_file("data/Nihonbashi_Line.shp")
-nihonbashi_boundary.set_crs(epsg=2451, inplace=True)
-nihonbashi_boundary = nihonbashi_boundary.to_crs(epsg=4326)
-
-# Convert line to polygon if necessary
-line = nihonbashi_boundary.geometry.iloc[0]
-if not line.is_ring:
-    line_coords = list(line.coords)
-    if line_coords[0] != line_coords[-1]:
-        line_coords.append(line_coords[0])
-    line = LineString(line_coords)
-try:
-    polygon = Polygon(line)
-    nihonbashi_boundary.at[nihonbashi_boundary.index[0], 'geometry'] = polygon
-except Exception as e:
-    print(f"{Fore.RED}Failed to convert line to polygon: {e}{Style.RESET_ALL}")
-    exit()
+# Load Nihonbashi boundary (cached GeoParquet, line ring already closed into a polygon)
+nihonbashi_boundary = load_boundary("data/Nihonbashi_Line.shp")
 polygon = nihonbashi_boundary.geometry.iloc[0]
 
 # Load evacuation shelters
 evac_data = pd.read_csv("data/evac_shelters.csv")
 
 # Load vulnerability data
-pop_data = gpd.read_file("data/elder_pop_parcel_2020_2050.shp")
-pop_data = pop_data.to_crs(epsg=4326)
-pop_data['Pop20_75'] = pd.to_numeric(pop_data['Pop20_75'], errors='coerce')
-pop_data['vulnerability_level'] = pop_data['Pop20_75'].apply(get_vulnerability_level)
-pop_data['vulnerability_factor'] = pop_data['vulnerability_level'].map(vulnerability_factors)
+# (cached GeoParquet with numeric Pop20_75, vulnerability_level and vulnerability_factor)
+pop_data = load_parcels("data/elder_pop_parcel_2020_2050.shp")
 
 # Load and preprocess data
 data = load_and_preprocess_data("data/weather_df_summer_2015_2024.csv")
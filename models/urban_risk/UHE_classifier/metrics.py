@@ -0,0 +1,159 @@
+"""In-process request metrics for the routing server, exported as Prometheus text on /metrics.
+
+    with metrics.request("get_route"):      # sampled per request (METRICS_SAMPLE_RATE)
+        with metrics.span("geocode"):
+            ...
+    metrics.inc("upstream_errors_total", service="geocode")
+
+Stage latencies go to a bounded ring of recent samples per (endpoint, stage); p50/p95/p99 are
+computed when /metrics is scraped. Counters are always on. When a request is not sampled,
+span() returns a shared no-op context, so the cost is one ContextVar lookup per stage.
+"""
+
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+PREFIX = "uhe"
+SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", "1.0"))  # share of requests with spans; 0 turns spans off
+SLOW_REQUEST_MS = float(os.environ.get("METRICS_SLOW_MS", "5000"))  # requests slower than this log their spans as JSON
+WINDOW = 2048  # Recent samples kept per (endpoint, stage) for the quantiles
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = contextvars.ContextVar("metrics_request", default=None)
+_lock = threading.Lock()
+_latency = {}  # (endpoint, stage) -> _Window
+_counters = {}  # (name, sorted label items) -> value
+
+
+class _Window:
+    """Ring buffer of the last WINDOW durations plus the running count and sum."""
+
+    def __init__(self):
+        self.samples = np.zeros(WINDOW)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, seconds):
+        self.samples[self.count % WINDOW] = seconds
+        self.count += 1
+        self.sum += seconds
+
+    def quantiles(self):
+        return np.quantile(self.samples[:min(self.count, WINDOW)], QUANTILES)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def observe(endpoint, stage, seconds):
+    """Record one stage duration."""
+    with _lock:
+        window = _latency.get((endpoint, stage))
+        if window is None:
+            window = _latency[(endpoint, stage)] = _Window()
+        window.add(seconds)
+
+
+def inc(name, amount=1, **labels):
+    """Increase a counter, e.g. inc("cache_requests_total", cache="hazard_cost", result="hit")."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+class _Request:
+    def __init__(self, endpoint, sampled):
+        self.endpoint = endpoint
+        self.sampled = sampled
+        self.spans = []
+
+    def __enter__(self):
+        self.token = _current.set(self if self.sampled else None)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        inc("requests_total", endpoint=self.endpoint, outcome="error" if exc_type else "ok")
+        if self.sampled:
+            seconds = time.perf_counter() - self.start
+            observe(self.endpoint, "total", seconds)
+            if seconds * 1000 >= SLOW_REQUEST_MS:
+                print(json.dumps({"slow_request": self.endpoint, "total_ms": round(seconds * 1000, 1),
+                                  "spans": [{"stage": s, "ms": round(t * 1000, 1)} for s, t in self.spans]}))
+        return False
+
+
+class _Span:
+    def __init__(self, request, stage):
+        self.request = request
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.request.spans.append((self.stage, seconds))
+        observe(self.request.endpoint, self.stage, seconds)
+        return False
+
+
+def request(endpoint):
+    """Context for one request; decides once whether its spans are sampled."""
+    return _Request(endpoint, SAMPLE_RATE > 0 and (SAMPLE_RATE >= 1 or random.random() < SAMPLE_RATE))
+
+
+def span(stage):
+    """Time a stage of the current request (no-op outside a sampled request)."""
+    current = _current.get()
+    return _NO_SPAN if current is None else _Span(current, stage)
+
+
+def timed(endpoint, stage):
+    """Always-on timer outside requests, e.g. startup downloads."""
+    return _Span(_Request(endpoint, True), stage)
+
+
+def _labels(items):
+    return ",".join(f'{k}="{v}"' for k, v in items)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        latency = {key: (w.quantiles(), w.sum, w.count) for key, w in _latency.items()}
+        counters = dict(_counters)
+    lines = [f"# HELP {PREFIX}_stage_seconds Stage latency over the last {WINDOW} samples",
+             f"# TYPE {PREFIX}_stage_seconds summary"]
+    for (endpoint, stage), (values, total, count) in sorted(latency.items()):
+        labels = _labels([("endpoint", endpoint), ("stage", stage)])
+        lines += [f'{PREFIX}_stage_seconds{{{labels},quantile="{q}"}} {v:.6f}' for q, v in zip(QUANTILES, values)]
+        lines += [f"{PREFIX}_stage_seconds_sum{{{labels}}} {total:.6f}",
+                  f"{PREFIX}_stage_seconds_count{{{labels}}} {count}"]
+    for name in sorted({name for name, _ in counters}):
+        lines += [f"# TYPE {PREFIX}_{name} counter"]
+        lines += [f"{PREFIX}_{name}{{{_labels(labels)}}} {value}" if labels else f"{PREFIX}_{name} {value}"
+                  for (n, labels), value in sorted(counters.items()) if n == name]
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _latency.clear()
+        _counters.clear()
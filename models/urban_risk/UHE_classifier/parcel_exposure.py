@@ -0,0 +1,213 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import networkx as nx
+import osmnx as ox
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from colorama import Fore, Style
+
+from graph_store import GraphStore
+from hazard_layers import HazardRegistry, PARK_HEAT_FACTOR, METRIC_CRS
+from geodata import (boundary_polygon, load_parcels, vulnerability_levels, POP_COLUMN,
+                     VULNERABILITY_LEVELS, VULNERABILITY_FACTORS)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data")
+TOP_K = 5  # Shelters per parcel, as in the interactive planner
+# Same tables as heat_route_planner_v2 (calculate_heat_metrics, adjust_walking_speed, estimate_resources)
+SCENARIOS = ['Low', 'Moderate', 'High']
+HAZARD = {'Low': 20, 'Moderate': 50, 'High': 80}
+WALKING_SPEED_KMH = {'Low': 5.0, 'Moderate': 4.0, 'High': 3.0}
+WATER_PER_KM = {'Low': 0.2, 'Moderate': 0.4, 'High': 0.6}
+
+# Per-edge quantities summed along each route
+ROUTE_COLUMNS = ['walk_distance_m', 'heat_exposure_m'] + \
+                [f'length_{level.lower()}_m' for level in VULNERABILITY_LEVELS] + \
+                [f'edges_{level.lower()}' for level in VULNERABILITY_LEVELS]
+
+
+def route_arrays(G, pop_data, parks=None):
+    """
+    Flat edge arrays of the walk graph for routing: tail/head node positions, length, heat route
+    cost (length x park heat factor x vulnerability factor, as in routes.py), heat exposure
+    (length x park heat factor) and the vulnerability level code (0-2) of every edge.
+    Parallel edges keep the cheapest one.
+    """
+    store = GraphStore.from_graph(G)
+    registry = HazardRegistry(store)
+    heat = registry.polygon_factors(parks, PARK_HEAT_FACTOR, name='parks') if parks is not None and len(parks) else np.ones_like(registry.length)
+    factors = pop_data['vulnerability_level'].map(VULNERABILITY_FACTORS).to_numpy(dtype=float)
+    vulnerability = registry.polygon_factors(pop_data, factors, name='parcels')
+    level = np.searchsorted(sorted(VULNERABILITY_FACTORS.values()), vulnerability).astype(np.int8)
+
+    nodes, tail, head = store.node_id, store.tail, store.head
+    length = np.maximum(registry.length, 0.1)
+    cost = length * heat * vulnerability
+
+    order = np.lexsort((cost, head, tail))
+    first = order[np.r_[True, (tail[order][1:] != tail[order][:-1]) | (head[order][1:] != head[order][:-1])]]
+    return {
+        'nodes': nodes, 'tail': tail[first].astype(np.int32), 'head': head[first].astype(np.int32),
+        'length': length[first], 'cost': cost[first], 'heat': (length * heat)[first], 'level': level[first],
+    }
+
+
+# Per-process read-only graph arrays, set once by _init_worker
+_worker = {}
+WORKER_ARRAYS = ['targets', 'per_edge', 'keys', 'data', 'indices', 'indptr']
+
+
+def save_worker_arrays(arrays, targets, path):
+    """
+    Write the arrays every worker reads (per-edge route values, sorted edge keys and the reversed
+    CSR graph) as .npy files, so the workers map one copy instead of each unpickling its own.
+    """
+    n = len(arrays['nodes'])
+    tail, head = arrays['tail'], arrays['head']
+    per_edge = np.column_stack([arrays['length'], arrays['heat']] +
+                               [np.where(arrays['level'] == i, arrays['length'], 0) for i in range(3)] +
+                               [(arrays['level'] == i).astype(float) for i in range(3)])
+    # Reversed graph: one Dijkstra per shelter gives every node's cheapest route *to* it
+    reverse = csr_matrix((arrays['cost'], (head, tail)), shape=(n, n))
+    saved = {'targets': targets, 'per_edge': per_edge, 'keys': tail.astype(np.int64) * n + head,
+             'data': reverse.data, 'indices': reverse.indices, 'indptr': reverse.indptr}
+    for name in WORKER_ARRAYS:
+        np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(saved[name]))
+    return path
+
+
+def _init_worker(path):
+    """Open the saved worker arrays with mmap_mode='r': the pages are shared between workers."""
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in WORKER_ARRAYS}
+    n = len(arrays['indptr']) - 1
+    _worker.update(
+        n=n, targets=arrays['targets'], per_edge=arrays['per_edge'], keys=arrays['keys'],
+        reverse=csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=(n, n)),
+    )
+
+
+def _shelter_routes(shelter_node):
+    """Route cost and summed ROUTE_COLUMNS from every target node to one shelter."""
+    n, targets = _worker['n'], _worker['targets']
+    cost, pred = dijkstra(_worker['reverse'], indices=shelter_node, return_predecessors=True)
+    # pred[v] is the next node from v toward the shelter; accumulate per-edge values with pointer jumping
+    step = pred >= 0
+    nodes = np.arange(n)
+    jump = np.where(step, pred, nodes)
+    totals = np.zeros((n, _worker['per_edge'].shape[1]))
+    edge = np.searchsorted(_worker['keys'], nodes[step].astype(np.int64) * n + pred[step])
+    totals[step] = _worker['per_edge'][edge]
+    while (jump != jump[jump]).any():
+        totals = totals + totals[jump]
+        jump = jump[jump]
+    return cost[targets], totals[targets]
+
+
+def parcel_routes(arrays, parcel_nodes, shelter_nodes, workers=None):
+    """
+    Route cost (n_parcel_nodes x n_shelters) and summed route values (... x len(ROUTE_COLUMNS))
+    from every parcel node to every shelter, one shelter per task in a process pool. The workers
+    share the graph arrays through memory-mapped files in a temporary directory.
+    """
+    position = pd.Series(np.arange(len(arrays['nodes'])), index=arrays['nodes'])
+    targets = position[parcel_nodes].to_numpy()
+    shelters = position[shelter_nodes].to_numpy()
+    with tempfile.TemporaryDirectory(prefix="parcel_exposure_") as path:
+        save_worker_arrays(arrays, targets, path)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path,)) as pool:
+            results = list(pool.map(_shelter_routes, shelters))
+    cost = np.column_stack([r[0] for r in results])
+    totals = np.stack([r[1] for r in results], axis=1)
+    return cost, totals
+
+
+def parcel_exposure(G, pop_data, evac_data, parks=None, k=TOP_K, workers=None):
+    """
+    Heat-optimal walking routes from every parcel centroid to its k cheapest shelters.
+
+    The route cost scales with the scenario hazard as a constant factor, so the optimal route is
+    the same under every scenario; it is computed once and time, water and heat risk are
+    derived per scenario. Returns one row per parcel and shelter rank (GeoDataFrame, parcel geometry).
+    """
+    pop_data = pop_data.to_crs(epsg=4326).reset_index(drop=True)
+    pop_data['vulnerability_level'] = vulnerability_levels(pop_data[POP_COLUMN])
+    arrays = route_arrays(G, pop_data, parks)
+
+    centroids = pop_data.geometry.to_crs(METRIC_CRS).centroid.to_crs(epsg=4326)
+    parcel_nodes = np.asarray(ox.distance.nearest_nodes(G, centroids.x.to_numpy(), centroids.y.to_numpy()))
+    shelter_nodes = np.asarray(ox.distance.nearest_nodes(G, evac_data['longitude'].to_numpy(),
+                                                         evac_data['latitude'].to_numpy()))
+    unique_nodes, parcel_idx = np.unique(parcel_nodes, return_inverse=True)
+    cost, totals = parcel_routes(arrays, unique_nodes, shelter_nodes, workers)
+
+    k = min(k, len(evac_data))
+    ranked = np.argsort(cost, axis=1, kind='stable')[:, :k]  # (unique nodes, k) shelter indices
+    rows = np.repeat(np.arange(len(pop_data)), k)
+    rank = np.tile(np.arange(1, k + 1), len(pop_data))
+    shelter = ranked[parcel_idx].ravel()
+    node_row = np.repeat(parcel_idx, k)
+    route_cost = cost[node_row, shelter]
+    route = pd.DataFrame(totals[node_row, shelter], columns=ROUTE_COLUMNS)
+
+    out = pd.DataFrame({
+        'parcel_id': rows,
+        POP_COLUMN: pd.to_numeric(pop_data[POP_COLUMN], errors='coerce').to_numpy()[rows],
+        'vulnerability_level': pop_data['vulnerability_level'].to_numpy()[rows],
+        'rank': rank,
+        'shelter_id': shelter,
+        'shelter_name': evac_data['Name'].to_numpy()[shelter],
+        'route_cost': route_cost,
+    })
+    out = pd.concat([out, route], axis=1)
+    reachable = np.isfinite(route_cost)
+    out.loc[~reachable, ROUTE_COLUMNS] = np.nan
+    level_lengths = out[[f'length_{level.lower()}_m' for level in VULNERABILITY_LEVELS]].to_numpy()
+    out['max_vulnerability_level'] = np.where(
+        reachable, np.array(VULNERABILITY_LEVELS)[np.argmax(np.where(level_lengths > 0, np.arange(3), -1), axis=1)], None)
+    for scenario in SCENARIOS:
+        out[f'time_min_{scenario}'] = out['walk_distance_m'] / (WALKING_SPEED_KMH[scenario] / 3.6) / 60
+        out[f'water_l_{scenario}'] = WATER_PER_KM[scenario] * out['walk_distance_m'] / 1000
+        out[f'heat_risk_{scenario}'] = HAZARD[scenario] * out['heat_exposure_m']
+    return gpd.GeoDataFrame(out, geometry=pop_data.geometry.to_numpy()[rows], crs="EPSG:4326")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Heat-exposed walks to shelter for every parcel")
+    parser.add_argument("--k", type=int, default=TOP_K, help="shelters per parcel")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--graph", help="walk graph as GraphML (default: download the Nihonbashi walk graph)")
+    parser.add_argument("--no-parks", action="store_true", help="skip the OSM park download (no park heat relief)")
+    parser.add_argument("--output", default="parcel_exposure.gpkg", help=".gpkg, .shp or .parquet (GeoParquet)")
+    args = parser.parse_args()
+
+    evac_data = pd.read_csv(os.path.join(DATA_DIR, "evac_shelters.csv"))
+    pop_data = load_parcels()
+    area = boundary_polygon()
+    G_walk = ox.load_graphml(args.graph) if args.graph else ox.graph_from_polygon(area, network_type='walk')
+    G_walk = G_walk.subgraph(max(nx.weakly_connected_components(G_walk), key=len)).copy()
+    parks = None
+    if not args.no_parks:
+        parks = ox.features.features_from_polygon(area, tags={'leisure': 'park'})
+        parks = parks[parks.geometry.type.isin(['Polygon', 'MultiPolygon'])]
+
+    start = time.perf_counter()
+    report = parcel_exposure(G_walk, pop_data, evac_data, parks, args.k, args.workers)
+    print(f"{Fore.GREEN}{len(pop_data)} parcels x {args.k} shelters in {time.perf_counter() - start:.1f} s{Style.RESET_ALL}")
+
+    best = report[report['rank'] == 1]
+    worst = best[best['vulnerability_level'] == 'High'].nlargest(10, 'heat_risk_High')
+    print("\nElderly-heavy parcels with the most heat-exposed walk to safety (High scenario):")
+    print(worst[['parcel_id', POP_COLUMN, 'shelter_name', 'walk_distance_m', 'time_min_High',
+                 'water_l_High', 'heat_risk_High']].round(1).to_string(index=False))
+
+    if args.output.lower().endswith(".parquet"):
+        report.to_parquet(args.output)
+    else:
+        report.to_file(args.output)
+    print(f"\nResults saved to '{args.output}'")
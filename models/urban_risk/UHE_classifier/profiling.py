@@ -0,0 +1,131 @@
+"""Opt-in per-request profiling for the Flask app.
+
+Off unless PROFILE_REQUESTS is set; install() then registers no hooks at all, so requests
+pay nothing. When on, a request is profiled if it sends `X-Profile: sample|cprofile` or
+`?profile=sample|cprofile`, or at random with PROFILE_SAMPLE_RATE (sampling profiler).
+
+- sample:   a background thread samples the request thread's stack every PROFILE_INTERVAL_MS
+            and writes folded stacks (`a;b;c count`), readable by flamegraph.pl and speedscope.
+- cprofile: deterministic cProfile of the request, written as a .prof file (snakeviz, flameprof).
+
+Each profile goes to PROFILE_DIR as <time>_<endpoint>_<params>.<ext> with a .json sidecar
+holding the endpoint, request parameters, duration and sample count.
+"""
+
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+ENABLED = bool(os.environ.get("PROFILE_REQUESTS"))
+SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data", "profiles")
+MODES = ("sample", "cprofile")
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into folded-stack counts."""
+
+    def __init__(self, thread_id, interval=INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _tag(endpoint, params):
+    text = "_".join([endpoint] + [f"{k}-{v}" for k, v in sorted(params.items()) if k != "profile"])
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", text)[:120]
+
+
+def requested_mode(request):
+    """Profiling mode asked for by the request (header or query flag), else by sampling, else None."""
+    mode = request.headers.get("X-Profile") or request.args.get("profile")
+    if mode:
+        return mode if mode in MODES else "sample"
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+def start(mode):
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    return StackSampler(threading.get_ident()).start()
+
+
+def finish(profiler, endpoint, params, seconds):
+    """Stop the profiler and write the profile and its sidecar; returns the profile path."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = f"{time.strftime('%Y%m%dT%H%M%S')}.{int(time.time() * 1000) % 1000:03d}"
+    base = os.path.join(PROFILE_DIR, f"{stamp}_{_tag(endpoint, params)}")
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        path, samples = base + ".prof", None
+        profiler.dump_stats(path)
+    else:
+        samples = sum(profiler.stop().values())
+        path = base + ".folded"
+        profiler.write(path)
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump({"endpoint": endpoint, "params": params, "duration_s": round(seconds, 4),
+                   "mode": "cprofile" if samples is None else "sample", "samples": samples,
+                   "profile": os.path.basename(path)}, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def install(app):
+    """Register the profiling hooks on a Flask app when PROFILE_REQUESTS is set."""
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def _start_profile():
+        mode = requested_mode(request)
+        if mode:
+            g.profile = (start(mode), time.perf_counter())
+
+    @app.teardown_request
+    def _finish_profile(error=None):
+        profile = g.pop("profile", None)
+        if profile:
+            profiler, started = profile
+            path = finish(profiler, request.path.strip("/") or "root", request.args.to_dict(),
+                          time.perf_counter() - started)
+            print(f"Profile written: {path}")
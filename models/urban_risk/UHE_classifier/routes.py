@@ -1,42 +1,145 @@
-import osmnx as ox
-import networkx as nx
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
 import geopandas as gpd
 from heat_route_planner_v2 import (
-    geocode_address, polygon, GOOGLE_MAPS_API_KEY, OPENWEATHERMAP_API_KEY,
+    geocode_address, GOOGLE_MAPS_API_KEY, OPENWEATHERMAP_API_KEY,
     evac_data, predict_scenario, fetch_weather_data, features,
     scaler, rf_classifier, 
     calculate_heat_metrics, adjust_walking_speed, estimate_resources,
-    G_walk, G_drive, pop_data,
+    pop_data,
     DRIVING_SPEED_KMH, level_order
 )
 from collections import defaultdict
-from shapely.geometry import Point, LineString, mapping
+import shapely
+from shapely.geometry import Point, LineString, mapping, shape
+from building_shade import LOCAL_TZ
+import metrics
+from upstream import client as upstream
+from districts import District, DistrictRegistry, load_districts, HEAT_ROUTE_LAYERS
 
+# 分区路网 One routing shard per district (graphs with overlap, hazard layers, stores, shelters and
+# their trees, closures), loaded on first use and evicted LRU under DISTRICT_MEMORY_MB
+districts = DistrictRegistry(load_districts(), lambda name, boundary: District.load(
+    name, boundary, evac_data, pop_data, fallback_kmh=DRIVING_SPEED_KMH))
+with metrics.timed("startup", "district_load"):
+    districts.get(districts.names[0])
+OUTSIDE_MESSAGE = f"Address is outside {', '.join(districts.names)}"
 
+# 天气位置 Weather only needs rough coordinates: the centroid of the districts, known before geocoding
+WEATHER_POINT = districts.area().centroid
 
-def getRoute(address, shelter_id):
-    coords = geocode_address(address, GOOGLE_MAPS_API_KEY)
+# 热场景缓存 Heat scenario at WEATHER_POINT, reused for SCENARIO_TTL_S by endpoints that do not wait on weather
+SCENARIO_TTL_S = float(os.environ.get("SCENARIO_TTL_S", "600"))
+_scenario = {"value": None, "time": 0.0, "refreshing": False}
+_scenario_lock = threading.Lock()
+
+
+def rememberScenario(scenario):
+    with _scenario_lock:
+        _scenario.update(value=scenario, time=time.monotonic())
+
+
+def _refresh_scenario():
+    try:
+        weather_data = fetch_weather_data(WEATHER_POINT.y, WEATHER_POINT.x, OPENWEATHERMAP_API_KEY)
+        if weather_data:
+            rememberScenario(predict_scenario(weather_data, scaler, rf_classifier, features))
+    finally:
+        with _scenario_lock:
+            _scenario["refreshing"] = False
+
+
+def cachedScenario():
+    """
+    Last known heat scenario (None before the first weather call succeeds). When it is older
+    than SCENARIO_TTL_S a refresh is started on the upstream pool; the caller never waits.
+    """
+    with _scenario_lock:
+        refresh = not _scenario["refreshing"] and (
+            _scenario["value"] is None or time.monotonic() - _scenario["time"] > SCENARIO_TTL_S)
+        if refresh:
+            _scenario["refreshing"] = True
+        value = _scenario["value"]
+    if refresh:
+        upstream.submit(_refresh_scenario)
+    return value
+
+
+cachedScenario()  # Warm the cache at startup
+
+
+def locateDistrict(lon, lat):
+    """Loaded shard of the district containing the point, None outside every district."""
+    with metrics.span("boundary_check"):
+        name = districts.locate(lon, lat)
+    return None if name is None else districts.get(name)
+
+
+def currentShadeLayer(district):
+    """当前小时的阴影 Shade layer of the current local hour, None without building shade or after dark."""
+    layer = f"shade_{pd.Timestamp.now(tz=LOCAL_TZ).hour:02d}"
+    return layer if layer in district.hazard_layers.layers else None
+
+
+def rankShelters(district, lon, lat, count=5, shade_layer=None):
+    """
+    最近的避难所 Nearest shelters on foot: ranked by heat-weighted walking cost (the heat route's
+    objective, with the current hour's shade when building shade is loaded), then by network
+    walking distance, both read from the district's shelter trees for the snapped origin.
+    Unreachable shelters (e.g. behind closures) are left out.
+    Returns (top shelters with 'distance' in m and 'heat_cost' columns, origin node).
+    """
+    node = district.walk_store.nearest_nodes(lon, lat)[0]
+    distance = district.walk_trees['length'].costs(node)
+    heat_cost = district.heat_trees(shade_layer or currentShadeLayer(district)).costs(node)
+    order = np.lexsort((distance, heat_cost))
+    order = order[np.isfinite(heat_cost[order]) & np.isfinite(distance[order])][:count]
+    return district.shelters.iloc[order].assign(distance=distance[order], heat_cost=heat_cost[order]), node
+
+
+def getRoute(address, shelter_id, hazards=None):
+    # 各阶段计时 Every stage is timed with metrics.span (see /metrics)
+    # 并发请求 Weather is fetched on the upstream pool while the address is geocoded
+    weather_future = upstream.submit(fetch_weather_data, WEATHER_POINT.y, WEATHER_POINT.x, OPENWEATHERMAP_API_KEY)
+    with metrics.span("geocode"):
+        coords = geocode_address(address, GOOGLE_MAPS_API_KEY)
     # coords = [35.6863395, 139.7823384]
     if not coords:
         # raise ValueError("Geocoding failed")
         return "Geocoding failed"
     start_lat, start_lon = coords
-    point = Point(start_lon, start_lat)
-    if not polygon.contains(point):
+    district = locateDistrict(start_lon, start_lat)
+    if district is None:
         # raise ValueError("Address is outside Nihonbashi")
-        return "Address is outside Nihonbashi"
-    # 获取用户选择的避难所 Selected shelter id
-    if int(shelter_id) < 0 or int(shelter_id) >= len(evac_data):
-        # raise ValueError("Invalid shelter ID")
-        return "Invalid shelter ID"
-
-    # 计算距离 Calculate distances
-    evac_data['distance'] = ox.distance.great_circle(start_lat, start_lon, evac_data['latitude'], evac_data['longitude'])
+        return OUTSIDE_MESSAGE
+    # 分区数据 Stores, layers, shelter trees and closures of the address's district
+    hazard_layers, walk_store, drive_store = district.hazard_layers, district.walk_store, district.drive_store
+    walk_trees, walk_closures, drive_closures = district.walk_trees, district.walk_closures, district.drive_closures
+    # 额外灾害图层 Extra hazard layers, e.g. hazards=flood:2,earthquake
+    try:
+        extra_layers = hazard_layers.parse_weights(hazards)
+    except KeyError as e:
+        return f"Unknown hazard layer: {e.args[0]}"
+    except ValueError:
+        return "Invalid hazard weight"
 
-    # 最近的5个避难所 Get top 5 nearest shelters
-    top5 = evac_data.sort_values('distance').head(5).reset_index(drop=True)
+    # 当前小时的阴影 Shade of the current local hour, when building shade is loaded and the sun is up
+    shade_layer = currentShadeLayer(district)
+    with metrics.span("shelter_ranking"):
+        # 最近的5个避难所 Top 5 shelters on foot, the same ranking as /query-shelters (same cost as the heat route)
+        top5, start_node_walk = rankShelters(district, start_lon, start_lat, shade_layer=shade_layer)
 
+    if top5.empty:
+        return "No reachable shelter"
+    # 获取用户选择的避难所 Selected shelter id (1-based rank in top5)
+    if not 1 <= int(shelter_id) <= len(top5):
+        # raise ValueError("Invalid shelter ID")
+        return "Invalid shelter ID"
     shelter = top5.iloc[shelter_id-1]
+    shelter_index = district.shelters.index.get_loc(shelter.name)  # row of the shelter trees
     end_lat = shelter['latitude']
     end_lon = shelter['longitude']
 
@@ -58,112 +161,93 @@ def getRoute(address, shelter_id):
     # features = ['total_precip', 'avg_temp', 'max_temp', 'min_temp',
     #             'avg_humidity', 'avg_wind_speed', 'sunshine', 'solar_rad', 'avg_cloud']
     # scenario = predict_scenario(weather_data, scaler, rf_classifier, features)
-    weather_data = fetch_weather_data(start_lat, start_lon, OPENWEATHERMAP_API_KEY)
+    with metrics.span("weather"):
+        weather_data = weather_future.result()
     if not weather_data:
-        exit()
-    scenario = predict_scenario(weather_data, scaler, rf_classifier, features)
+        return "Weather API error"
+    with metrics.span("scenario"):
+        scenario = predict_scenario(weather_data, scaler, rf_classifier, features)
+    rememberScenario(scenario)
     
     hazard, exposure, vulnerability = calculate_heat_metrics(scenario)
 
-    parks = ox.features.features_from_polygon(polygon, tags={'leisure': 'park'})
-    parks = parks[parks.geometry.type.isin(['Polygon', 'MultiPolygon'])]
-
-    edges_walk = ox.graph_to_gdfs(G_walk, nodes=False)
-    edges_in_parks = gpd.sjoin(edges_walk, parks, how='inner', predicate='intersects')
-
-    edges_walk['H_edge'] = hazard
-    edges_walk.loc[edges_walk.index.isin(edges_in_parks.index), 'H_edge'] = hazard * 0.5
-    edges_with_vuln = gpd.sjoin(edges_walk, pop_data[['geometry', 'vulnerability_level', 'vulnerability_factor']],
-                                how='left', predicate='intersects')
-    edges_with_vuln['vulnerability_level'] = edges_with_vuln['vulnerability_level'].fillna('Low')
-    edges_with_vuln_grouped = edges_with_vuln.groupby(edges_with_vuln.index).agg({
-        'vulnerability_factor': 'max',
-        'vulnerability_level': lambda x: max(x, key=lambda k: level_order[k])
-    })
-    edges_walk['vulnerability_factor'] = edges_with_vuln_grouped['vulnerability_factor'].fillna(1.0)
-    edges_walk['vulnerability_level'] = edges_with_vuln_grouped['vulnerability_level'].fillna('Low')
-
-    # 节点匹配 Nodes Match
-    start_node_walk = ox.distance.nearest_nodes(G_walk, start_lon, start_lat)
-    end_node_walk = ox.distance.nearest_nodes(G_walk, end_lon, end_lat)
-    start_node_drive = ox.distance.nearest_nodes(G_drive, start_lon, start_lat)
-    end_node_drive = ox.distance.nearest_nodes(G_drive, end_lon, end_lat)
+    heat_layers = {'heat': 1.0}
+    if shade_layer:
+        heat_layers[shade_layer] = 1.0
+
+    # 每条边热风险 H_edge x length per edge (hazard, halved in parks and shade), cached per hazard value
+    with metrics.span("edge_costs"):
+        heat_risk = hazard_layers.cost(heat_layers, hazard)
+        heat_cost = hazard_layers.cost({**HEAT_ROUTE_LAYERS, **heat_layers, **extra_layers}, hazard)
+        drive_time = drive_closures.apply(district.drive_weights.weights_at())
+
+    # 节点匹配 Nodes Match (node positions in the array stores)
+    with metrics.span("snap_nodes"):
+        end_node_walk = district.shelter_nodes[shelter_index]
+        start_node_drive, end_node_drive = drive_store.nearest_nodes([start_lon, end_lon], [start_lat, end_lat])
     
-    # 查找路线 Find paths
-    try:
-        path_walk_heat = nx.shortest_path(G_walk, start_node_walk, end_node_walk, weight='cost')
-        path_walk_distance = nx.shortest_path(G_walk, start_node_walk, end_node_walk, weight='length')
-        path_drive = nx.shortest_path(G_drive, start_node_drive, end_node_drive, weight='length')
-    except nx.NetworkXNoPath:
+    # 查找路线 Find paths: (node positions, edge indices), None when unreachable
+    # 默认代价直接读避难所树 The default heat cost (a uniform hazard scale, with the hour's shade) and distance read the shelter trees
+    with metrics.span("dijkstra_walk_heat"):
+        if not extra_layers:
+            route_walk_heat = district.heat_trees(shade_layer).route(start_node_walk, shelter_index)
+        else:
+            route_walk_heat = walk_store.shortest_path(start_node_walk, end_node_walk, walk_closures.apply(heat_cost))
+    with metrics.span("dijkstra_walk_distance"):
+        route_walk_distance = walk_trees['length'].route(start_node_walk, shelter_index)
+    with metrics.span("dijkstra_drive"):
+        route_drive = drive_store.shortest_path(start_node_drive, end_node_drive, drive_time)
+    if route_walk_heat is None or route_walk_distance is None or route_drive is None:
         # raise ValueError("No path found")
         return "No path found"
+    path_walk_heat, edges_walk_heat = route_walk_heat
+    path_drive, edges_drive = route_drive
 
-    # Calculate walking heat-optimized path stats #最优热度：步行距离，速度，时间，总热风险，水需求
-    distance_walk_heat = sum(G_walk[u][v][0]['length'] for u, v in zip(path_walk_heat[:-1], path_walk_heat[1:]))
-    walking_speed = adjust_walking_speed(scenario)
-    time_walk_heat = distance_walk_heat / walking_speed / 60  # minutes
-    total_risk_walk_heat = sum(edges_walk.loc[(u, v, 0), 'H_edge'] * G_walk[u][v][0]['length'] 
-                           for u, v in zip(path_walk_heat[:-1], path_walk_heat[1:]) 
-                           if (u, v, 0) in edges_walk.index)
-    water_needed = estimate_resources(scenario, distance_walk_heat) 
-
-    # Calculate walking shortest path heat risk for reference 步行最短总距离
-    total_risk_walk_distance = sum(edges_walk.loc[(u, v, 0), 'H_edge'] * G_walk[u][v][0]['length'] 
-                               for u, v in zip(path_walk_distance[:-1], path_walk_distance[1:]) 
-                               if (u, v, 0) in edges_walk.index)
-
-    # Calculate driving path stats 开车距离，速度，时间
-    distance_drive = sum(G_drive[u][v][0]['length'] for u, v in zip(path_drive[:-1], path_drive[1:]))
-    driving_speed_ms = DRIVING_SPEED_KMH / 3.6  # Convert km/h to m/s
-    time_drive = distance_drive / driving_speed_ms / 60  # minutes
-
-    # 步行脆弱等级
-    vuln_summary = defaultdict(lambda: {'length': 0, 'count': 0})
-    path_vuln_levels = []
-    for u, v in zip(path_walk_heat[:-1], path_walk_heat[1:]):
-        if (u, v, 0) in edges_walk.index:
-            length = G_walk[u][v][0]['length']
-            vuln_level = edges_walk.loc[(u, v, 0), 'vulnerability_level']
-            path_vuln_levels.append(vuln_level)
-            vuln_summary[vuln_level]['length'] += length
-            vuln_summary[vuln_level]['count'] += 1
-
-    # Determine maximum vulnerability level
-    max_vuln_level = max(path_vuln_levels, key=lambda x: level_order[x]) if path_vuln_levels else 'Low'
-
-    #步行路线
-    walk_path_segments = []
-
-    for u, v in zip(path_walk_heat[:-1], path_walk_heat[1:]):
-        if (u, v, 0) in edges_walk.index:
-            vuln_level = edges_walk.loc[(u, v, 0), 'vulnerability_level']
-            geom = edges_walk.loc[(u, v, 0), 'geometry']
-            
-            if geom.geom_type == 'LineString':
-                walk_path_segments.append({
-                    "type": "LineString",
-                    "geometry": mapping(geom),
-                    "vulnerability_level": vuln_level
-                })
-            elif geom.geom_type == 'MultiLineString':
-                for g in geom.geoms:
-                    walk_path_segments.append({
-                        "type": "LineString",
-                        "geometry": mapping(g),
-                        "vulnerability_level": vuln_level
-                    })
-
-    #开车路线
-    drive_coords = [(G_drive.nodes[node]['x'], G_drive.nodes[node]['y']) for node in path_drive]
-
-    drive_path_segments = []
-
-    drive_path_segment = {
-        "type": "LineString",
-        "geometry": mapping(LineString(drive_coords)),
-        "mode": "drive"
-    }
-    drive_path_segments.append(drive_path_segment)
+    with metrics.span("path_stats"):
+        # Calculate walking heat-optimized path stats #最优热度：步行距离，速度，时间，总热风险，水需求
+        distance_walk_heat = float(walk_store.length[edges_walk_heat].sum())
+        walking_speed = adjust_walking_speed(scenario)
+        time_walk_heat = distance_walk_heat / walking_speed / 60  # minutes
+        total_risk_walk_heat = float(heat_risk[edges_walk_heat].sum())
+        water_needed = estimate_resources(scenario, distance_walk_heat) 
+
+        # Calculate walking shortest path heat risk for reference 步行最短总距离
+        total_risk_walk_distance = float(heat_risk[route_walk_distance[1]].sum())
+
+        # Calculate driving path stats 开车距离，时间（含拥堵）
+        distance_drive = float(drive_store.length[edges_drive].sum())
+        time_drive = float(drive_time[edges_drive].sum()) / 60  # minutes
+
+        # 步行脆弱等级
+        path_vuln_levels = district.walk_vulnerability_levels[edges_walk_heat]
+        path_lengths = walk_store.length[edges_walk_heat]
+        vuln_summary = defaultdict(lambda: {'length': 0, 'count': 0})
+        for level in np.unique(path_vuln_levels):
+            on_level = path_vuln_levels == level
+            vuln_summary[level] = {'length': float(path_lengths[on_level].sum()), 'count': int(on_level.sum())}
+
+        # Determine maximum vulnerability level
+        max_vuln_level = max(path_vuln_levels, key=lambda x: level_order[x]) if len(path_vuln_levels) else 'Low'
+
+    with metrics.span("path_segments"):
+        #步行路线 (geometries from the packed coordinate buffer)
+        walk_path_segments = [{
+            "type": "LineString",
+            "geometry": mapping(geom),
+            "vulnerability_level": vuln_level
+        } for geom, vuln_level in zip(walk_store.geometries(edges_walk_heat), path_vuln_levels)]
+
+        #开车路线
+        drive_coords = np.column_stack([drive_store.x[path_drive], drive_store.y[path_drive]])
+
+        drive_path_segments = []
+
+        drive_path_segment = {
+            "type": "LineString",
+            "geometry": mapping(LineString(drive_coords)),
+            "mode": "drive"
+        }
+        drive_path_segments.append(drive_path_segment)
 
 
 
@@ -201,4 +285,59 @@ def getRoute(address, shelter_id):
         "drive_distance":round(distance_drive, 2),
         "drive_time":round(time_drive, 2)
 
-    }
\ No newline at end of file
+    }
+
+
+def setClosures(network, edge_ids=None, geometry=None, factor=None, district=None):
+    """
+    封路 Close (factor omitted), penalize (factor > 1) or reopen (factor 1) edges of the 'walk' or
+    'drive' network of a district (default: the first), by edge index and/or by GeoJSON geometry
+    in WGS84 (e.g. congestion lines). The shelter trees are repaired before this returns.
+    """
+    district = district or districts.names[0]
+    if district not in districts.boundaries:
+        return f"Unknown district: {district}"
+    closures = districts.get(district).closures.get(network)
+    if closures is None:
+        return f"Unknown network: {network}"
+    try:
+        factor = np.inf if factor is None else float(factor)
+        edges = np.asarray(edge_ids or [], dtype=np.int64)
+    except (TypeError, ValueError):
+        return "Invalid closure factor or edge ids"
+    if not factor >= 1:
+        return "Closure factor must be at least 1"
+    if len(edges) and (edges.min() < 0 or edges.max() >= closures.store.n_edges):
+        return "Invalid edge id"
+    if geometry:
+        try:
+            if geometry.get('type') == 'FeatureCollection':
+                shapes = gpd.GeoDataFrame.from_features(geometry['features'], crs="EPSG:4326")
+            else:
+                shapes = gpd.GeoSeries([shape(geometry)], crs="EPSG:4326")
+        except (AttributeError, KeyError, TypeError, ValueError, shapely.errors.GeometryTypeError):
+            return "Invalid closure geometry"
+        edges = np.union1d(edges, closures.match(shapes))
+    if not len(edges):
+        return "No edges matched"
+    result = closures.set_factor(edges, factor)
+    return {
+        "district": district,
+        "network": network,
+        "factor": None if np.isinf(factor) else factor,  # None = closed
+        "edge_ids": edges.tolist(),
+        "edges_changed": result["edges"],
+        "nodes_repaired": result["nodes_repaired"],
+        "repair_ms": round(result["seconds"] * 1000, 2),
+    }
+
+
+def listClosures():
+    """当前封路 Closed and penalized edges per district and network (factor None = closed)."""
+    return {
+        district: {
+            network: [{"edge_id": int(e), "factor": None if np.isinf(f) else float(f)} for e, f in zip(edges, factors)]
+            for network, (edges, factors) in networks.items()
+        }
+        for district, networks in districts.closed().items()
+    }
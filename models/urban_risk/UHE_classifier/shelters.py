@@ -1,8 +1,25 @@
+import os
 import pandas as pd
-import osmnx as ox
-from shapely.geometry import Point
-from heat_route_planner_v2 import geocode_address, GOOGLE_MAPS_API_KEY, evac_data, polygon
-import geopandas as gpd
+from heat_route_planner_v2 import geocode_address, GOOGLE_MAPS_API_KEY, adjust_walking_speed
+import metrics
+from routes import locateDistrict, rankShelters, cachedScenario, OUTSIDE_MESSAGE
+
+# 避难所占用 Current occupancy per shelter (CSV with Name, occupancy), re-read when the file changes
+OCCUPANCY_CSV = os.environ.get("SHELTER_OCCUPANCY") or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data", "shelter_occupancy.csv")
+_occupancy = {"mtime": None, "counts": {}}
+
+
+def shelterOccupancy():
+    """{shelter name: people checked in}, empty without the occupancy file."""
+    if not os.path.exists(OCCUPANCY_CSV):
+        return {}
+    mtime = os.path.getmtime(OCCUPANCY_CSV)
+    if mtime != _occupancy["mtime"]:
+        counts = pd.read_csv(OCCUPANCY_CSV)
+        _occupancy["counts"] = dict(zip(counts['Name'], pd.to_numeric(counts['occupancy'], errors='coerce').fillna(0)))
+        _occupancy["mtime"] = mtime
+    return _occupancy["counts"]
 
 # evac_data = pd.read_csv("evac_shelters.csv")
 
@@ -12,22 +29,29 @@ import geopandas as gpd
 # polygon = nihonbashi_boundary.geometry.iloc[0]
 
 def queryShelters(address):
-    coords = geocode_address(address, GOOGLE_MAPS_API_KEY)
+    with metrics.span("geocode"):
+        coords = geocode_address(address, GOOGLE_MAPS_API_KEY)
     # coords = [35.6863395, 139.7823384]
     if not coords:
         # raise ValueError("Geocoding failed")
         return "Geocoding failed"
     lat, lon = coords
-    point = Point(lon, lat)
-    if not polygon.contains(point):
+    # 所在分区 District of the address (its shard holds the shelters near it)
+    district = locateDistrict(lon, lat)
+    if district is None:
         # raise ValueError("Address is outside Nihonbashi") # 在边界内 Inside the boundary
-        return "Address is outside Nihonbashi"
+        return OUTSIDE_MESSAGE
 
-    # 计算距离 Calculate distances
-    evac_data['distance'] = ox.distance.great_circle(lat, lon, evac_data['latitude'], evac_data['longitude'])
+    with metrics.span("shelter_ranking"):
+        # 最近的5个避难所 Top 5 shelters by walking network cost from the snapped address (as in getRoute)
+        top5, _ = rankShelters(district, lon, lat)
+        top5 = top5.reset_index(drop=True)
+    if top5.empty:
+        return "No reachable shelter"
 
-    # 最近的5个避难所 Get top 5 nearest shelters
-    top5 = evac_data.sort_values('distance').head(5).reset_index(drop=True)
+    # 步行速度 Walking speed of the cached heat scenario (normal speed until the first weather call returns)
+    walking_speed = adjust_walking_speed(cachedScenario() or 'Low')
+    occupancy = shelterOccupancy()
 
     # 列表 List of shelters
     shelter_list = []
@@ -36,7 +60,10 @@ def queryShelters(address):
             "id": int(i+1),
             "name": row['Name'],
             "capacity": int(row['Capacity']),
-            "distance": float(row['distance']),
+            "distance": float(row['distance']),  # walking network distance (m)
+            "walk_time_min": round(float(row['distance']) / walking_speed / 60, 2),
+            "heat_cost": round(float(row['heat_cost']), 2),
+            "remaining_capacity": max(int(row['Capacity'] - occupancy.get(row['Name'], 0)), 0),
             "latitude": float(row['latitude']),
             "longitude": float(row['longitude'])
         })
@@ -0,0 +1,181 @@
+"""Shared spatial indexes for the walk/drive edges, parcels, parks, boundary and buildings.
+
+Each layer gets one STRtree, built when the SpatialIndex is created. Bulk queries take NumPy
+coordinate arrays (reprojected to the layer's CRS in one call) or geometry arrays and return
+index pairs. Edge<->polygon incidence is kept as a sparse matrix, in memory and on disk,
+keyed by the WKB hash of both layers, so a restart does not redo the join. Every query is
+timed per (layer, query type); query_stats() returns the totals.
+"""
+
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pyproj import Transformer
+from scipy import sparse
+
+import metrics
+
+METRIC_CRS = "EPSG:2451"
+CACHE_DIR = os.environ.get("SPATIAL_INDEX_CACHE") or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data", "cache", "incidence")
+
+_stats = defaultdict(lambda: [0, 0, 0.0, 0.0])  # (layer, query) -> calls, items, seconds, max seconds
+_stats_lock = threading.Lock()
+_layers = {}
+
+
+def _record(layer, query, items, seconds):
+    with _stats_lock:
+        entry = _stats[(layer, query)]
+        entry[0] += 1
+        entry[1] += items
+        entry[2] += seconds
+        entry[3] = max(entry[3], seconds)
+
+
+def timed(query):
+    """Record calls, items queried and time of a SpatialIndex method under (layer name, query)."""
+    def wrap(method):
+        @functools.wraps(method)
+        def run(self, *args, **kwargs):
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            items = len(result[0]) if isinstance(result, tuple) else getattr(result, "nnz", np.size(result))
+            _record(self.name, query, int(items), time.perf_counter() - start)
+            return result
+        return run
+    return wrap
+
+
+def query_stats():
+    """Calls, result pairs and time per (layer, query type) since start (or reset_stats())."""
+    with _stats_lock:
+        rows = [(layer, query, calls, items, seconds * 1000, seconds * 1000 / calls, peak * 1000)
+                for (layer, query), (calls, items, seconds, peak) in sorted(_stats.items())]
+    return pd.DataFrame(rows, columns=["layer", "query", "calls", "results", "total_ms", "mean_ms", "max_ms"])
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+@functools.lru_cache(maxsize=16)
+def _transformer(source, target):
+    return Transformer.from_crs(source, target, always_xy=True)
+
+
+class SpatialIndex:
+    """STRtree over one layer, in `crs` (the metric CRS by default, None keeps the layer's own CRS)."""
+
+    def __init__(self, geoms, name="layer", crs=METRIC_CRS):
+        if isinstance(geoms, (gpd.GeoDataFrame, gpd.GeoSeries)):
+            geoms = geoms.geometry if isinstance(geoms, gpd.GeoDataFrame) else geoms
+            if crs is not None and geoms.crs is not None:
+                geoms = geoms.to_crs(crs)
+            crs = geoms.crs
+        self.name = name
+        self.crs = crs
+        self.geoms = np.asarray(geoms)
+        start = time.perf_counter()
+        self.tree = shapely.STRtree(self.geoms)
+        _record(name, "build", len(self.geoms), time.perf_counter() - start)
+        self._key = None
+        self._incidence = {}
+
+    def __len__(self):
+        return len(self.geoms)
+
+    @property
+    def key(self):
+        """Hash of the layer's geometries (WKB), used to name persisted incidence matrices."""
+        if self._key is None:
+            digest = hashlib.sha1(str(self.crs).encode())
+            for wkb in shapely.to_wkb(self.geoms):
+                digest.update(wkb)
+            self._key = digest.hexdigest()[:16]
+        return self._key
+
+    def points(self, x, y, crs=None):
+        """Point geometries in the layer's CRS from coordinate arrays given in `crs`."""
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        if crs is not None and self.crs is not None and crs != self.crs:
+            x, y = _transformer(str(crs), str(self.crs)).transform(x, y)
+        return shapely.points(x, y)
+
+    @timed("intersects")
+    def intersects(self, geoms):
+        """(query index, layer index) pairs of intersecting geometries (same CRS as the layer)."""
+        return self.tree.query(np.asarray(geoms), predicate="intersects")
+
+    @timed("query_xy")
+    def query_xy(self, x, y, crs=None, predicate="intersects", distance=None):
+        """(point index, layer index) pairs for points given as coordinate arrays (distance for "dwithin")."""
+        return self.tree.query(self.points(x, y, crs), predicate=predicate, distance=distance)
+
+    def within_xy(self, x, y, crs=None):
+        """(point index, layer index) pairs of points strictly inside layer polygons."""
+        return self.query_xy(x, y, crs, predicate="within")
+
+    def inside_xy(self, x, y, crs=None):
+        """Boolean mask of points inside any polygon of the layer."""
+        point_idx, _ = self.within_xy(x, y, crs)
+        mask = np.zeros(len(np.atleast_1d(x)), dtype=bool)
+        mask[point_idx] = True
+        return mask
+
+    @timed("nearest_xy")
+    def nearest_xy(self, x, y, crs=None, max_distance=None):
+        """(point index, nearest layer index, distance) for points within max_distance of the layer."""
+        (point_idx, layer_idx), distance = self.tree.query_nearest(
+            self.points(x, y, crs), max_distance=max_distance, return_distance=True, all_matches=False)
+        return point_idx, layer_idx, distance
+
+    @timed("incidence")
+    def incidence(self, other, persist=True):
+        """
+        Sparse boolean matrix (len(self) x len(other)) of intersecting pairs between two layers.
+        Kept per layer pair in memory and, with persist, as .npz under CACHE_DIR.
+        """
+        key = other.key
+        if key in self._incidence:
+            metrics.inc("cache_requests_total", cache="incidence", result="hit")
+            return self._incidence[key]
+        file = os.path.join(CACHE_DIR, f"{self.key}_{key}.npz")
+        if persist and os.path.exists(file):
+            metrics.inc("cache_requests_total", cache="incidence", result="disk")
+            matrix = sparse.load_npz(file).tocsr()
+        else:
+            metrics.inc("cache_requests_total", cache="incidence", result="miss")
+            other_idx, self_idx = self.tree.query(other.geoms, predicate="intersects")
+            matrix = sparse.csr_matrix((np.ones(len(self_idx), dtype=bool), (self_idx, other_idx)),
+                                       shape=(len(self), len(other)))
+            if persist:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                sparse.save_npz(file + ".tmp.npz", matrix)
+                os.replace(file + ".tmp.npz", file)
+        self._incidence[key] = matrix
+        return matrix
+
+
+def register(name, geoms, crs=METRIC_CRS):
+    """Build (or replace) the shared index of a named layer."""
+    _layers[name] = SpatialIndex(geoms, name, crs)
+    return _layers[name]
+
+
+def get(name, build=None):
+    """Shared index of a named layer, built with build() (geometries) on first use."""
+    if name not in _layers:
+        if build is None:
+            raise KeyError(name)
+        register(name, build())
+    return _layers[name]
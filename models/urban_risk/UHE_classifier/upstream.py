@@ -0,0 +1,137 @@
+"""Pooled client for the upstream geocoding and weather APIs.
+
+One requests.Session with a keep-alive connection pool is shared by all request threads.
+Every call has explicit connect/read timeouts and is retried on connection errors, timeouts
+and 429/5xx with exponential backoff and full jitter. Independent calls are fanned out
+on a small executor: submit() returns a Future, so getRoute can fetch the weather for the
+district while the address is geocoded and only wait for whatever is left.
+"""
+
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from colorama import Fore, Style
+
+import metrics
+
+GEOCODE_URL = os.environ.get("GEOCODE_URL", "https://maps.googleapis.com/maps/api/geocode/json")
+WEATHER_URL = os.environ.get("WEATHER_URL", "https://api.openweathermap.org/data/2.5/weather")
+CONNECT_TIMEOUT_S = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT_S = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "10"))
+RETRIES = int(os.environ.get("UPSTREAM_RETRIES", "2"))  # Extra attempts after the first
+BACKOFF_S = 0.2  # Base of the exponential backoff; the sleep is uniform in [0, min(cap, base * 2^attempt)]
+BACKOFF_CAP_S = 2.0
+POOL_SIZE = 32  # Keep-alive connections per host, and fan-out threads
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamClient:
+    """Shared session, retries with jitter and fan-out for the upstream API calls."""
+
+    def __init__(self, pool_size=POOL_SIZE, timeout=(CONNECT_TIMEOUT_S, READ_TIMEOUT_S), retries=RETRIES,
+                 geocode_url=GEOCODE_URL, weather_url=WEATHER_URL):
+        self.timeout = timeout
+        self.retries = retries
+        self.geocode_url = geocode_url
+        self.weather_url = weather_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="upstream")
+
+    def get_json(self, service, url, params):
+        """GET with timeouts and jittered retries; parsed JSON, or None after the last failure."""
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                if response.status_code == 200:
+                    return response.json()
+                reason = f"http_{response.status_code}"
+                retry = response.status_code in RETRY_STATUS
+            except requests.Timeout:
+                reason, retry = "timeout", True
+            except requests.ConnectionError:
+                reason, retry = "connection", True
+            except ValueError:
+                reason, retry = "invalid_json", False
+            if not retry or attempt == self.retries:
+                break
+            metrics.inc("upstream_retries_total", service=service)
+            time.sleep(random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_S * 2 ** attempt)))
+        metrics.inc("upstream_errors_total", service=service, reason=reason)
+        print(f"{Fore.RED}{service} API request failed: {reason}{Style.RESET_ALL}")
+        return None
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn on the fan-out pool; returns a Future."""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def geocode(self, address, api_key):
+        """(lat, lng) of an address from the Google Geocoding API, None on failure."""
+        data = self.get_json("geocode", self.geocode_url, {"address": address, "region": "jp", "key": api_key})
+        if data is None:
+            return None
+        if data.get('status') != 'OK':
+            metrics.inc("upstream_errors_total", service="geocode", reason=str(data.get('status')))
+            print(f"{Fore.RED}Geocoding failed: {data.get('status')}{Style.RESET_ALL}")
+            return None
+        location = data['results'][0]['geometry']['location']
+        return location['lat'], location['lng']
+
+    def weather(self, lat, lon, api_key):
+        """Current weather from OpenWeatherMap as classifier features, None on failure."""
+        data = self.get_json("weather", self.weather_url, {"lat": lat, "lon": lon, "appid": api_key, "units": "metric"})
+        if data is None:
+            return None
+        return {
+            'total_precip': 0.0,
+            'avg_temp': data['main']['temp'],
+            'max_temp': data['main']['temp_max'],
+            'min_temp': data['main']['temp_min'],
+            'avg_humidity': data['main']['humidity'],
+            'avg_wind_speed': data['wind']['speed'],
+            'sunshine': 0.0,
+            'solar_rad': 0.0,
+            'avg_cloud': data['clouds']['all'] / 10.0
+        }
+
+
+client = UpstreamClient()
+
+
+if __name__ == "__main__":
+    import argparse
+    from benchmark import Stub, geocode_response, weather_response
+
+    parser = argparse.ArgumentParser(description="Check the upstream client against local stub servers")
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+
+    geocoder = Stub("geocode", geocode_response, args.latency_ms, 10, args.error_rate).start()
+    weather = Stub("weather", weather_response, args.latency_ms, 10, args.error_rate, seed=1).start()
+    stub_client = UpstreamClient(geocode_url=geocoder.url, weather_url=weather.url)
+
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        stub_client.geocode("Nihonbashi Station", "key"), stub_client.weather(35.686, 139.781, "key")
+    sequential = (time.perf_counter() - start) / args.calls
+
+    start = time.perf_counter()
+    failed = 0
+    for _ in range(args.calls):
+        future = stub_client.submit(stub_client.weather, 35.686, 139.781, "key")
+        failed += stub_client.geocode("Nihonbashi Station", "key") is None
+        failed += future.result() is None
+    fan_out = (time.perf_counter() - start) / args.calls
+
+    print(f"geocode + weather: sequential {sequential * 1000:.0f} ms, fan-out {fan_out * 1000:.0f} ms per request")
+    print(f"stub error rate {args.error_rate:.0%}: {geocoder.errors + weather.errors} failed upstream calls, "
+          f"{failed} of {2 * args.calls} calls failed after retries")
+    print(metrics.render())
@@ -1,60 +1,62 @@
 import pandas as pd
-import geopandas as gpd
-from shapely import wkt
-from shapely.geometry import LineString
 import folium
+import os
+import sys
+from map_layers import render_map
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "UHE_classifier"))
+from geodata import load_congestion
 
-df = pd.read_csv("congestion.csv")
-evac_data = pd.read_csv("evac_shelters.csv")
-
-def parse_linestring_z(wkt_str):
-    return LineString([(x, y) for x, y, *_ in wkt.loads(wkt_str.replace(" Z", "")).coords])
-
-df["geometry"] = df["geometry"].apply(parse_linestring_z)
-
-gdf = gpd.GeoDataFrame(df, geometry="geometry", crs="EPSG:4326")
-
-center = gdf.union_all().centroid
-congested = folium.Map(location=[center.y, center.x], zoom_start=15, tiles="CartoDBPositron")
-
-for _, row in gdf.iterrows():
-    coords = [(pt[1], pt[0]) for pt in row.geometry.coords]
-    folium.PolyLine(
-        coords,
-        color='red',
-        weight=7,
-        opacity=0.8,
-        tooltip=row.get("Name", "Line")
-    ).add_to(congested)
-
-evac_layer = folium.FeatureGroup(name="Evacuation Centers")
-min_cap = evac_data['Capacity'].min()
-max_cap = evac_data['Capacity'].max()
-def scale_radius(capacity, min_cap, max_cap, min_radius=12, max_radius=24):
-    if max_cap == min_cap:
-        return min_radius
-    return min_radius + (capacity - min_cap) / (max_cap - min_cap) * (max_radius - min_radius)
-for _, row in evac_data.iterrows():
-    radius = scale_radius(row['Capacity'], min_cap, max_cap)
-    fill_color = 'black' if row['Type'] == 'OG' else 'limegreen'
-    popup_content = f"""
-    <b>{row['Name']}</b><br>
-    Capacity: {row['Capacity']:,}"""
-    folium.CircleMarker(
-        location=(row['latitude'], row['longitude']),
-        radius=radius,
-        color='black',
-        fill=True,
-        fill_color=fill_color,
-        weight=2,
-        fill_opacity=0.8,
-        tooltip=f"{row['Name']} (Capacity: {row['Capacity']})",
-        popup=folium.Popup(popup_content, max_width=300)
-    ).add_to(evac_layer)
-evac_layer.add_to(congested)
-
-congested.save("congestion_map.html")
-
+# Prefer the GPS-derived layer from congestion_detection.py over the hand-drawn lines
+CONGESTION_CSV = "congestion_detected.csv" if os.path.exists("congestion_detected.csv") else "congestion.csv"
 
+evac_data = pd.read_csv("evac_shelters.csv")
 
+# 2D lines from the shared GeoParquet cache: the WKT is parsed once per version of the CSV
+gdf = load_congestion(CONGESTION_CSV)
+
+# Edge-level layers are rendered as one zoom-aware GeoJSON per layer instead of one object per row
+PER_FEATURE_LIMIT = 500
+if len(gdf) > PER_FEATURE_LIMIT:
+    render_map(gdf, evac_data, "congestion_map.html")
+else:
+    center = gdf.union_all().centroid
+    congested = folium.Map(location=[center.y, center.x], zoom_start=15, tiles="CartoDBPositron")
+
+    for _, row in gdf.iterrows():
+        coords = [(pt[1], pt[0]) for pt in row.geometry.coords]
+        folium.PolyLine(
+            coords,
+            color='red',
+            weight=7,
+            opacity=0.8,
+            tooltip=row.get("Name", "Line")
+        ).add_to(congested)
+
+    evac_layer = folium.FeatureGroup(name="Evacuation Centers")
+    min_cap = evac_data['Capacity'].min()
+    max_cap = evac_data['Capacity'].max()
+    def scale_radius(capacity, min_cap, max_cap, min_radius=12, max_radius=24):
+        if max_cap == min_cap:
+            return min_radius
+        return min_radius + (capacity - min_cap) / (max_cap - min_cap) * (max_radius - min_radius)
+    for _, row in evac_data.iterrows():
+        radius = scale_radius(row['Capacity'], min_cap, max_cap)
+        fill_color = 'black' if row['Type'] == 'OG' else 'limegreen'
+        popup_content = f"""
+        <b>{row['Name']}</b><br>
+        Capacity: {row['Capacity']:,}"""
+        folium.CircleMarker(
+            location=(row['latitude'], row['longitude']),
+            radius=radius,
+            color='black',
+            fill=True,
+            fill_color=fill_color,
+            weight=2,
+            fill_opacity=0.8,
+            tooltip=f"{row['Name']} (Capacity: {row['Capacity']})",
+            popup=folium.Popup(popup_content, max_width=300)
+        ).add_to(evac_layer)
+    evac_layer.add_to(congested)
+
+    congested.save("congestion_map.html")
@@ -0,0 +1,217 @@
+"""Detect congested drive edges from in-vehicle GPS speeds.
+
+Builds the congestion layer that `congestion.py` renders from data instead of hand-drawn
+lines. Points of the `transportmode == "in_vehicle"` subset (the same subset used by
+`flow_analysis_v3.py`) are ordered per trip, differenced in one vectorized pass to get
+segment speeds, snapped through an STRtree to the `G_drive` edge whose direction best
+matches the segment heading and aggregated per (edge, time bin). An edge is congested in a bin when its median speed drops below
+CONGESTION_RATIO x its free-flow speed.
+
+Output keeps the `Name,Description,geometry` (LINESTRING Z WKT) schema of
+`congestion.csv`, with the per-bin measurements appended as extra columns.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import osmnx as ox
+import shapely
+from pyproj import Transformer
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "UHE_classifier"))
+from geodata import boundary_polygon
+from spatial_index import SpatialIndex, query_stats
+
+METRIC_CRS = "EPSG:2451"  # JGD2000 / Japan Plane Rectangular CS IX, metres
+TIME_BIN = "15min"
+CONGESTION_RATIO = 0.5  # Median speed below half of free-flow counts as congested
+FREE_FLOW_QUANTILE = 0.85  # Free-flow speed = 85th percentile of observed edge speeds
+MIN_OBSERVATIONS = 3  # Speed samples needed per edge and bin
+MIN_FREE_FLOW_OBSERVATIONS = 20  # Below this, fall back to the OSM speed of the edge
+MIN_FREE_FLOW_SHARE = 0.5  # Observed free-flow never drops below this share of the OSM speed
+MAX_SPEED_KMH = 120  # Drop GPS jumps faster than this
+MAX_SNAP_M = 25  # Segments further than this from any drive edge are ignored
+BEARING_STEP_M = 1.0  # Edge direction is taken over this distance either side of the snapped point
+MAX_TURN_DEG = 45  # Candidate edges whose direction differs more from the segment bearing are skipped
+GPS_COLUMNS = ["tripid", "recordedat", "lat", "lon", "transportmode"]
+
+
+def load_vehicle_points(csv_path, polygon, chunk_size=500_000):
+    """Read in-vehicle GPS points inside the polygon, chunk by chunk."""
+    shapely.prepare(polygon)
+    chunks = []
+    for chunk in tqdm(pd.read_csv(csv_path, usecols=GPS_COLUMNS, chunksize=chunk_size),
+                      desc="Reading in-vehicle GPS"):
+        chunk = chunk[chunk["transportmode"] == "in_vehicle"]
+        chunk = chunk.assign(
+            lat=pd.to_numeric(chunk["lat"], errors="coerce"),
+            lon=pd.to_numeric(chunk["lon"], errors="coerce"),
+        ).dropna(subset=["tripid", "recordedat", "lat", "lon"])
+        inside = shapely.contains_xy(polygon, chunk["lon"].to_numpy(), chunk["lat"].to_numpy())
+        chunks.append(chunk.loc[inside, ["tripid", "recordedat", "lat", "lon"]])
+    points = pd.concat(chunks, ignore_index=True)
+    points["recordedat"] = pd.to_datetime(points["recordedat"], format="ISO8601", utc=True)
+    return points
+
+
+def bearing(dx, dy):
+    """Compass bearing in degrees (0 = north, clockwise) of a displacement; NaN when it is zero."""
+    with np.errstate(invalid="ignore"):
+        return np.where((dx != 0) | (dy != 0), np.degrees(np.arctan2(dx, dy)) % 360, np.nan)
+
+
+def trip_segments(points):
+    """Speed of every consecutive point pair within a trip, computed without a per-trip loop."""
+    points = points.sort_values(["tripid", "recordedat"], kind="mergesort").reset_index(drop=True)
+    transformer = Transformer.from_crs("EPSG:4326", METRIC_CRS, always_xy=True)
+    x, y = transformer.transform(points["lon"].to_numpy(), points["lat"].to_numpy())
+    t = points["recordedat"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    trip = points["tripid"].to_numpy()
+
+    same_trip = trip[1:] == trip[:-1]
+    dt = (t[1:] - t[:-1]) / 1e9
+    dist = np.hypot(x[1:] - x[:-1], y[1:] - y[:-1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = dist / dt * 3.6
+    keep = same_trip & (dt > 0) & (speed <= MAX_SPEED_KMH)
+
+    return pd.DataFrame({
+        "tripid": trip[1:][keep],
+        "time": pd.to_datetime(((t[1:] + t[:-1]) // 2)[keep], utc=True),
+        "x": ((x[1:] + x[:-1]) / 2)[keep],
+        "y": ((y[1:] + y[:-1]) / 2)[keep],
+        "speed_kmh": speed[keep],
+        "bearing": bearing(x[1:] - x[:-1], y[1:] - y[:-1])[keep],
+    })
+
+
+def snap_segments(segments, index):
+    """
+    (segment index, edge index) for segments within MAX_SNAP_M of a drive edge. Bearing is a
+    gate, not a rank: candidate edges whose direction at the closest point differs from the
+    segment bearing by more than MAX_TURN_DEG are dropped (the opposite carriageway, a cross
+    street), then the closest remaining edge wins. Stationary segments (no bearing) take the
+    closest edge.
+    """
+    x, y = segments["x"].to_numpy(), segments["y"].to_numpy()
+    seg_idx, edge_idx = index.query_xy(x, y, predicate="dwithin", distance=MAX_SNAP_M)
+    points = index.points(x[seg_idx], y[seg_idx])
+    geoms = index.geoms[edge_idx]
+    along, length = shapely.line_locate_point(geoms, points), shapely.length(geoms)
+    start = shapely.line_interpolate_point(geoms, np.clip(along - BEARING_STEP_M, 0, length))
+    end = shapely.line_interpolate_point(geoms, np.clip(along + BEARING_STEP_M, 0, length))
+    edge_bearing = bearing(shapely.get_x(end) - shapely.get_x(start), shapely.get_y(end) - shapely.get_y(start))
+
+    turn = np.abs(edge_bearing - segments["bearing"].to_numpy()[seg_idx]) % 360
+    turn = np.nan_to_num(np.minimum(turn, 360 - turn), nan=0.0)
+    aligned = np.flatnonzero(turn <= MAX_TURN_DEG)
+    order = aligned[np.lexsort((shapely.distance(geoms, points)[aligned], seg_idx[aligned]))]
+    first = order[np.r_[True, seg_idx[order][1:] != seg_idx[order][:-1]]] if len(order) else order
+    return seg_idx[first], edge_idx[first]
+
+
+def self_check():
+    """Snapping regressions on a synthetic layout (metres): own street, parallel street, opposite carriageway."""
+    import geopandas as gpd
+    from shapely.geometry import LineString
+    lines = [LineString([(0, 0), (100, 0)]),     # 0: eastbound street
+             LineString([(0, 15), (100, 15)]),   # 1: parallel eastbound street 15 m north
+             LineString([(100, -8), (0, -8)]),   # 2: westbound carriageway 8 m south
+             LineString([(50, -50), (50, 50)])]  # 3: northbound cross street
+    index = SpatialIndex(gpd.GeoSeries(lines, crs=METRIC_CRS), "check_edges", crs=None)
+    cases = [  # x, y, bearing, expected edge
+        (20, 0.5, 93, 0),       # 0.5 m from its street, 3 deg off: not the parallel street 15 m away
+        (20, -6, 90, 0),        # closer to the westbound carriageway, but driving east
+        (20, -6, 270, 2),
+        (48, 4, 2, 3),          # at the crossing, heading north
+        (70, 5, float("nan"), 0),  # stationary: nearest edge
+    ]
+    segments = pd.DataFrame(cases, columns=["x", "y", "bearing", "expected"])
+    seg_idx, edge_idx = snap_segments(segments, index)
+    got = pd.Series(edge_idx, index=seg_idx).reindex(range(len(cases)))
+    wrong = got.to_numpy() != segments["expected"].to_numpy()
+    if wrong.any():
+        raise AssertionError(f"snap_segments regressions:\n{segments.assign(got=got.to_numpy())[wrong]}")
+    print(f"snap_segments: {len(cases)} cases ok")
+
+
+def edge_congestion(segments, edges, time_bin=TIME_BIN):
+    """Aggregate segment speeds per (edge, time bin) and flag congested bins.
+
+    edges is the projected drive-edge GeoDataFrame (ox.graph_to_gdfs order) with `length`
+    and `speed_kph` columns.
+    """
+    index = SpatialIndex(edges, "drive_edges", crs=None)
+    seg_idx, edge_idx = snap_segments(segments, index)
+    snapped = segments.iloc[seg_idx].assign(edge=edge_idx)
+    snapped["time_bin"] = snapped["time"].dt.floor(time_bin)
+
+    # Free-flow speed per edge over the whole day, OSM speed where samples are sparse.
+    # The OSM floor keeps edges that are jammed all day from defining their own free flow.
+    per_edge = snapped.groupby("edge")["speed_kmh"]
+    osm_speed = edges["speed_kph"].to_numpy(dtype=float)
+    free_flow = osm_speed.copy()
+    observed = per_edge.quantile(FREE_FLOW_QUANTILE)
+    enough = (per_edge.size() >= MIN_FREE_FLOW_OBSERVATIONS).to_numpy()
+    idx = observed.index.to_numpy()[enough]
+    free_flow[idx] = np.maximum(observed.to_numpy()[enough], MIN_FREE_FLOW_SHARE * osm_speed[idx])
+
+    stats = snapped.groupby(["edge", "time_bin"]).agg(
+        speed_kmh=("speed_kmh", "median"),
+        observations=("speed_kmh", "size"),
+        vehicles=("tripid", "nunique"),
+    ).reset_index()
+    edge = stats["edge"].to_numpy()
+    stats["free_flow_kmh"] = free_flow[edge]
+    stats["speed_ratio"] = stats["speed_kmh"] / stats["free_flow_kmh"]
+    stats["density_veh_km"] = stats["vehicles"] / (edges["length"].to_numpy()[edge] / 1000)
+    stats["congested"] = (stats["observations"] >= MIN_OBSERVATIONS) & \
+                         (stats["speed_ratio"] < CONGESTION_RATIO)
+    return stats
+
+
+def write_congestion_csv(stats, edges, path):
+    """Write congested bins in the congestion.csv schema (Name, Description, LINESTRING Z)."""
+    congested = stats[stats["congested"]].reset_index(drop=True)
+    edge = congested["edge"].to_numpy()
+    edge_keys = edges.index.to_frame(index=False).iloc[edge]
+    geoms = shapely.force_3d(edges.to_crs(epsg=4326).geometry.values[edge], 0.0)
+
+    out = pd.DataFrame({
+        "Name": "edge_" + edge_keys["u"].astype(str).to_numpy() + "_" +
+                edge_keys["v"].astype(str).to_numpy() + "_" + edge_keys["key"].astype(str).to_numpy(),
+        "Description": "speed " + congested["speed_kmh"].round(1).astype(str) +
+                       " km/h vs free-flow " + congested["free_flow_kmh"].round(1).astype(str) + " km/h",
+        "geometry": shapely.to_wkt(geoms, rounding_precision=7, trim=True),
+        "time_bin": congested["time_bin"].dt.strftime("%Y-%m-%dT%H:%M:%S"),
+        "speed_kmh": congested["speed_kmh"].round(2),
+        "free_flow_kmh": congested["free_flow_kmh"].round(2),
+        "speed_ratio": congested["speed_ratio"].round(3),
+        "density_veh_km": congested["density_veh_km"].round(2),
+        "observations": congested["observations"],
+    })
+    out.to_csv(path, index=False)
+    return out
+
+
+if __name__ == "__main__":
+    if "--self-check" in sys.argv:
+        self_check()
+        sys.exit()
+    nihonbashi_polygon = boundary_polygon("Nihonbashi_Line.shp")
+
+    G_drive = ox.graph_from_polygon(nihonbashi_polygon, network_type="drive")
+    G_drive = ox.routing.add_edge_speeds(G_drive)
+    edges = ox.graph_to_gdfs(ox.project_graph(G_drive, to_crs=METRIC_CRS), nodes=False)
+
+    points = load_vehicle_points("05-22-GPS.csv", nihonbashi_polygon)
+    print(f"In-vehicle GPS points inside Nihonbashi: {len(points)}")
+    segments = trip_segments(points)
+    print(f"Speed segments: {len(segments)}")
+    stats = edge_congestion(segments, edges)
+    out = write_congestion_csv(stats, edges, "congestion_detected.csv")
+    print(f"Congested edge-bins: {len(out)} across {out['Name'].nunique()} edges")
+    print(query_stats().to_string(index=False))
@@ -8,30 +8,32 @@ Original file is located at
 """
 
 import pandas as pd
+import numpy as np
 import geopandas as gpd
 import osmnx as ox
 import networkx as nx
-from shapely.geometry import Point, LineString, Polygon
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import matplotlib.colors as mcolors
 from matplotlib import colormaps
 import datetime
+import os
+import sys
+from flow_cube import write_flow_cube
 
-nihonbashi_boundary = gpd.read_file("Nihonbashi_Line.shp")
-nihonbashi_boundary.set_crs(epsg=2451, inplace=True)
-nihonbashi_boundary = nihonbashi_boundary.to_crs(epsg=4326)
-line = nihonbashi_boundary.geometry.iloc[0]
-if isinstance(line, LineString):
-    if not line.is_ring:
-        coords = list(line.coords)
-        if coords[0] != coords[-1]:
-            coords.append(coords[0])
-        line = LineString(coords)
-    nihonbashi_polygon = Polygon(line)
-else:
-    nihonbashi_polygon = line
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "UHE_classifier"))
+from geodata import load_boundary
+from spatial_index import SpatialIndex, query_stats
+
+FLOW_CUBE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "05-22-flow-cube")
+FOOT_CUBE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "05-22-flow-cube-foot")
+ON_FOOT_MODES = ["on_foot", "walking", "running"]  # Same modes as scripts/preprocess/onFootVisits.py
+
+# Boundary polygon from the shared GeoParquet cache (converted and reprojected once)
+nihonbashi_boundary = load_boundary("Nihonbashi_Line.shp")
+nihonbashi_polygon = nihonbashi_boundary.geometry.iloc[0]
+boundary_index = SpatialIndex(nihonbashi_boundary, "boundary", crs=None)
 
 csv_path = "05-22-GPS.csv"
 required_cols = ["tripid", "recordedat", "lat", "lon", "transportmode"]
@@ -52,13 +54,14 @@ for chunk in tqdm(chunk_iter, desc="Filtering GPS by Nihonbashi polygon"):
         crs="EPSG:4326"
     )
 
-    gdf_chunk = gdf_chunk[gdf_chunk.within(nihonbashi_polygon)]
+    gdf_chunk = gdf_chunk[boundary_index.inside_xy(chunk['lon'], chunk['lat'], crs="EPSG:4326")]
 
     filtered_chunks.append(gdf_chunk)
 
 hf_data = pd.concat(filtered_chunks, ignore_index=True)
 print(f"Filtered GPS points inside Nihonbashi: {len(hf_data)}")
 
+foot_data = hf_data[hf_data["transportmode"].isin(ON_FOOT_MODES)]
 hf_data = hf_data[hf_data["transportmode"] == "in_vehicle"]
 hf_data.loc[:, "lat"] = pd.to_numeric(hf_data["lat"], errors="coerce")
 hf_data.loc[:, "lon"] = pd.to_numeric(hf_data["lon"], errors="coerce")
@@ -67,10 +70,10 @@ hf_data = hf_data[(hf_data["lat"].between(-90, 90)) & (hf_data["lon"].between(-1
 hf_data["recordedat"] = pd.to_datetime(hf_data["recordedat"], format="ISO8601", utc=True)
 hf_data = hf_data.sort_values("recordedat")
 
-hf_data["geometry"] = hf_data.apply(lambda row: Point(row["lon"], row["lat"]), axis=1)
-gdf = gpd.GeoDataFrame(hf_data, geometry="geometry", crs="EPSG:4326")
+gdf = gpd.GeoDataFrame(hf_data.drop(columns="geometry"), geometry=gpd.points_from_xy(hf_data["lon"], hf_data["lat"]),
+                       crs="EPSG:4326")
 
-gdf = gdf[gdf.geometry.within(nihonbashi_polygon)].copy()
+gdf = gdf[boundary_index.inside_xy(gdf["lon"], gdf["lat"], crs="EPSG:4326")].copy()
 print(f"Points within Nihonbashi: {len(gdf)}")
 
 G = ox.graph.graph_from_polygon(nihonbashi_polygon, network_type="walk")
@@ -84,8 +87,11 @@ max_count = grouped["count"].max()
 norm = mcolors.Normalize(vmin=1, vmax=max_count)
 cmap = cm.get_cmap("Blues_r")
 
-grouped["color"] = grouped["count"].apply(lambda x: mcolors.to_hex(cmap(norm(x))))
-grouped["size"] = grouped["count"].apply(lambda x: 10 + 20 * (x / max_count))
+# Color and size the whole column at once; only distinct counts need a hex conversion
+unique_counts, inverse = np.unique(grouped["count"].to_numpy(), return_inverse=True)
+unique_colors = np.array([mcolors.to_hex(c) for c in cmap(norm(unique_counts))])
+grouped["color"] = unique_colors[inverse]
+grouped["size"] = 10 + 20 * (grouped["count"] / max_count)
 
 nodes = ox.graph_to_gdfs(G, nodes=True, edges=False)
 nodes = nodes.reset_index()[["osmid", "x", "y"]]
@@ -93,4 +99,19 @@ nodes.columns = ["node", "lon", "lat"]
 merged = pd.merge(grouped, nodes, left_on="nearest_node", right_on="node")
 
 merged["timestamp_str"] = merged["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%S")
-merged.to_csv("05-22-driving.csv", index=False)
\ No newline at end of file
+merged.to_csv("05-22-driving.csv", index=False)
+
+# Same snapped points as a memory-mapped (time bin x node) cube for /query-flow and flow_animation.py
+cube_index = write_flow_cube(gdf["recordedat"], gdf["nearest_node"], FLOW_CUBE_DIR, node_table=nodes)
+print(f"Flow cube written to {FLOW_CUBE_DIR}: {cube_index['n_nodes']} nodes, "
+      f"{cube_index['resolutions']['1s']['nnz']} non-empty 1s cells")
+
+# On-foot points snapped to the same walk graph: pedestrian flow for footfall profiles (kineticHourlySimulation.py)
+if len(foot_data):
+    foot_points = gpd.GeoSeries(gpd.points_from_xy(foot_data["lon"], foot_data["lat"]), crs="EPSG:4326").to_crs(G.graph['crs'])
+    foot_nodes = ox.distance.nearest_nodes(G, X=foot_points.x, Y=foot_points.y)
+    foot_index = write_flow_cube(pd.to_datetime(foot_data["recordedat"], format="ISO8601", utc=True), foot_nodes,
+                                 FOOT_CUBE_DIR, node_table=nodes)
+    print(f"On-foot flow cube written to {FOOT_CUBE_DIR}: {len(foot_data)} points, "
+          f"{foot_index['resolutions']['1s']['nnz']} non-empty 1s cells")
+print(query_stats().to_string(index=False))
\ No newline at end of file
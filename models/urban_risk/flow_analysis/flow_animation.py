@@ -0,0 +1,217 @@
+"""Time-slider flow map export with temporal downsampling.
+
+Reads the flow cube (`flow_cube.py`) or the grouped CSV written by `flow_analysis_v3.py`
+and writes a self-contained Leaflet page with a time slider. One day at 1 s resolution
+is far more frames than a browser can hold, so the exporter:
+
+1. reads the cube level closest to the frame width MAX_FRAMES needs and merges its bins
+   until the number of frames fits (empty frames are kept, so the timeline is uniform),
+2. drops the smallest node counts until the number of drawn points fits MAX_FEATURES,
+3. writes the frames one at a time to the output file instead of building the page in memory.
+
+    python flow_animation.py 05-22-flow-cube flow_animation.html
+    python flow_animation.py 05-22-driving.csv flow_animation.html --max-frames 500
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from flow_cube import FlowCube
+
+MAX_FRAMES = 300
+MAX_FEATURES = 200_000
+CSV_STEP = "1s"  # flow_analysis_v3 floors timestamps to the second
+
+
+def cells_from_cube(path, start=None, end=None, max_frames=MAX_FRAMES):
+    """(bin start ns, node column, count) of every non-empty cell, plus the range (ns) they cover.
+
+    Reads the finest stored level with at most max_frames bins over [start, end), or the
+    coarsest level when none fits, with the range widened to that level's bin edges.
+    """
+    cube = FlowCube(path)
+    if cube.node_xy is None:
+        raise ValueError(f"{path} has no node_xy.npy; rebuild it with node_table")
+    lo = cube._offset_ns(start or cube.start)
+    hi = cube._offset_ns(end or cube.end)
+    levels = cube.index["resolutions"]
+    resolution = next((r for r in reversed(cube.resolutions)
+                       if -(-hi // levels[r]["step_ns"]) - lo // levels[r]["step_ns"] <= max_frames),
+                      cube.resolutions[0])
+    step = levels[resolution]["step_ns"]
+    lo, hi = lo // step * step, -(-hi // step) * step
+    start, end = (cube.t0 + pd.Timedelta(ns, unit="ns") for ns in (lo, hi))
+    indptr, indices, counts = cube.cells(start, end, resolution)
+    b0 = max(lo // step, 0)
+    bins = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    bin_ns = cube.t0.value + (b0 + bins) * step
+    return (bin_ns, np.asarray(indices), np.asarray(counts, dtype=np.int64), step, np.asarray(cube.node_xy),
+            cube.t0.value + lo, cube.t0.value + hi)
+
+
+def cells_from_csv(path, chunk_size=1_000_000):
+    """Same cell arrays from a grouped CSV (timestamp_str, nearest_node, count, lon, lat)."""
+    times, nodes, counts, coords = [], [], [], {}
+    for chunk in pd.read_csv(path, usecols=["timestamp_str", "nearest_node", "count", "lon", "lat"],
+                             chunksize=chunk_size):
+        times.append(pd.to_datetime(chunk["timestamp_str"], utc=True).to_numpy(dtype="datetime64[ns]").astype(np.int64))
+        nodes.append(chunk["nearest_node"].to_numpy())
+        counts.append(chunk["count"].to_numpy(dtype=np.int64))
+        coords.update(zip(chunk["nearest_node"], zip(chunk["lon"], chunk["lat"])))
+    node_ids, cols = np.unique(np.concatenate(nodes), return_inverse=True)
+    node_xy = np.array([coords[n] for n in node_ids], dtype=np.float64).reshape(-1, 2)
+    times = np.concatenate(times)
+    step = pd.Timedelta(CSV_STEP).value
+    start, end = (int(times.min()), int(times.max()) + step) if len(times) else (0, 0)
+    return times, cols, np.concatenate(counts), step, node_xy, start, end
+
+
+def downsample(bin_ns, cols, counts, step_ns, n_nodes, max_frames=MAX_FRAMES, max_features=MAX_FEATURES,
+               start_ns=None, end_ns=None):
+    """Merge bins to at most max_frames and keep at most max_features (frame, node) points.
+
+    Frames cover [start_ns, end_ns) (default: the first to the last bin) from start_ns floored
+    to step_ns, empty frames included. Returns the start (ns) of every frame, then the frame
+    start per kept point, node column, merged count, frame width and the minimum count that
+    survived. An empty selection gives no points.
+    """
+    if start_ns is None:
+        start_ns = int(bin_ns.min()) if len(bin_ns) else 0
+    if end_ns is None:
+        end_ns = int(bin_ns.max()) + step_ns if len(bin_ns) else start_ns
+    t0 = start_ns // step_ns * step_ns
+    span = end_ns - t0
+    merge = max(1, -(-span // (step_ns * max_frames)))
+    width = merge * step_ns
+    frame_starts = t0 + np.arange(-(-span // width)) * width
+    frame = (np.asarray(bin_ns, dtype=np.int64) - t0) // width
+
+    keys, inverse = np.unique(frame * n_nodes + cols, return_inverse=True)
+    merged = np.bincount(inverse, weights=counts).astype(np.int64)
+
+    if len(merged) > max_features:
+        # Exactly the max_features largest counts (ties at the cut are broken arbitrarily), in key order
+        keep = np.sort(np.argpartition(-merged, max_features - 1)[:max_features])
+        keys, merged = keys[keep], merged[keep]
+    threshold = int(merged.min()) if len(merged) else 0
+    return frame_starts, t0 + keys // n_nodes * width, keys % n_nodes, merged, width, threshold
+
+
+def write_animation(out_html, frame_starts, frame_ns, cols, counts, node_xy, width_ns, title="Flow animation"):
+    """Stream frames (empty ones included) into a Leaflet page with a time slider; returns the file size in bytes."""
+    center = np.nanmean(node_xy[np.unique(cols)], axis=0) if len(cols) else (139.78, 35.685)
+    starts = np.searchsorted(frame_ns, frame_starts)
+    ends = np.searchsorted(frame_ns, frame_starts + width_ns)
+    max_count = int(counts.max()) if len(counts) else 1
+    lon = np.round(node_xy[:, 0], 6)
+    lat = np.round(node_xy[:, 1], 6)
+
+    with open(out_html, "w") as f:
+        f.write(_HEADER.replace("{title}", title).replace("{center}", json.dumps([center[1], center[0]])))
+        f.write("var WIDTH_S = %d;\nvar MAX_COUNT = %d;\nvar FRAMES = [\n" % (width_ns // 10 ** 9, max_count))
+        for t, s, e in zip(frame_starts.tolist(), starts, ends):
+            c = cols[s:e]
+            points = list(zip(lat[c].tolist(), lon[c].tolist(), counts[s:e].tolist()))
+            f.write(json.dumps([t // 10 ** 6, points], separators=(",", ":")))
+            f.write(",\n")
+        f.write("];\n")
+        f.write(_FOOTER)
+    return os.path.getsize(out_html)
+
+
+def export_animation(source, out_html, start=None, end=None, max_frames=MAX_FRAMES, max_features=MAX_FEATURES):
+    """Export a time-slider map from a flow cube directory or grouped CSV and report its size."""
+    if os.path.isdir(source):
+        bin_ns, cols, counts, step_ns, node_xy, start_ns, end_ns = cells_from_cube(source, start, end, max_frames)
+    else:
+        bin_ns, cols, counts, step_ns, node_xy, start_ns, end_ns = cells_from_csv(source)
+    frame_starts, frame_ns, kept_cols, kept_counts, width_ns, threshold = downsample(
+        bin_ns, cols, counts, step_ns, len(node_xy), max_frames, max_features, start_ns, end_ns
+    )
+    size = write_animation(out_html, frame_starts, frame_ns, kept_cols, kept_counts, node_xy, width_ns)
+    report = {
+        "source_resolution": str(pd.Timedelta(step_ns, unit="ns")),
+        "frame_width": str(pd.Timedelta(width_ns, unit="ns")),
+        "source_cells": int(len(bin_ns)),
+        "frames": int(len(frame_starts)),
+        "empty_frames": int(len(frame_starts) - len(np.unique(frame_ns))),
+        "features": int(len(kept_counts)),
+        "min_count_kept": threshold,
+        "bytes": size,
+        "bytes_per_frame": size // max(1, len(frame_starts)),
+    }
+    for key, value in report.items():
+        print(f"{key:<18} {value}")
+    return report
+
+
+_HEADER = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>
+html, body, #map { height: 100%; margin: 0; }
+#controls { position: absolute; bottom: 20px; left: 50px; right: 50px; z-index: 1000;
+            background: white; padding: 8px; border-radius: 4px; font: 13px sans-serif; }
+#slider { width: 100%; }
+</style>
+</head>
+<body>
+<div id="map"></div>
+<div id="controls"><button id="play">Play</button> <span id="label"></span>
+<input id="slider" type="range" min="0" value="0"></div>
+<script>
+var CENTER = {center};
+"""
+
+_FOOTER = """var map = L.map('map', {preferCanvas: true}).setView(CENTER, 15);
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png',
+            {attribution: '&copy; OpenStreetMap contributors'}).addTo(map);
+var layer = L.layerGroup().addTo(map);
+var slider = document.getElementById('slider');
+var label = document.getElementById('label');
+slider.max = FRAMES.length - 1;
+function draw(i) {
+    layer.clearLayers();
+    var frame = FRAMES[i];
+    label.textContent = new Date(frame[0]).toISOString() + ' (+' + WIDTH_S + ' s)';
+    frame[1].forEach(function(p) {
+        var share = p[2] / MAX_COUNT;
+        L.circleMarker([p[0], p[1]], {radius: 3 + 12 * Math.sqrt(share), stroke: false,
+            fillColor: 'hsl(' + (220 - 200 * share) + ',80%,45%)', fillOpacity: 0.7}).addTo(layer);
+    });
+}
+var timer = null;
+document.getElementById('play').onclick = function() {
+    if (timer) { clearInterval(timer); timer = null; this.textContent = 'Play'; return; }
+    this.textContent = 'Pause';
+    timer = setInterval(function() {
+        slider.value = (parseInt(slider.value) + 1) % FRAMES.length;
+        draw(slider.value);
+    }, 200);
+};
+slider.oninput = function() { draw(this.value); };
+if (FRAMES.length) { draw(0); }
+</script>
+</body>
+</html>
+"""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="flow cube directory or grouped CSV from flow_analysis_v3.py")
+    parser.add_argument("output", help="output HTML file")
+    parser.add_argument("--start", help="first timestamp (cube input only)")
+    parser.add_argument("--end", help="end timestamp, exclusive (cube input only)")
+    parser.add_argument("--max-frames", type=int, default=MAX_FRAMES)
+    parser.add_argument("--max-features", type=int, default=MAX_FEATURES)
+    args = parser.parse_args()
+    export_animation(args.source, args.output, args.start, args.end, args.max_frames, args.max_features)
@@ -0,0 +1,206 @@
+"""Flow cube: GPS point counts per (time bin x walk-graph node), stored as memory-mapped arrays.
+
+`flow_analysis_v3.py` writes one cube per day next to its grouped CSV. Each time
+resolution is kept as a CSR matrix (one row per time bin, one column per node), so a
+time range is a contiguous slice of the `indices`/`counts` arrays and can be read from
+the memory map without copying or rescanning the CSV.
+
+Cube directory layout:
+    index.json          t0, node count and the bin size / shape of every resolution
+    nodes.npy           osmid of each node column (sorted)
+    node_xy.npy         lon/lat of each node column (optional)
+    <res>/indptr.npy    row pointers, length n_bins + 1
+    <res>/indices.npy   node column of each non-empty cell
+    <res>/counts.npy    point count of each non-empty cell
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RESOLUTIONS = ["1s", "10s", "1min", "5min", "15min", "1h"]
+
+
+def _to_ns(timestamps):
+    """Convert timestamps to int64 nanoseconds since the epoch (UTC)."""
+    ts = pd.to_datetime(pd.Series(timestamps), utc=True)
+    return ts.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def write_flow_cube(timestamps, nodes, out_dir, resolutions=DEFAULT_RESOLUTIONS, node_table=None):
+    """Aggregate GPS points into a multi-resolution (time bin x node) count cube on disk.
+
+    timestamps/nodes are aligned per GPS point (e.g. `recordedat` and `nearest_node`).
+    node_table is an optional DataFrame with columns node, lon, lat.
+    """
+    steps = sorted((pd.Timedelta(r).value, r) for r in resolutions)
+    ts_ns = _to_ns(timestamps)
+    node_ids, node_col = np.unique(np.asarray(nodes), return_inverse=True)
+    n_nodes = len(node_ids)
+
+    # Align t0 to the coarsest bin so every resolution shares the same bin edges
+    coarsest = steps[-1][0]
+    t0 = ts_ns.min() // coarsest * coarsest
+    offsets = ts_ns - t0
+
+    # Collapse points to cells at the finest resolution once; coarser levels re-bin the cells
+    finest = steps[0][0]
+    keys, counts = np.unique((offsets // finest) * n_nodes + node_col, return_counts=True)
+    cell_time = keys // n_nodes * finest
+    cell_node = keys % n_nodes
+
+    os.makedirs(out_dir, exist_ok=True)
+    index = {"t0": pd.Timestamp(t0, tz="UTC").isoformat(), "n_nodes": int(n_nodes), "resolutions": {}}
+    for step, name in steps:
+        rows = cell_time // step
+        level_keys, inverse = np.unique(rows * n_nodes + cell_node, return_inverse=True)
+        level_counts = np.bincount(inverse, weights=counts).astype(np.uint32)
+        level_rows = level_keys // n_nodes
+        n_bins = int(level_rows[-1]) + 1
+        indptr = np.searchsorted(level_rows, np.arange(n_bins + 1)).astype(np.int64)
+
+        level_dir = os.path.join(out_dir, name)
+        os.makedirs(level_dir, exist_ok=True)
+        np.save(os.path.join(level_dir, "indptr.npy"), indptr)
+        np.save(os.path.join(level_dir, "indices.npy"), (level_keys % n_nodes).astype(np.int32))
+        np.save(os.path.join(level_dir, "counts.npy"), level_counts)
+        index["resolutions"][name] = {"step_ns": int(step), "n_bins": n_bins, "nnz": int(len(level_keys))}
+
+    np.save(os.path.join(out_dir, "nodes.npy"), node_ids)
+    if node_table is not None:
+        xy = node_table.set_index("node").reindex(node_ids)[["lon", "lat"]].to_numpy(dtype=np.float64)
+        np.save(os.path.join(out_dir, "node_xy.npy"), xy)
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+class FlowCube:
+    """Read-only view of a flow cube directory; all arrays are opened with mmap_mode='r'."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.t0 = pd.Timestamp(self.index["t0"])
+        self.n_nodes = self.index["n_nodes"]
+        self.nodes = np.load(os.path.join(path, "nodes.npy"), mmap_mode="r")
+        xy_path = os.path.join(path, "node_xy.npy")
+        self.node_xy = np.load(xy_path, mmap_mode="r") if os.path.exists(xy_path) else None
+        # Resolution names ordered from coarsest to finest
+        self.resolutions = sorted(self.index["resolutions"],
+                                  key=lambda r: -self.index["resolutions"][r]["step_ns"])
+        self._levels = {}
+
+    def _level(self, resolution):
+        if resolution not in self._levels:
+            level_dir = os.path.join(self.path, resolution)
+            self._levels[resolution] = tuple(
+                np.load(os.path.join(level_dir, f"{name}.npy"), mmap_mode="r")
+                for name in ("indptr", "indices", "counts")
+            )
+        return self._levels[resolution]
+
+    @property
+    def start(self):
+        return self.t0
+
+    @property
+    def end(self):
+        finest = self.resolutions[-1]
+        info = self.index["resolutions"][finest]
+        return self.t0 + pd.Timedelta(info["step_ns"] * info["n_bins"], unit="ns")
+
+    def _offset_ns(self, t):
+        t = pd.Timestamp(t)
+        if t.tzinfo is None:
+            t = t.tz_localize("UTC")
+        return (t - self.t0).value
+
+    def pick_resolution(self, start, end):
+        """Coarsest resolution whose bin edges line up with both ends of [start, end)."""
+        lo, hi = self._offset_ns(start), self._offset_ns(end)
+        for name in self.resolutions:
+            step = self.index["resolutions"][name]["step_ns"]
+            if lo % step == 0 and hi % step == 0 and hi - lo >= step:
+                return name
+        return self.resolutions[-1]
+
+    def aligned(self, start, end, resolution):
+        """Whether [start, end) covers whole bins of `resolution` (ends outside the cube's data need not align)."""
+        step = self.index["resolutions"][resolution]["step_ns"]
+        lo, hi = self._offset_ns(start), self._offset_ns(end)
+        return (lo <= 0 or lo % step == 0) and (hi >= self._offset_ns(self.end) or hi % step == 0)
+
+    def _bins(self, start, end, resolution):
+        if not self.aligned(start, end, resolution):
+            raise ValueError(f"[{start}, {end}) does not start and end on {resolution} bin edges")
+        info = self.index["resolutions"][resolution]
+        step = info["step_ns"]
+        b0 = max(self._offset_ns(start) // step, 0)
+        b1 = min(-(-self._offset_ns(end) // step), info["n_bins"])
+        return int(b0), int(max(b1, b0))
+
+    def _columns(self, nodes):
+        nodes = np.asarray(nodes)
+        cols = np.searchsorted(self.nodes, nodes)
+        cols = np.clip(cols, 0, self.n_nodes - 1)
+        return cols[self.nodes[cols] == nodes]
+
+    def cells(self, start, end, resolution=None):
+        """Zero-copy (bin offsets, node columns, counts) slices for [start, end)."""
+        resolution = resolution or self.pick_resolution(start, end)
+        indptr, indices, counts = self._level(resolution)
+        b0, b1 = self._bins(start, end, resolution)
+        lo, hi = indptr[b0], indptr[b1]
+        return indptr[b0:b1 + 1] - lo, indices[lo:hi], counts[lo:hi]
+
+    def totals(self, start, end, nodes=None, resolution=None):
+        """Per-node point count summed over [start, end); nodes restricts to a subset of osmids."""
+        _, indices, counts = self.cells(start, end, resolution)
+        total = np.bincount(indices, weights=counts, minlength=self.n_nodes)
+        if nodes is not None:
+            return total[self._columns(nodes)]
+        return total
+
+    def peaks(self, start, end, nodes=None, resolution=None):
+        """Per-node maximum count in any single bin of [start, end)."""
+        _, indices, counts = self.cells(start, end, resolution)
+        peak = np.zeros(self.n_nodes, dtype=np.uint32)
+        np.maximum.at(peak, indices, counts)
+        if nodes is not None:
+            return peak[self._columns(nodes)]
+        return peak
+
+    def series(self, start, end, nodes=None, resolution=None):
+        """Total count per time bin over [start, end), optionally for a subset of nodes."""
+        resolution = resolution or self.pick_resolution(start, end)
+        indptr, indices, counts = self.cells(start, end, resolution)
+        weights = np.asarray(counts, dtype=np.float64)
+        if nodes is not None:
+            mask = np.zeros(self.n_nodes, dtype=bool)
+            mask[self._columns(nodes)] = True
+            weights = np.where(mask[indices], weights, 0.0)
+        cumulative = np.concatenate([[0.0], np.cumsum(weights)])
+        per_bin = cumulative[indptr[1:]] - cumulative[indptr[:-1]]
+        step = pd.Timedelta(self.index["resolutions"][resolution]["step_ns"], unit="ns")
+        b0, _ = self._bins(start, end, resolution)
+        times = self.t0 + step * (b0 + np.arange(len(per_bin)))
+        return pd.Series(per_bin, index=times, name="count")
+
+    def top_k(self, start, end, k=10, agg="sum", resolution=None):
+        """The k busiest nodes over [start, end) ranked by summed or peak count."""
+        values = self.peaks(start, end, resolution=resolution) if agg == "max" \
+            else self.totals(start, end, resolution=resolution)
+        k = min(k, int(np.count_nonzero(values)))
+        if k == 0:
+            return pd.DataFrame(columns=["node", "count", "lon", "lat"])
+        top = np.argpartition(-values, k - 1)[:k]
+        top = top[np.argsort(-values[top], kind="stable")]
+        result = pd.DataFrame({"node": self.nodes[top], "count": values[top]})
+        if self.node_xy is not None:
+            result["lon"] = self.node_xy[top, 0]
+            result["lat"] = self.node_xy[top, 1]
+        return result
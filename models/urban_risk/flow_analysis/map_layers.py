@@ -0,0 +1,270 @@
+"""Network-scale map layers: one styled GeoJSON per layer and zoom level instead of one
+folium object per feature.
+
+`congestion.py` adds a `folium.PolyLine` per congestion row and a `folium.CircleMarker`
+per shelter, so the HTML grows by a full Leaflet constructor call (and its options) per
+feature. Here each layer becomes a single FeatureCollection whose style lives in the
+feature properties (computed for the whole column at once), geometry is simplified and
+coordinates rounded for each zoom level, and one small script swaps the collection on
+`zoomend`. Collections are either inlined in the HTML or written next to it and fetched.
+
+    python map_layers.py --build-benchmark 10000
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import folium
+from folium import MacroElement
+from folium.template import Template
+
+ZOOM_LEVELS = (13, 15, 17)
+EARTH_CIRCUMFERENCE_M = 40075016.686
+TILE_SIZE_PX = 256
+
+
+def degrees_per_pixel(zoom, lat):
+    """Ground size of one screen pixel at a web-mercator zoom level, in degrees of longitude."""
+    metres = EARTH_CIRCUMFERENCE_M * np.cos(np.radians(lat)) / (TILE_SIZE_PX * 2 ** zoom)
+    return metres / (EARTH_CIRCUMFERENCE_M / 360.0)
+
+
+def congestion_style(gdf):
+    """Vectorized line color/weight from speed_ratio when present (GPS-derived layers)."""
+    if "speed_ratio" in gdf:
+        ratio = pd.to_numeric(gdf["speed_ratio"], errors="coerce").fillna(0).to_numpy()
+        color = np.select([ratio < 0.25, ratio < 0.5], ["darkred", "red"], "orange")
+        weight = np.select([ratio < 0.25, ratio < 0.5], [7, 5], 4)
+    else:
+        color = np.full(len(gdf), "red")
+        weight = np.full(len(gdf), 7)
+    return pd.DataFrame({
+        "color": color,
+        "weight": weight,
+        "tooltip": gdf["Name"].astype(str).to_numpy() if "Name" in gdf else "Line",
+    })
+
+
+def shelter_style(evac_data, min_radius=12, max_radius=24):
+    """Vectorized version of congestion.py's scale_radius and OG/other fill colors."""
+    capacity = evac_data["Capacity"].to_numpy(dtype=float)
+    span = capacity.max() - capacity.min()
+    radius = np.full(len(capacity), float(min_radius)) if span == 0 else \
+        min_radius + (capacity - capacity.min()) / span * (max_radius - min_radius)
+    return pd.DataFrame({
+        "radius": radius.round(1),
+        "fillColor": np.where(evac_data["Type"].to_numpy() == "OG", "black", "limegreen"),
+        "tooltip": evac_data["Name"].astype(str) + " (Capacity: " + evac_data["Capacity"].astype(str) + ")",
+    })
+
+
+def feature_collection(geoms, properties):
+    """Serialize geometries and a property table to a GeoJSON FeatureCollection string."""
+    geometry_json = shapely.to_geojson(geoms)
+    property_json = properties.to_json(orient="records", lines=True).splitlines() if len(properties) else []
+    features = ",".join(
+        '{"type":"Feature","geometry":%s,"properties":%s}' % (g, p)
+        for g, p in zip(geometry_json, property_json) if g is not None
+    )
+    return '{"type":"FeatureCollection","features":[%s]}' % features
+
+
+def zoom_collections(gdf, properties, zooms=ZOOM_LEVELS):
+    """One FeatureCollection per zoom, simplified to half a pixel, coordinates rounded to the
+    decimal place just below a tenth of a pixel."""
+    geoms = gdf.to_crs(epsg=4326).geometry.values
+    lat = float(np.nanmean(shapely.get_coordinates(geoms)[:, 1])) if len(geoms) else 35.68
+    collections = {}
+    for zoom in zooms:
+        pixel = degrees_per_pixel(zoom, lat)
+        simplified = shapely.simplify(geoms, pixel / 2, preserve_topology=False)
+        decimals = int(np.ceil(-np.log10(pixel / 10)))
+        rounded = shapely.set_precision(simplified, 10.0 ** -decimals)
+        # Lines that collapse below a pixel at this zoom are dropped
+        keep = ~shapely.is_empty(rounded)
+        collections[zoom] = feature_collection(rounded[keep], properties[keep].reset_index(drop=True))
+    return collections
+
+
+class ZoomedGeoJson(MacroElement):
+    """Leaflet layer that shows the FeatureCollection of the nearest zoom level at or below
+    the map zoom. Styles are read from feature properties, points become circle markers."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var zooms = {{ this.zooms|tojson }};
+            var sources = {{ this.sources }};
+            var cache = {};
+            var shown = null;
+            var shownZoom = null;
+            function pick(z) {
+                var best = zooms[0];
+                zooms.forEach(function(k) { if (k <= z) { best = k; } });
+                return best;
+            }
+            function build(data) {
+                return L.geoJSON(data, {
+                    style: function(f) {
+                        return {color: f.properties.color, weight: f.properties.weight, opacity: 0.8};
+                    },
+                    pointToLayer: function(f, latlng) {
+                        return L.circleMarker(latlng, {radius: f.properties.radius, color: 'black',
+                            weight: 2, fillColor: f.properties.fillColor, fillOpacity: 0.8});
+                    },
+                    onEachFeature: function(f, layer) {
+                        if (f.properties.tooltip) { layer.bindTooltip(f.properties.tooltip); }
+                    }
+                });
+            }
+            function swap(zoom, layer) {
+                if (shown) { map.removeLayer(shown); }
+                shown = layer.addTo(map);
+                shownZoom = zoom;
+            }
+            function show() {
+                var zoom = pick(map.getZoom());
+                if (zoom === shownZoom) { return; }
+                if (cache[zoom]) { swap(zoom, cache[zoom]); return; }
+                var source = sources[zoom];
+                if (typeof source === 'string') {
+                    fetch(source).then(function(r) { return r.json(); }).then(function(data) {
+                        cache[zoom] = build(data);
+                        swap(zoom, cache[zoom]);
+                    });
+                } else {
+                    cache[zoom] = build(source);
+                    swap(zoom, cache[zoom]);
+                }
+            }
+            map.on('zoomend', show);
+            show();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, collections, urls=None):
+        super().__init__()
+        self._name = "ZoomedGeoJson"
+        self.zooms = sorted(collections)
+        if urls:
+            self.sources = json.dumps({str(z): urls[z] for z in self.zooms})
+        else:
+            # Collections are already JSON text; splice them in without re-encoding
+            self.sources = "{" + ",".join('"%d":%s' % (z, collections[z]) for z in self.zooms) + "}"
+
+
+def write_collections(collections, out_dir, name):
+    """Write each zoom's FeatureCollection to <out_dir>/<name>_z<zoom>.geojson."""
+    os.makedirs(out_dir, exist_ok=True)
+    urls = {}
+    for zoom, text in collections.items():
+        filename = f"{name}_z{zoom}.geojson"
+        with open(os.path.join(out_dir, filename), "w") as f:
+            f.write(text)
+        urls[zoom] = os.path.join(os.path.basename(os.path.normpath(out_dir)), filename)
+    return urls
+
+
+def render_map(congestion_gdf, evac_data, out_html, zooms=ZOOM_LEVELS, inline=True, tiles_dir=None):
+    """Render congestion lines and shelters as two zoom-aware GeoJSON layers.
+
+    inline=False writes the collections to tiles_dir (next to out_html by default) and the
+    page fetches them, which keeps the HTML size constant; this needs the files to be served
+    over http rather than opened from disk.
+    """
+    center = congestion_gdf.to_crs(epsg=4326).geometry.union_all().centroid
+    m = folium.Map(location=[center.y, center.x], zoom_start=15, tiles="CartoDBPositron")
+
+    congestion_layers = zoom_collections(congestion_gdf, congestion_style(congestion_gdf), zooms)
+    shelters = gpd.GeoDataFrame(
+        evac_data, geometry=gpd.points_from_xy(evac_data["longitude"], evac_data["latitude"]), crs="EPSG:4326"
+    )
+    # Points need no simplification, one collection serves every zoom
+    shelter_layer = feature_collection(shelters.geometry.values, shelter_style(evac_data))
+
+    if inline:
+        ZoomedGeoJson(congestion_layers).add_to(m)
+        ZoomedGeoJson({zooms[0]: shelter_layer}).add_to(m)
+    else:
+        tiles_dir = tiles_dir or os.path.splitext(out_html)[0] + "_layers"
+        ZoomedGeoJson(congestion_layers, write_collections(congestion_layers, tiles_dir, "congestion")).add_to(m)
+        ZoomedGeoJson({zooms[0]: shelter_layer},
+                      write_collections({zooms[0]: shelter_layer}, tiles_dir, "shelters")).add_to(m)
+    m.save(out_html)
+    return m
+
+
+def synthetic_edges(n_edges, seed=0, lon0=139.770, lat0=35.680):
+    """Street-like polylines around Nihonbashi with random speed ratios, for benchmarking."""
+    rng = np.random.default_rng(seed)
+    n_vertices = rng.integers(2, 12, n_edges)
+    offsets = np.repeat(np.arange(n_edges), n_vertices)
+    start = np.column_stack([lon0 + rng.random(n_edges) * 0.03, lat0 + rng.random(n_edges) * 0.02])
+    steps = rng.normal(0, 0.00015, (n_vertices.sum(), 2))
+    coords = np.repeat(start, n_vertices, axis=0) + np.cumsum(steps, axis=0) - \
+        np.repeat(np.cumsum(steps, axis=0)[np.cumsum(n_vertices) - n_vertices], n_vertices, axis=0)
+    lines = shapely.linestrings(coords, indices=offsets)
+    return gpd.GeoDataFrame({
+        "Name": [f"edge_{i}" for i in range(n_edges)],
+        "speed_ratio": rng.random(n_edges).round(3),
+    }, geometry=lines, crs="EPSG:4326")
+
+
+def build_benchmark(n_edges=10000, out_dir="map_benchmark", evac_path="evac_shelters.csv"):
+    """Compare HTML size and Python build time of per-feature folium objects vs zoomed GeoJSON layers.
+
+    Also reports the layer bytes a page at each zoom loads with inline=False. Browser
+    load/render time is out of scope: it needs a headless browser, which is not a dependency.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    gdf = synthetic_edges(n_edges)
+    evac_data = pd.read_csv(evac_path)
+    results = []
+
+    start = time.perf_counter()
+    m = folium.Map(location=[35.69, 139.785], zoom_start=15, tiles="CartoDBPositron")
+    for _, row in gdf.iterrows():
+        folium.PolyLine([(y, x) for x, y in row.geometry.coords], color="red", weight=7,
+                        opacity=0.8, tooltip=row["Name"]).add_to(m)
+    legacy_html = os.path.join(out_dir, "per_feature.html")
+    m.save(legacy_html)
+    results.append(("per-feature PolyLine", time.perf_counter() - start, os.path.getsize(legacy_html), 0))
+
+    for inline in (True, False):
+        start = time.perf_counter()
+        html = os.path.join(out_dir, f"geojson_{'inline' if inline else 'external'}.html")
+        render_map(gdf, evac_data, html, inline=inline)
+        seconds = time.perf_counter() - start
+        layer_bytes = 0
+        if not inline:
+            layer_dir = os.path.splitext(html)[0] + "_layers"
+            layer_bytes = sum(os.path.getsize(os.path.join(layer_dir, f)) for f in os.listdir(layer_dir))
+        results.append((f"zoomed GeoJSON ({'inline' if inline else 'external'})",
+                        seconds, os.path.getsize(html), layer_bytes))
+
+    print(f"Building maps of {n_edges:,} edges + {len(evac_data)} shelters (browser render time not measured)")
+    print(f"{'mode':<30}{'build s':>10}{'html KB':>12}{'layer files KB':>16}")
+    for mode, seconds, size, layer_bytes in results:
+        print(f"{mode:<30}{seconds:>10.2f}{size / 1024:>12.0f}{layer_bytes / 1024:>16.0f}")
+    shelter_bytes = os.path.getsize(os.path.join(layer_dir, f"shelters_z{ZOOM_LEVELS[0]}.geojson"))
+    per_zoom = {z: os.path.getsize(os.path.join(layer_dir, f"congestion_z{z}.geojson")) + shelter_bytes
+                for z in ZOOM_LEVELS}
+    print("external layers loaded per zoom: " + ", ".join(f"z{z} {b / 1024:.0f} KB" for z, b in per_zoom.items()))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--build-benchmark", type=int, metavar="N_EDGES",
+                        help="HTML build time and size with N synthetic edges (browser render time is not measured)")
+    args = parser.parse_args()
+    if args.build_benchmark:
+        build_benchmark(args.build_benchmark)
@@ -0,0 +1,171 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'Data2025',
+                            'Nihonbashi2_OnFoot_KineticFloorData.csv')
+
+COVERAGE_TIERS = [10, 25, 50, 75, 90]
+TIME_SCALES = {'daily': 1, 'monthly': 365 / 12, 'yearly': 365}
+
+# Floor-area mix columns (% of total floor area) and the label used when one dominates
+FA_COLUMNS = {'FA_R': 'Residential', 'FA_O': 'Office', 'FA_C': 'Commercial', 'FA_H': 'Hotel', 'FA_L': 'Other'}
+FA_DOMINANT_PCT = 60  # Below this share no use dominates and the building counts as 'Mixed'
+NFLOOR_BANDS = [0, 3, 6, 10, 20, np.inf]
+NFLOOR_LABELS = ['1-3', '4-6', '7-10', '11-20', '21+']
+UNKNOWN = 'Unknown'  # Bucket for buildings with a missing attribute
+
+DIMENSIONS = ['MainUse', 'Str', 'AgeDecade', 'NFloorBand', 'FAMix']
+MEASURES = ['buildings'] + [f'KFloor_{p}p' for p in COVERAGE_TIERS] + [f'Energy_{p}p_kWh' for p in COVERAGE_TIERS]
+
+
+def building_dimensions(df):
+    """
+    Dimension columns per building: MainUse, Str, Age decade, NFloor band and dominant floor-area
+    use. Missing values (and floor counts outside the bands) fall in the UNKNOWN bucket.
+    """
+    fa_frame = df[list(FA_COLUMNS)].clip(lower=0)  # FA_C has -100 placeholders
+    fa = fa_frame.fillna(0).to_numpy(dtype=float)
+    dominant = np.array(list(FA_COLUMNS.values()))[fa.argmax(axis=1)]
+    age = pd.to_numeric(df['Age'], errors='coerce')
+    decade = (age // 10 * 10).astype('Int64').astype(str) + 's'
+    return pd.DataFrame({
+        'MainUse': df['MainUse'].astype(str).where(df['MainUse'].notna(), UNKNOWN).to_numpy(),
+        'Str': df['Str'].astype(str).where(df['Str'].notna(), UNKNOWN).to_numpy(),
+        'AgeDecade': decade.where(age.notna(), UNKNOWN).to_numpy(),
+        'NFloorBand': pd.cut(df['NFloor'], NFLOOR_BANDS, labels=NFLOOR_LABELS).astype(object).fillna(UNKNOWN).to_numpy(),
+        'FAMix': np.where(fa_frame.isna().all(axis=1), UNKNOWN,
+                          np.where(fa.max(axis=1) >= FA_DOMINANT_PCT, dominant, 'Mixed')),
+    }, index=df.index)
+
+
+def building_measures(df):
+    """Additive measures per building: count, kinetic floor area and daily energy per coverage tier"""
+    measures = df[MEASURES[1:]].astype(float)
+    measures.insert(0, 'buildings', 1)
+    return measures
+
+
+class EnergyCube:
+    """
+    Aggregation cube of daily kinetic energy over building dimensions x coverage tiers.
+
+    Every measure is a sum, so any dimension subset is a roll-up of the finest-grained
+    cuboid. Rolled-up views are cached per (dimensions, filter) and kept current on append
+    by adding the rolled-up delta of the new rows instead of recomputing.
+    """
+
+    def __init__(self, df=None, key='KEYID'):
+        self.key = key
+        self.rows = pd.DataFrame(columns=[key] + DIMENSIONS + MEASURES)
+        self.base = pd.DataFrame(columns=MEASURES)
+        self._views = {}
+        if df is not None:
+            self.append(df)
+
+    def _cuboid(self, rows, dims):
+        """Sum measures of building rows over a dimension subset (grand total when dims is empty)"""
+        if not dims:
+            return rows[MEASURES].sum().to_frame('All').T
+        return rows.groupby(list(dims), observed=True)[MEASURES].sum()
+
+    def append(self, df, replace=False):
+        """
+        Add new building rows. With replace=True, rows whose key is already in the cube replace
+        the old rows (KEYID is not unique in every dataset, so this is opt-in): their
+        contribution is subtracted from the base cuboid and every cached view.
+        """
+        new = pd.concat([df[[self.key]].reset_index(drop=True),
+                         building_dimensions(df).reset_index(drop=True),
+                         building_measures(df).reset_index(drop=True)], axis=1)
+        replaced = self.rows[self.rows[self.key].isin(new[self.key])] if replace else self.rows.iloc[:0]
+        if len(replaced):
+            negated = replaced.copy()
+            negated[MEASURES] = -negated[MEASURES]
+            delta = pd.concat([negated, new], ignore_index=True)
+        else:
+            delta = new
+
+        self.base = self._merge(self.base, self._cuboid(delta, DIMENSIONS))
+        for (dims, where), view in self._views.items():
+            self._views[(dims, where)] = self._merge(view, self._cuboid(self._filter(delta, where), dims))
+        kept = self.rows.drop(replaced.index)
+        self.rows = new if kept.empty else pd.concat([kept, new], ignore_index=True)
+        return self
+
+    @staticmethod
+    def _merge(view, delta):
+        """Add a delta cuboid to a view; cells that drop to zero buildings disappear"""
+        merged = delta if view.empty else view.add(delta, fill_value=0)
+        return merged[merged['buildings'] > 0]
+
+    @staticmethod
+    def _filter(rows, where):
+        for column, values in where:
+            rows = rows[rows[column].isin(values)]
+        return rows
+
+    def query(self, dims=(), tiers=None, scale='daily', where=None, measure='energy'):
+        """
+        Roll up to a dimension subset.
+
+        dims: any of DIMENSIONS; tiers: coverage percentages (default all);
+        scale: 'daily', 'monthly' or 'yearly'; where: {dimension: value or list} filter;
+        measure: 'energy' (kWh), 'area' (m² of tiles) or 'all' (plus building counts).
+        """
+        dims = tuple(dims)
+        unknown = set(dims) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown dimension(s) {sorted(unknown)}; choose from {DIMENSIONS}")
+        where = tuple(sorted((k, tuple(v) if isinstance(v, (list, tuple, set)) else (v,))
+                             for k, v in (where or {}).items()))
+
+        if (dims, where) not in self._views:
+            base = self.base.reset_index()
+            self._views[(dims, where)] = self._cuboid(self._filter(base, where), dims)
+        view = self._views[(dims, where)]
+
+        tiers = tiers or COVERAGE_TIERS
+        energy = [f'Energy_{p}p_kWh' for p in tiers]
+        area = [f'KFloor_{p}p' for p in tiers]
+        columns = {'energy': energy, 'area': area, 'all': ['buildings'] + area + energy}[measure]
+        result = view[columns].copy()
+        scaled = [c for c in columns if c in energy]
+        result[scaled] = result[scaled] * TIME_SCALES[scale]
+        return result.sort_index()
+
+    def cached_views(self):
+        """Dimension subsets and filters with a materialized view"""
+        return list(self._views)
+
+    def save(self, path):
+        """Write the building rows (the cube is rebuilt from them on load)"""
+        self.rows.to_parquet(path, index=False)
+
+    @classmethod
+    def load(cls, path, key='KEYID'):
+        cube = cls(key=key)
+        rows = pd.read_parquet(path)
+        cube.rows = rows
+        cube.base = cube._cuboid(rows, DIMENSIONS)
+        return cube
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll up kinetic floor energy over building dimensions")
+    parser.add_argument('dims', nargs='*', help=f"dimensions to group by: {', '.join(DIMENSIONS)}")
+    parser.add_argument('--csv', default=DEFAULT_DATA, help='kinetic energy dataset')
+    parser.add_argument('--scale', choices=list(TIME_SCALES), default='yearly')
+    parser.add_argument('--tiers', type=int, nargs='*', choices=COVERAGE_TIERS)
+    parser.add_argument('--where', nargs='*', default=[], metavar='DIM=VALUE', help='filter, e.g. Str=RC')
+    args = parser.parse_args()
+
+    cube = EnergyCube(pd.read_csv(args.csv, encoding='utf-8-sig'))
+    where = {}
+    for item in args.where:
+        column, value = item.split('=', 1)
+        where.setdefault(column, []).append(value)
+    print(f"{args.scale.capitalize()} energy (kWh) by {', '.join(args.dims) or 'district'}:")
+    print(cube.query(args.dims, args.tiers, args.scale, where))
@@ -1,6 +1,43 @@
 import pandas as pd
 import numpy as np
 
+# Constants based on market research
+COST_PER_TILE_YEN = 56700  # ¥56,700 per tile (Pavegen 2024 pricing)
+INSTALLATION_COST_PER_SQM_YEN = 30000  # ¥30,000 per m² installation
+TILE_AREA_SQM = 0.25  # Each tile is 0.25 m²
+MAINTENANCE_RATE = 0.02  # 2% annual maintenance
+
+# Tokyo electricity rates (¥/kWh)
+COMMERCIAL_RATE = 30.18  # Office, hospital, commercial
+RESIDENTIAL_RATE = 36.70  # Residential buildings
+
+# Energy conversion (realistic calculation)
+ENERGY_PER_STEP_JOULES = 5  # Joules per footstep, original run was 3 per
+JOULES_TO_KWH = 1 / 3600000  # Convert joules to kWh
+ENERGY_PER_STEP_KWH = ENERGY_PER_STEP_JOULES * JOULES_TO_KWH
+
+SYSTEM_LIFESPAN_YEARS = 20
+
+def is_residential(main_use):
+    """Boolean mask of buildings billed at the residential rate (vectorized over a MainUse column)"""
+    main_use_lower = pd.Series(main_use).astype(str).str.lower()
+    commercial = main_use_lower.str.contains('office|commercial|hospital')
+    residential = main_use_lower.str.contains('residential|resid|house')
+    return (residential & ~commercial).to_numpy()
+
+def get_electricity_rate(main_use):
+    """Map building use to appropriate electricity rate (default: commercial)"""
+    return np.where(is_residential(main_use), RESIDENTIAL_RATE, COMMERCIAL_RATE)
+
+def categorize_payback(years):
+    """Payback category labels for an array of payback periods"""
+    years = np.asarray(years, dtype=float)
+    return np.select(
+        [np.isinf(years), years <= 10, years <= 15, years <= 25],
+        ['Never', 'Excellent (<10 years)', 'Good (10-15 years)', 'Fair (15-25 years)'],
+        default='Poor (>25 years)'
+    )
+
 def add_payback_analysis(df):
     """
     Add payback analysis columns to existing kinetic energy dataset
@@ -12,21 +49,6 @@ def add_payback_analysis(df):
     DataFrame with additional payback analysis columns
     """
     
-    # Constants based on market research
-    COST_PER_TILE_YEN = 56700  # ¥56,700 per tile (Pavegen 2024 pricing)
-    INSTALLATION_COST_PER_SQM_YEN = 30000  # ¥30,000 per m² installation
-    TILE_AREA_SQM = 0.25  # Each tile is 0.25 m²
-    MAINTENANCE_RATE = 0.02  # 2% annual maintenance
-    
-    # Tokyo electricity rates (¥/kWh)
-    COMMERCIAL_RATE = 30.18  # Office, hospital, commercial
-    RESIDENTIAL_RATE = 36.70  # Residential buildings
-    
-    # Energy conversion (realistic calculation)
-    ENERGY_PER_STEP_JOULES = 5  # Joules per footstep, original run was 3 per
-    JOULES_TO_KWH = 1 / 3600000  # Convert joules to kWh
-    ENERGY_PER_STEP_KWH = ENERGY_PER_STEP_JOULES * JOULES_TO_KWH
-    
     # Create a copy to avoid modifying original
     df_analysis = df.copy()
     
@@ -42,17 +64,7 @@ def add_payback_analysis(df):
     
     # 3. Map building types to electricity rates
     # You'll need to adjust this mapping based on your MainUse values
-    def get_electricity_rate(main_use):
-        """Map building use to appropriate electricity rate"""
-        main_use_lower = str(main_use).lower()
-        if any(term in main_use_lower for term in ['office', 'commercial', 'hospital']):
-            return COMMERCIAL_RATE
-        elif any(term in main_use_lower for term in ['residential', 'resid', 'house']):
-            return RESIDENTIAL_RATE
-        else:
-            return COMMERCIAL_RATE  # Default to commercial rate
-    
-    df_analysis['electricity_rate_yen_kwh'] = df_analysis['MainUse'].apply(get_electricity_rate)
+    df_analysis['electricity_rate_yen_kwh'] = get_electricity_rate(df_analysis['MainUse'])
     
     # 4. Calculate corrected energy generation (using footsteps instead of your EnergyYearly_kWh)
     df_analysis['corrected_daily_energy_kwh'] = (
@@ -88,7 +100,7 @@ def add_payback_analysis(df):
     # 7. Calculate cost per kWh generated (useful for optimization)
     df_analysis['cost_per_kwh_yen'] = np.where(
         df_analysis['corrected_yearly_energy_kwh'] > 0,
-        df_analysis['total_installation_cost_yen'] / (df_analysis['corrected_yearly_energy_kwh'] * 20),  # 20-year lifespan
+        df_analysis['total_installation_cost_yen'] / (df_analysis['corrected_yearly_energy_kwh'] * SYSTEM_LIFESPAN_YEARS),
         np.inf
     )
     
@@ -101,19 +113,7 @@ def add_payback_analysis(df):
     )
     
     # 9. Create payback categories for analysis
-    def categorize_payback(years):
-        if years == np.inf:
-            return 'Never'
-        elif years <= 10:
-            return 'Excellent (<10 years)'
-        elif years <= 15:
-            return 'Good (10-15 years)'
-        elif years <= 25:
-            return 'Fair (15-25 years)'
-        else:
-            return 'Poor (>25 years)'
-    
-    df_analysis['payback_category'] = df_analysis['payback_years'].apply(categorize_payback)
+    df_analysis['payback_category'] = categorize_payback(df_analysis['payback_years'])
     
     return df_analysis
 
@@ -0,0 +1,166 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from kineticFloorPaybackPeriod import (
+    COST_PER_TILE_YEN, INSTALLATION_COST_PER_SQM_YEN, TILE_AREA_SQM, MAINTENANCE_RATE,
+    COMMERCIAL_RATE, RESIDENTIAL_RATE, ENERGY_PER_STEP_JOULES, JOULES_TO_KWH,
+    SYSTEM_LIFESPAN_YEARS, is_residential
+)
+
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'Data2025',
+                            'Nihonbashi2_OnFoot_KineticFloorData.csv')
+
+# Parameter distributions; each entry is one of
+#   ('fixed', value)
+#   ('uniform', low, high)
+#   ('normal', mean, std)
+#   ('triangular', low, mode, high)
+#   ('choice', [values])  -> drawn at random
+#   ('grid', [values])    -> every value is evaluated (cartesian product over grid parameters)
+DEFAULT_SPEC = {
+    'tile_cost_yen': ('triangular', 45000, COST_PER_TILE_YEN, 70000),
+    'installation_cost_per_sqm_yen': ('uniform', 20000, 40000),
+    'energy_per_step_joules': ('uniform', 3, 7),
+    'maintenance_rate': ('uniform', 0.01, 0.03),
+    'commercial_rate_yen_kwh': ('normal', COMMERCIAL_RATE, 2.0),
+    'residential_rate_yen_kwh': ('normal', RESIDENTIAL_RATE, 2.0),
+    # The x250 / x900 / x1400 runs that used to be swapped in by commenting lines out
+    'footstep_multiplier': ('grid', [1, 250, 900, 1400]),
+}
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def build_scenarios(spec=DEFAULT_SPEC, n=100000, seed=0):
+    """
+    Draw scenario parameters as a DataFrame (one row per scenario).
+
+    Grid parameters are crossed with each other; every grid cell gets n random draws
+    of the remaining parameters, so the total is n x (product of grid sizes).
+    """
+    rng = np.random.default_rng(seed)
+    grid_names = [name for name, dist in spec.items() if dist[0] == 'grid']
+    grid_values = [np.asarray(spec[name][1], dtype=float) for name in grid_names]
+    n_cells = int(np.prod([len(v) for v in grid_values])) if grid_values else 1
+    total = n * n_cells
+
+    scenarios = {}
+    if grid_values:
+        mesh = np.meshgrid(*grid_values, indexing='ij')
+        for name, values in zip(grid_names, mesh):
+            scenarios[name] = np.repeat(values.ravel(), n)
+
+    for name, dist in spec.items():
+        kind = dist[0]
+        if kind == 'grid':
+            continue
+        elif kind == 'fixed':
+            values = np.full(total, float(dist[1]))
+        elif kind == 'uniform':
+            values = rng.uniform(dist[1], dist[2], total)
+        elif kind == 'normal':
+            values = rng.normal(dist[1], dist[2], total)
+        elif kind == 'triangular':
+            values = rng.triangular(dist[1], dist[2], dist[3], total)
+        elif kind == 'choice':
+            values = rng.choice(np.asarray(dist[1], dtype=float), total)
+        else:
+            raise ValueError(f"Unknown distribution '{kind}' for {name}")
+        scenarios[name] = values
+
+    return pd.DataFrame(scenarios)
+
+
+def evaluate_payback(df, scenarios, chunk_size=25000):
+    """
+    Payback years for every building x scenario, computed with NumPy broadcasting.
+
+    Returns a float32 array of shape (n_buildings, n_scenarios); np.inf means never.
+    """
+    kf_area = df['KFArea'].to_numpy(dtype=np.float64)[:, None]
+    footsteps = df['footsteps'].to_numpy(dtype=np.float64)[:, None]
+    residential = is_residential(df['MainUse'])[:, None]
+    num_tiles = np.ceil(kf_area / TILE_AREA_SQM)
+
+    columns = {name: scenarios[name].to_numpy(dtype=np.float64) for name in DEFAULT_SPEC if name in scenarios}
+    defaults = {
+        'tile_cost_yen': COST_PER_TILE_YEN,
+        'installation_cost_per_sqm_yen': INSTALLATION_COST_PER_SQM_YEN,
+        'energy_per_step_joules': ENERGY_PER_STEP_JOULES,
+        'maintenance_rate': MAINTENANCE_RATE,
+        'commercial_rate_yen_kwh': COMMERCIAL_RATE,
+        'residential_rate_yen_kwh': RESIDENTIAL_RATE,
+        'footstep_multiplier': 1.0,
+    }
+    n_scenarios = len(scenarios)
+    payback = np.empty((len(df), n_scenarios), dtype=np.float32)
+
+    for start in range(0, n_scenarios, chunk_size):
+        s = slice(start, min(start + chunk_size, n_scenarios))
+        p = {name: (columns[name][s] if name in columns else np.full(s.stop - s.start, value))[None, :]
+             for name, value in defaults.items()}
+
+        total_cost = num_tiles * p['tile_cost_yen'] + kf_area * p['installation_cost_per_sqm_yen']
+        rate = np.where(residential, p['residential_rate_yen_kwh'], p['commercial_rate_yen_kwh'])
+        yearly_kwh = footsteps * p['footstep_multiplier'] * p['energy_per_step_joules'] * JOULES_TO_KWH * 365
+        net_benefit = yearly_kwh * rate - total_cost * p['maintenance_rate']
+        with np.errstate(divide='ignore'):
+            payback[:, s] = np.where(net_benefit > 0, total_cost / net_benefit, np.inf)
+
+    return payback
+
+
+def payback_bands(df, payback, percentiles=PERCENTILES, horizon_years=SYSTEM_LIFESPAN_YEARS):
+    """Percentile bands of payback years per building plus the share of scenarios paying back in time"""
+    # inverted_cdf picks observed values, so 'never' (inf) survives instead of turning into nan
+    bands = np.percentile(payback, percentiles, axis=1, method='inverted_cdf').T
+    result = pd.DataFrame(bands, columns=[f'payback_p{q}_years' for q in percentiles], index=df.index)
+    result.insert(0, 'MainUse', df['MainUse'].to_numpy())
+    if 'KEYID' in df:
+        result.insert(0, 'KEYID', df['KEYID'].to_numpy())
+    result[f'prob_payback_within_{horizon_years}y'] = (payback <= horizon_years).mean(axis=1)
+    return result
+
+
+def run_scenarios(df, spec=DEFAULT_SPEC, n=100000, seed=0, group_by='footstep_multiplier'):
+    """
+    Evaluate every building under n sampled scenarios per grid cell and return percentile
+    bands per building (one block per value of group_by when it is a grid parameter).
+    """
+    scenarios = build_scenarios(spec, n, seed)
+    payback = evaluate_payback(df, scenarios)
+
+    if group_by not in scenarios or spec.get(group_by, ('',))[0] != 'grid':
+        return payback_bands(df, payback)
+    blocks = []
+    for value in np.unique(scenarios[group_by]):
+        mask = (scenarios[group_by] == value).to_numpy()
+        block = payback_bands(df, payback[:, mask])
+        block.insert(2, group_by, value)
+        blocks.append(block)
+    return pd.concat(blocks, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo payback bands for kinetic floor tiles")
+    parser.add_argument('csv', nargs='?', default=DEFAULT_DATA, help='kinetic energy dataset')
+    parser.add_argument('-n', type=int, default=100000, help='scenarios per footstep multiplier')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='kinetic_payback_scenarios.csv')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv, encoding='utf-8-sig')
+    start = time.perf_counter()
+    bands = run_scenarios(df, n=args.n, seed=args.seed)
+    elapsed = time.perf_counter() - start
+
+    n_total = args.n * len(DEFAULT_SPEC['footstep_multiplier'][1])
+    print(f"Evaluated {len(df)} buildings x {n_total:,} scenarios in {elapsed:.2f} s")
+    summary = bands.groupby('footstep_multiplier')[['payback_p50_years', f'prob_payback_within_{SYSTEM_LIFESPAN_YEARS}y']]
+    print(summary.median().rename(columns=lambda c: f'median {c}'))
+    bands.to_csv(args.output, index=False)
+    print(f"\nResults saved to '{args.output}'")
@@ -0,0 +1,174 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from kineticFloorPaybackPeriod import COMMERCIAL_RATE, RESIDENTIAL_RATE, ENERGY_PER_STEP_KWH, is_residential
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'models', 'urban_risk', 'flow_analysis'))
+
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'Data2025',
+                            'Nihonbashi2_OnFoot_KineticFloorData.csv')
+
+YEAR = 2025
+HOURS_PER_YEAR = 8760
+LOCAL_TZ = 'Asia/Tokyo'
+CHUNK_BUILDINGS = 2048  # 2048 x 8760 float32 = 72 MB per hourly array
+
+# Share of a day's footsteps per local hour (0-23) when no flow cube is given:
+# commuter peaks at 8-9 and 18-19, lunch bump, quiet nights
+DEFAULT_HOURLY_PROFILE = np.array([
+    0.2, 0.1, 0.1, 0.1, 0.2, 0.5, 1.5, 4.0, 9.0, 8.0, 5.0, 5.0,
+    7.5, 6.5, 5.0, 5.0, 5.5, 7.0, 9.0, 6.5, 4.5, 3.0, 1.5, 0.6
+])
+
+# Weekend / holiday footfall relative to an average weekday, by MainUse
+WEEKEND_FACTOR = {'Office': 0.3, 'Com': 1.3, 'Hotel': 1.1, 'Resid': 1.1, 'Hospital': 0.5}
+DEFAULT_WEEKEND_FACTOR = 0.8
+
+# Time-of-use tariffs (¥/kWh) per local hour, weekday and weekend/holiday.
+# Centred on the flat COMMERCIAL_RATE / RESIDENTIAL_RATE, with a daytime/evening peak and a night discount.
+TOU_TARIFFS = {
+    'commercial': {
+        'weekday': np.array([24.0] * 8 + [33.5] * 5 + [38.0] * 4 + [33.5] * 5 + [24.0] * 2),
+        'weekend': np.array([24.0] * 8 + [30.18] * 14 + [24.0] * 2),
+    },
+    'residential': {
+        'weekday': np.array([28.0] * 6 + [36.7] * 11 + [44.0] * 4 + [36.7] * 2 + [28.0]),
+        'weekend': np.array([28.0] * 6 + [36.7] * 17 + [28.0]),
+    },
+}
+
+
+def year_hours(year=YEAR):
+    """Local hour of day and weekend flag for every hour of the year (first 8760 hours)"""
+    hours = pd.date_range(f'{year}-01-01', periods=HOURS_PER_YEAR, freq='h', tz=LOCAL_TZ)
+    return np.asarray(hours.hour), np.asarray(hours.dayofweek >= 5)
+
+
+def profile_from_cube(cube_path, nodes=None):
+    """
+    Hour-of-day footfall shares (weekday, weekend) from the on-foot GPS flow cube, in local time.
+    Falls back to the weekday shape for weekends when the cube covers no weekend day.
+    """
+    from flow_cube import FlowCube
+    cube = FlowCube(cube_path)
+    series = cube.series(cube.start, cube.end, nodes=nodes, resolution='1h')
+    local = series.index.tz_convert(LOCAL_TZ)
+    frame = pd.DataFrame({'count': series.to_numpy(), 'hour': np.asarray(local.hour), 'weekend': np.asarray(local.dayofweek >= 5)})
+
+    profiles = {}
+    for weekend, group in frame.groupby('weekend'):
+        mean = group.groupby('hour')['count'].mean().reindex(range(24), fill_value=0).to_numpy()
+        profiles['weekend' if weekend else 'weekday'] = mean
+    weekday = profiles.get('weekday', profiles.get('weekend'))
+    return weekday, profiles.get('weekend', weekday)
+
+
+def hourly_shares(weekday_profile, weekend_profile, weekend_factor, hour, weekend):
+    """
+    Footsteps per hour as a multiple of the daily footsteps, scaled so that the year sums to
+    365 days: the yearly total matches the existing footsteps x 365 assumption.
+    """
+    weekday_profile = np.asarray(weekday_profile, dtype=np.float64)
+    weekend_profile = np.asarray(weekend_profile, dtype=np.float64)
+    shares = np.where(weekend, weekend_profile[hour] / weekend_profile.sum() * weekend_factor,
+                      weekday_profile[hour] / weekday_profile.sum())
+    return (shares * 365 / shares.sum()).astype(np.float32)
+
+
+def simulate(df, weekday_profile=DEFAULT_HOURLY_PROFILE, weekend_profile=None, footstep_multiplier=1.0,
+             year=YEAR, chunk_size=CHUNK_BUILDINGS, hourly_out=None):
+    """
+    Hourly energy (kWh) for every building x hour of the year, priced with time-of-use tariffs.
+
+    Buildings are processed in chunks of float32 (chunk x 8760) arrays. Returns per-building
+    totals and the district's hourly series; hourly_out (.npy path) keeps the full matrix on disk.
+    """
+    weekend_profile = weekday_profile if weekend_profile is None else weekend_profile
+    hour, weekend = year_hours(year)
+    residential = is_residential(df['MainUse'])
+    main_use = df['MainUse'].astype(str).to_numpy()
+    daily_kwh = (df['footsteps'].to_numpy(dtype=np.float64) * footstep_multiplier * ENERGY_PER_STEP_KWH).astype(np.float32)
+
+    # One share vector per weekend factor, one price vector per tariff class
+    factors = np.array([WEEKEND_FACTOR.get(use, DEFAULT_WEEKEND_FACTOR) for use in main_use])
+    unique_factors, factor_idx = np.unique(factors, return_inverse=True)
+    shares = np.stack([hourly_shares(weekday_profile, weekend_profile, f, hour, weekend) for f in unique_factors])
+    prices = np.stack([
+        np.where(weekend, TOU_TARIFFS[name]['weekend'][hour], TOU_TARIFFS[name]['weekday'][hour]).astype(np.float32)
+        for name in ('commercial', 'residential')
+    ])
+    price_idx = residential.astype(np.int64)
+
+    n = len(df)
+    matrix = None
+    if hourly_out:
+        matrix = np.lib.format.open_memmap(hourly_out, mode='w+', dtype=np.float32, shape=(n, HOURS_PER_YEAR))
+    annual_kwh = np.empty(n)
+    tou_revenue = np.empty(n)
+    peak_kwh = np.empty(n, dtype=np.float32)
+    district = np.zeros(HOURS_PER_YEAR, dtype=np.float64)
+    district_revenue = np.zeros(HOURS_PER_YEAR, dtype=np.float64)
+
+    for start in range(0, n, chunk_size):
+        s = slice(start, min(start + chunk_size, n))
+        energy = daily_kwh[s, None] * shares[factor_idx[s]]  # (chunk, 8760) float32
+        revenue = energy * prices[price_idx[s]]
+        annual_kwh[s] = energy.sum(axis=1, dtype=np.float64)
+        tou_revenue[s] = revenue.sum(axis=1, dtype=np.float64)
+        peak_kwh[s] = energy.max(axis=1)
+        district += energy.sum(axis=0, dtype=np.float64)
+        district_revenue += revenue.sum(axis=0, dtype=np.float64)
+        if matrix is not None:
+            matrix[s] = energy
+        del energy, revenue
+    if matrix is not None:
+        matrix.flush()
+
+    flat_rate = np.where(residential, RESIDENTIAL_RATE, COMMERCIAL_RATE)
+    buildings = pd.DataFrame({
+        'MainUse': main_use,
+        'annual_kwh': annual_kwh,
+        'annual_revenue_tou_yen': tou_revenue,
+        'annual_revenue_flat_yen': annual_kwh * flat_rate,
+        'peak_hour_kwh': peak_kwh,
+    }, index=df.index)
+    buildings['tou_vs_flat_pct'] = (buildings['annual_revenue_tou_yen'] / buildings['annual_revenue_flat_yen'] - 1) * 100
+    if 'KEYID' in df:
+        buildings.insert(0, 'KEYID', df['KEYID'].to_numpy())
+
+    index = pd.date_range(f'{year}-01-01', periods=HOURS_PER_YEAR, freq='h', tz=LOCAL_TZ)
+    hourly = pd.DataFrame({'district_kwh': district, 'district_revenue_yen': district_revenue}, index=index)
+    return buildings, hourly
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hourly kinetic floor energy and time-of-use revenue")
+    parser.add_argument('--csv', default=DEFAULT_DATA, help='kinetic energy dataset')
+    parser.add_argument('--flow-cube', help='on-foot flow cube directory (flow_analysis/05-22-flow-cube-foot) for the hourly '
+                                            'profile; the 05-22-flow-cube cube is vehicle flow')
+    parser.add_argument('--footstep-multiplier', type=float, default=1.0)
+    parser.add_argument('--year', type=int, default=YEAR)
+    parser.add_argument('--hourly-matrix', help='write the buildings x 8760 float32 matrix to this .npy file')
+    parser.add_argument('--output', default='kinetic_hourly_buildings.csv')
+    parser.add_argument('--district-output', default='kinetic_hourly_district.csv')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv, encoding='utf-8-sig')
+    weekday, weekend = (profile_from_cube(args.flow_cube) if args.flow_cube else (DEFAULT_HOURLY_PROFILE, None))
+    start = time.perf_counter()
+    buildings, hourly = simulate(df, weekday, weekend, args.footstep_multiplier, args.year, hourly_out=args.hourly_matrix)
+    elapsed = time.perf_counter() - start
+
+    print(f"Simulated {len(df)} buildings x {HOURS_PER_YEAR} hours in {elapsed:.2f} s")
+    print(f"District energy: {buildings['annual_kwh'].sum():,.2f} kWh/year")
+    print(f"Revenue, time-of-use: ¥{buildings['annual_revenue_tou_yen'].sum():,.0f}  "
+          f"flat: ¥{buildings['annual_revenue_flat_yen'].sum():,.0f}")
+    print(f"District peak hour: {hourly['district_kwh'].idxmax()} ({hourly['district_kwh'].max():.4f} kWh)")
+    buildings.to_csv(args.output, index=False)
+    hourly.to_csv(args.district_output, index_label='hour')
+    print(f"\nResults saved to '{args.output}' and '{args.district_output}'")
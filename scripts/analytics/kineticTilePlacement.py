@@ -0,0 +1,249 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from kineticFloorPaybackPeriod import (
+    COST_PER_TILE_YEN, INSTALLATION_COST_PER_SQM_YEN, TILE_AREA_SQM, MAINTENANCE_RATE,
+    SYSTEM_LIFESPAN_YEARS, get_electricity_rate
+)
+
+DEFAULT_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'Data2025',
+                            'Nihonbashi2_OnFoot_KineticFloorData.csv')
+
+# Coverage tiers already computed by the kinetic energy calculator (0 = no tiles)
+COVERAGE_TIERS = [0, 10, 25, 50, 75, 90]
+DISCOUNT_RATE = 0.03  # Yearly discount rate for NPV
+MAX_BUDGET_CELLS = 200000  # Resolution of the exact solver's budget axis
+HULL_TOLERANCE = 0.05  # Greedy treats step ratios within 5% as equal and takes the smaller step
+
+
+def tier_options(df, tiers=COVERAGE_TIERS, footstep_multiplier=1.0, discount_rate=DISCOUNT_RATE,
+                 lifespan_years=SYSTEM_LIFESPAN_YEARS):
+    """
+    Cost and benefit of every (building, coverage tier) option as (n_buildings, n_tiers) arrays.
+
+    Uses the KFloor_{p}p areas and Energy_{p}p_kWh daily energy of the dataset.
+    """
+    n = len(df)
+    area = np.zeros((n, len(tiers)))
+    daily_kwh = np.zeros((n, len(tiers)))
+    for j, pct in enumerate(tiers):
+        if pct == 0:
+            continue
+        area[:, j] = df[f'KFloor_{pct}p'].to_numpy(dtype=float)
+        daily_kwh[:, j] = df[f'Energy_{pct}p_kWh'].to_numpy(dtype=float)
+
+    cost = np.ceil(area / TILE_AREA_SQM) * COST_PER_TILE_YEN + area * INSTALLATION_COST_PER_SQM_YEN
+    annual_kwh = daily_kwh * 365 * footstep_multiplier
+    rate = get_electricity_rate(df['MainUse'])[:, None]
+    net_annual = annual_kwh * rate - cost * MAINTENANCE_RATE
+    annuity = (1 - (1 + discount_rate) ** -lifespan_years) / discount_rate
+    return {'tiers': np.asarray(tiers), 'cost': cost, 'annual_kwh': annual_kwh, 'npv': net_annual * annuity - cost}
+
+
+def allowed_options(df, tiers=COVERAGE_TIERS, min_pct=0, max_pct=100, max_cost=None, cost=None, exclude_uses=()):
+    """
+    Boolean (n_buildings, n_tiers) mask of permitted tiers.
+
+    min_pct / max_pct / max_cost may be scalars or per-building arrays; buildings whose MainUse
+    is in exclude_uses only keep the 0% tier. Buildings with no permitted tier fall back to 0%.
+    """
+    tiers = np.asarray(tiers)[None, :]
+    min_pct = np.asarray(min_pct, dtype=float).reshape(-1, 1)
+    max_pct = np.asarray(max_pct, dtype=float).reshape(-1, 1)
+    allowed = np.broadcast_to((tiers >= min_pct) & (tiers <= max_pct), (len(df), tiers.shape[1])).copy()
+    if max_cost is not None:
+        allowed &= cost <= np.asarray(max_cost, dtype=float).reshape(-1, 1)
+    if len(exclude_uses):
+        excluded = df['MainUse'].isin(exclude_uses).to_numpy()
+        allowed[excluded] = tiers[0] == 0
+    allowed[~allowed.any(axis=1), 0] = True
+    return allowed
+
+
+def greedy_frontier(cost, benefit, allowed):
+    """
+    Approximate Pareto curve from the LP relaxation of the multiple-choice knapsack.
+
+    Each building keeps the upper convex hull of its (cost, benefit) options (near-collinear
+    options are kept as separate steps); all steps are sorted by benefit per yen and taken in
+    order. Each prefix is a feasible plan, and the curve is exact at every step boundary for
+    buildings whose options are concave in cost.
+    Returns the steps (building, tier, cumulative cost, cumulative benefit) in the order taken.
+    """
+    steps = []
+    for i in range(cost.shape[0]):
+        idx = np.flatnonzero(allowed[i])
+        base = idx[np.argmin(cost[i, idx])]
+        c0, b0 = cost[i, base], benefit[i, base]
+        candidates = idx[(benefit[i, idx] > b0) & (cost[i, idx] > c0)]
+        current = base
+        last_ratio = np.inf
+        # Walk the upper hull: always move to the option with the best incremental ratio
+        while len(candidates):
+            ratio = (benefit[i, candidates] - benefit[i, current]) / (cost[i, candidates] - cost[i, current])
+            # Near-ties go to the smaller step so budgets can be filled in finer increments
+            near = ratio >= ratio.max() * (1 - HULL_TOLERANCE) if ratio.max() > 0 else ratio >= ratio.max()
+            best = candidates[near][np.argmin(cost[i, candidates[near]])]
+            last_ratio = min(last_ratio, ratio[candidates == best][0])
+            steps.append((last_ratio, i, current, best, cost[i, best] - cost[i, current], benefit[i, best] - benefit[i, current]))
+            current = best
+            candidates = candidates[(cost[i, candidates] > cost[i, current]) & (benefit[i, candidates] > benefit[i, current])]
+
+    start_cost = sum(cost[i, np.flatnonzero(allowed[i])].min() for i in range(cost.shape[0]))
+    steps = pd.DataFrame(steps, columns=['ratio', 'building', 'from_tier', 'tier', 'd_cost', 'd_benefit'])
+    # A building's own step ratios never increase, so a stable sort keeps them in hull order
+    steps = steps.sort_values('ratio', ascending=False, kind='mergesort').reset_index(drop=True)
+    steps['cost'] = start_cost + steps['d_cost'].cumsum()
+    steps['benefit'] = steps['d_benefit'].cumsum()
+    return steps
+
+
+def greedy_plan(steps, budget, base_choice, cost, benefit, allowed):
+    """
+    Tier index per building from the greedy steps: take steps in ratio order, skipping any
+    that no longer fit, then spend what is left on the best affordable upgrade per building
+    (including tiers between hull points), best ratio first.
+    """
+    choice = base_choice.copy()
+    rows = np.arange(len(choice))
+    spent = cost[rows, choice].sum()
+    for building, from_tier, tier, d_cost in zip(steps['building'], steps['from_tier'], steps['tier'], steps['d_cost']):
+        if choice[building] == from_tier and spent + d_cost <= budget:
+            choice[building] = tier
+            spent += d_cost
+
+    for building in steps.drop_duplicates('building')['building']:
+        extra = cost[building] - cost[building, choice[building]]
+        gain = benefit[building] - benefit[building, choice[building]]
+        fits = allowed[building] & (extra > 0) & (extra <= budget - spent) & (gain > 0)
+        if fits.any():
+            tier = np.flatnonzero(fits)[np.argmax(gain[fits])]
+            choice[building] = tier
+            spent += extra[tier]
+    return choice
+
+
+def exact_frontier(cost, benefit, allowed, max_budget, unit=None):
+    """
+    Exact multiple-choice knapsack by dynamic programming over a discretized budget axis.
+
+    Option costs are rounded up to `unit` yen (so every plan fits its budget). Returns the best
+    benefit for every budget cell and the choice table needed to recover the plan.
+    """
+    unit = unit or max(1.0, np.ceil(max_budget / MAX_BUDGET_CELLS))
+    n_cells = int(max_budget // unit) + 1
+    units = np.ceil(cost / unit).astype(np.int64)
+
+    best = np.zeros(n_cells)
+    choice = np.zeros((cost.shape[0], n_cells), dtype=np.int8)
+    for i in range(cost.shape[0]):
+        new = np.full(n_cells, -np.inf)
+        for j in np.flatnonzero(allowed[i]):
+            w = units[i, j]
+            if w >= n_cells:
+                continue
+            candidate = np.full(n_cells, -np.inf)
+            candidate[w:] = best[:n_cells - w] + benefit[i, j]
+            better = candidate > new
+            new[better] = candidate[better]
+            choice[i, better] = j
+        best = new
+    min_units = np.where(allowed, units, np.iinfo(np.int64).max).min(axis=1).sum()
+    return {'unit': unit, 'best': best, 'choice': choice, 'units': units, 'min_budget': min_units * unit}
+
+
+def exact_plan(frontier, budget):
+    """
+    Trace the DP choice table back from a budget to a tier index per building.
+    Raises ValueError when no plan meeting the constraints fits the budget.
+    """
+    cell = min(int(budget // frontier['unit']), len(frontier['best']) - 1)
+    if not np.isfinite(frontier['best'][cell]):
+        raise ValueError(f"No plan meets the constraints within ¥{budget:,.0f}; the minimum feasible budget is "
+                         f"¥{frontier['min_budget']:,.0f} (option costs rounded up to ¥{frontier['unit']:,.0f})")
+    # Smallest budget cell reaching the optimum, so the plan does not overspend
+    cell = int(np.flatnonzero(frontier['best'][:cell + 1] >= frontier['best'][cell])[0])
+    choice = frontier['choice']
+    plan = np.zeros(choice.shape[0], dtype=np.int64)
+    for i in range(choice.shape[0] - 1, -1, -1):
+        plan[i] = choice[i, cell]
+        cell -= frontier['units'][i, plan[i]]
+    return plan
+
+
+def optimize_placement(df, budget, objective='energy', method='exact', footstep_multiplier=1.0, **constraints):
+    """
+    Choose a coverage tier per building maximizing annual energy ('energy') or NPV ('npv')
+    under a total budget in yen. Returns (plan DataFrame, Pareto curve DataFrame).
+
+    constraints are passed to allowed_options (min_pct, max_pct, max_cost, exclude_uses).
+    """
+    options = tier_options(df, footstep_multiplier=footstep_multiplier)
+    cost = options['cost']
+    benefit = options['annual_kwh'] if objective == 'energy' else options['npv']
+    allowed = allowed_options(df, cost=cost, **constraints)
+    masked_cost = np.where(allowed, cost, np.inf)
+    base_choice = np.argmin(masked_cost, axis=1)
+    min_budget = masked_cost.min(axis=1).sum()
+    if budget < min_budget:
+        raise ValueError(f"No plan meets the constraints within ¥{budget:,.0f}; "
+                         f"the minimum feasible budget is ¥{min_budget:,.0f}")
+
+    if method == 'exact':
+        frontier = exact_frontier(cost, benefit, allowed, budget)
+        plan = exact_plan(frontier, budget)
+        budgets = np.arange(len(frontier['best'])) * frontier['unit']
+        feasible = np.flatnonzero(np.isfinite(frontier['best']))
+        improves = feasible[np.r_[True, np.diff(frontier['best'][feasible]) > 0]]
+        curve = pd.DataFrame({'budget_yen': budgets[improves], 'benefit': frontier['best'][improves]})
+    elif method == 'greedy':
+        steps = greedy_frontier(cost, benefit, allowed)
+        plan = greedy_plan(steps, budget, base_choice, cost, benefit, allowed)
+        curve = steps.loc[steps['cost'] <= budget, ['cost', 'benefit']].rename(columns={'cost': 'budget_yen'})
+    else:
+        raise ValueError(f"Unknown method '{method}' (use 'exact' or 'greedy')")
+
+    rows = np.arange(len(df))
+    result = pd.DataFrame({
+        'MainUse': df['MainUse'].to_numpy(),
+        'coverage_pct': options['tiers'][plan],
+        'cost_yen': cost[rows, plan],
+        'annual_kwh': options['annual_kwh'][rows, plan],
+        'npv_yen': options['npv'][rows, plan],
+    }, index=df.index)
+    if 'KEYID' in df:
+        result.insert(0, 'KEYID', df['KEYID'].to_numpy())
+    return result, curve.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Budget-constrained kinetic tile placement")
+    parser.add_argument('budget', type=float, help='total budget in yen')
+    parser.add_argument('--csv', default=DEFAULT_DATA, help='kinetic energy dataset')
+    parser.add_argument('--objective', choices=['energy', 'npv'], default='energy')
+    parser.add_argument('--method', choices=['exact', 'greedy'], default='exact')
+    parser.add_argument('--footstep-multiplier', type=float, default=1.0)
+    parser.add_argument('--max-pct', type=float, default=100, help='highest coverage tier allowed per building')
+    parser.add_argument('--exclude', nargs='*', default=[], help='MainUse values to leave without tiles')
+    parser.add_argument('--output', default='kinetic_tile_plan.csv')
+    parser.add_argument('--curve', default='kinetic_tile_pareto.csv')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv, encoding='utf-8-sig')
+    start = time.perf_counter()
+    plan, curve = optimize_placement(df, args.budget, args.objective, args.method, args.footstep_multiplier,
+                                     max_pct=args.max_pct, exclude_uses=args.exclude)
+    elapsed = time.perf_counter() - start
+
+    print(f"Solved {len(df)} buildings ({args.method}, {args.objective}) in {elapsed:.2f} s")
+    print(f"Budget: ¥{args.budget:,.0f}  Spent: ¥{plan['cost_yen'].sum():,.0f}")
+    print(f"Annual energy: {plan['annual_kwh'].sum():,.2f} kWh  NPV: ¥{plan['npv_yen'].sum():,.0f}")
+    print("\nBuildings per coverage tier:")
+    print(plan['coverage_pct'].value_counts().sort_index())
+    plan.to_csv(args.output, index=False)
+    curve.to_csv(args.curve, index=False)
+    print(f"\nPlan saved to '{args.output}', Pareto curve ({len(curve)} points) to '{args.curve}'")
@@ -1,19 +1,21 @@
 import pandas as pd
 
+from energyCube import EnergyCube
+
 # Load the output dataset from the ArcPy kinetic energy calculator tool (should have the spatially joined variables)
 df = pd.read_csv('kinetic_06182025.csv')
 
-# Define energy variables
-energy_vars = ['Energy_10p_kWh', 'Energy_25p_kWh', 'Energy_50p_kWh', 'Energy_75p_kWh', 'Energy_90p_kWh']
+# Energy_10p_kWh ... Energy_90p_kWh summed by category; other cuts (Str, AgeDecade, NFloorBand, FAMix) use the same cube
+cube = EnergyCube(df)
 
 # Sum each variable by category (daily values)
-result_daily = df.groupby('MainUse')[energy_vars].sum()
+result_daily = cube.query(['MainUse'], scale='daily')
 
 print("Daily Energy Consumption by Category:")
 print(result_daily)
 
 # Convert to yearly (multiply by 365)
-result_yearly = result_daily * 365
+result_yearly = cube.query(['MainUse'], scale='yearly')
 
 print("\nYearly Energy Consumption by Category:")
 print(result_yearly)
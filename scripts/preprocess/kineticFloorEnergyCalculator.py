@@ -0,0 +1,192 @@
+"""Kinetic floor energy calculator without ArcGIS.
+
+Same outputs as the "Step 1_Building Kinetic Energy Generator" tool in
+KineticFloorEnergyCalculatorArcPyTool.pyt, computed with GeoPandas/Shapely:
+GPS visit points are joined to building footprints through an STRtree (INTERSECT,
+one to many), counted per building, and every energy column is computed for the whole
+table at once instead of row by row in an UpdateCursor.
+
+    python kineticFloorEnergyCalculator.py Buildings_District2.shp GPS_Weekday.csv kinetic.csv
+    python kineticFloorEnergyCalculator.py Buildings_District2.shp onfoot_visits.parquet kinetic.csv --day 2023-05-22
+    python kineticFloorEnergyCalculator.py --check ../../data/Data2025/Nihonbashi2_OnFoot_KineticFloorData.csv
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+COVERAGE_LEVELS = [10, 25, 50, 75, 90]
+STRIDE_AVG = 1.2  # meters, average length of a forward step
+TILE_SQM = 0.25  # sq meters, one piezoelectric tile
+ENERGY_PER_STEP = 5  # Joules
+JOULES_TO_KWH = 1 / 3600000
+
+# Columns added by the calculator, in the order of Nihonbashi2_OnFoot_KineticFloorData.csv
+OUTPUT_COLUMNS = ["uq_visitors", "t_visits", "stride_avg", "tile_sqm", "GFArea", "KFArea", "footsteps",
+                  "EnergyDaily_J", "EnergyDaily_kWh", "EnergyYearly_kWh", "Coverage_pct"] + \
+                 [f"KFloor_{pct}p" for pct in COVERAGE_LEVELS] + [f"Energy_{pct}p_kWh" for pct in COVERAGE_LEVELS]
+
+REFERENCE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "Data2025",
+                             "Nihonbashi2_OnFoot_KineticFloorData.csv")
+
+
+def load_visits(path, crs, chunk_size=1_000_000):
+    """GPS visit points (tripid + geometry) from a CSV with lat/lon columns or any vector file."""
+    if not path.lower().endswith(".csv"):
+        return gpd.read_file(path).to_crs(crs)[["tripid", "geometry"]]
+    chunks = []
+    for chunk in pd.read_csv(path, usecols=["tripid", "lat", "lon"], chunksize=chunk_size):
+        chunk = chunk.assign(lat=pd.to_numeric(chunk["lat"], errors="coerce"),
+                             lon=pd.to_numeric(chunk["lon"], errors="coerce")).dropna()
+        chunks.append(gpd.GeoDataFrame(chunk[["tripid"]], geometry=gpd.points_from_xy(chunk["lon"], chunk["lat"]),
+                                       crs="EPSG:4326").to_crs(crs))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def visit_counts(buildings, visits, chunk_size=1_000_000):
+    """
+    Visits (t_visits) and distinct trips (uq_visitors) per building, joining points that
+    intersect a footprint. A point inside overlapping footprints counts for each of them.
+    """
+    tree = shapely.STRtree(buildings.geometry.values)
+    pairs = []
+    for start in range(0, len(visits), chunk_size):
+        chunk = visits.iloc[start:start + chunk_size]
+        point_idx, building_idx = tree.query(chunk.geometry.values, predicate="intersects")
+        pairs.append(pd.DataFrame({"building": building_idx, "tripid": chunk["tripid"].to_numpy()[point_idx]}))
+    pairs = pd.concat(pairs, ignore_index=True) if pairs else pd.DataFrame(columns=["building", "tripid"])
+
+    grouped = pairs.groupby("building")["tripid"]
+    t_visits = np.zeros(len(buildings), dtype=np.int64)
+    uq_visitors = np.zeros(len(buildings), dtype=np.int64)
+    t_visits[grouped.size().index.to_numpy(dtype=np.int64)] = grouped.size().to_numpy()
+    uq_visitors[grouped.nunique().index.to_numpy(dtype=np.int64)] = grouped.nunique().to_numpy()
+    return uq_visitors, t_visits
+
+
+def counts_from_table(buildings, table_path, day=None):
+    """
+    uq_visitors / t_visits per building from the Parquet table written by onFootVisits.py,
+    for one day or (by default) the mean over all days in the table.
+    """
+    table = pd.read_parquet(table_path)
+    if day is not None:
+        table = table[pd.to_datetime(table["date"]) == pd.Timestamp(day)]
+        n_days = 1
+    else:
+        n_days = max(table["date"].nunique(), 1)
+    totals = table.groupby("KEYID")[["uq_visitors", "t_visits"]].sum() / n_days
+    totals = totals.reindex(buildings["KEYID"].to_numpy()).fillna(0)
+    return np.round(totals["uq_visitors"]).to_numpy(dtype=np.int64), np.round(totals["t_visits"]).to_numpy(dtype=np.int64)
+
+
+def kinetic_energy(buildings, uq_visitors, t_visits, coverage_pct=100, energy_per_step=ENERGY_PER_STEP,
+                   stride_avg=STRIDE_AVG, tile_sqm=TILE_SQM):
+    """Append the calculator's output columns to a building table (needs TFA and NFloor)."""
+    out = pd.DataFrame(index=buildings.index)
+    t_visits = np.asarray(t_visits)
+    tfa = pd.to_numeric(buildings["TFA"], errors="coerce").to_numpy(dtype=float)
+    n_floor = pd.to_numeric(buildings["NFloor"], errors="coerce").to_numpy(dtype=float)
+
+    out["uq_visitors"] = np.asarray(uq_visitors, dtype=np.int64)
+    out["t_visits"] = t_visits.astype(np.int64)
+    out["stride_avg"] = stride_avg
+    out["tile_sqm"] = tile_sqm
+    valid = ~np.isnan(tfa) & (n_floor > 0)
+    gf_area = np.where(valid, tfa / np.where(valid, n_floor, 1), 0.0)
+    out["GFArea"] = gf_area
+    out["KFArea"] = gf_area * coverage_pct / 100
+
+    footsteps = out["KFArea"].to_numpy() / stride_avg * t_visits
+    # footsteps is a LONG field in the geodatabase; energy uses the unrounded value
+    out["footsteps"] = np.round(footsteps).astype(np.int64)
+    out["EnergyDaily_J"] = footsteps * energy_per_step
+    out["EnergyDaily_kWh"] = out["EnergyDaily_J"] * JOULES_TO_KWH
+    out["EnergyYearly_kWh"] = out["EnergyDaily_kWh"] * 365
+    out["Coverage_pct"] = int(coverage_pct)
+
+    for pct in COVERAGE_LEVELS:
+        out[f"KFloor_{pct}p"] = gf_area * pct / 100
+    for pct in COVERAGE_LEVELS:
+        out[f"Energy_{pct}p_kWh"] = out[f"KFloor_{pct}p"] / stride_avg * t_visits * energy_per_step * JOULES_TO_KWH
+
+    attributes = buildings.drop(columns=[c for c in OUTPUT_COLUMNS if c in buildings])
+    return pd.concat([attributes, out], axis=1)
+
+
+def calculate(buildings_path, visits_path, coverage_pct=100, energy_per_step=ENERGY_PER_STEP, day=None):
+    """
+    Run the full calculator: footprints + GPS visits -> kinetic energy table (GeoDataFrame).
+    visits_path may also be a .parquet table from onFootVisits.py (buildings matched by KEYID).
+    """
+    buildings = gpd.read_file(buildings_path)
+    if visits_path.lower().endswith(".parquet"):
+        uq_visitors, t_visits = counts_from_table(buildings, visits_path, day)
+        print(f"Read visit counts for {int((t_visits > 0).sum())} of {len(buildings)} buildings")
+    else:
+        visits = load_visits(visits_path, buildings.crs)
+        uq_visitors, t_visits = visit_counts(buildings, visits)
+        print(f"Joined {len(visits)} GPS points to {int((t_visits > 0).sum())} of {len(buildings)} buildings")
+    result = kinetic_energy(buildings, uq_visitors, t_visits, coverage_pct, energy_per_step)
+    print(f"Total Daily Energy Generation: {result['EnergyDaily_kWh'].sum():.2f} kWh")
+    print(f"Total Yearly Energy Generation: {result['EnergyYearly_kWh'].sum():.2f} kWh")
+    return gpd.GeoDataFrame(result, geometry="geometry", crs=buildings.crs)
+
+
+def regression_check(reference_csv=REFERENCE_CSV):
+    """
+    Recompute every output column from the reference dataset's own building attributes and
+    visit counts and compare with the values the ArcPy tool wrote. Returns the mismatching columns.
+    """
+    reference = pd.read_csv(reference_csv, encoding="utf-8-sig")
+    coverage_pct = int(reference["Coverage_pct"].iloc[0])
+    result = kinetic_energy(reference.drop(columns=OUTPUT_COLUMNS), reference["uq_visitors"],
+                            reference["t_visits"], coverage_pct)
+
+    if list(result.columns) != list(reference.columns):
+        print(f"Column order differs:\n  expected {list(reference.columns)}\n  got      {list(result.columns)}")
+        return ["<columns>"]
+    failures = []
+    for column in OUTPUT_COLUMNS:
+        expected = reference[column].to_numpy(dtype=float)
+        actual = result[column].to_numpy(dtype=float)
+        if column == "footsteps":
+            # The ArcGIS LONG conversion does not always round to nearest
+            ok = np.abs(actual - expected) <= 1
+        else:
+            ok = np.isclose(actual, expected, rtol=1e-6, atol=1e-9)
+        status = "ok" if ok.all() else f"{(~ok).sum()} rows differ"
+        print(f"{column:<18} {status}")
+        if not ok.all():
+            failures.append(column)
+    print("Regression check passed" if not failures else f"Regression check failed: {failures}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("buildings", nargs="?", help="building footprints (shapefile, GeoPackage, ...) with TFA and NFloor")
+    parser.add_argument("visits", nargs="?",
+                        help="GPS visits (CSV with tripid/lat/lon, a point layer, or a .parquet table from onFootVisits.py)")
+    parser.add_argument("output", nargs="?", help="output .csv (attributes only) or .gpkg")
+    parser.add_argument("--coverage", type=float, default=100, help="focus kinetic floor coverage (%%)")
+    parser.add_argument("--energy-per-step", type=float, default=ENERGY_PER_STEP, help="Joules per footstep")
+    parser.add_argument("--day", help="day to use from a .parquet visits table (default: mean over all days)")
+    parser.add_argument("--check", nargs="?", const=REFERENCE_CSV, metavar="REFERENCE_CSV",
+                        help="compare against a dataset produced by the ArcPy tool")
+    args = parser.parse_args()
+
+    if args.check:
+        raise SystemExit(1 if regression_check(args.check) else 0)
+    if not (args.buildings and args.visits and args.output):
+        parser.error("buildings, visits and output are required unless --check is given")
+    result = calculate(args.buildings, args.visits, args.coverage, args.energy_per_step, args.day)
+    if args.output.lower().endswith(".csv"):
+        result.drop(columns="geometry").to_csv(args.output, index=False)
+    else:
+        result.to_file(args.output)
+    print(f"Results saved to '{args.output}'")
@@ -0,0 +1,119 @@
+"""Building visits and footsteps per day from on-foot GPS points.
+
+Replaces the opaque upstream join behind the kinetic dataset's `uq_visitors` / `t_visits`
+/ `footsteps` columns. Raw GPS (the same `tripid,recordedat,lat,lon,transportmode` CSV read
+by flow_analysis_v3.py) is read in chunks, the on-foot points of each chunk are assigned to
+building footprints in a worker process (STRtree + vectorized point-in-polygon), and the
+(KEYID, day) counts are merged into one Parquet table:
+
+    KEYID, date, t_visits, uq_visitors, footsteps
+
+`kineticFloorEnergyCalculator.py` accepts this table in place of raw GPS.
+
+    python onFootVisits.py Buildings_District2.shp 05-22-GPS.csv onfoot_visits.parquet --workers 8
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from kineticFloorEnergyCalculator import STRIDE_AVG
+
+GPS_COLUMNS = ["tripid", "recordedat", "lat", "lon", "transportmode"]
+ON_FOOT_MODES = ["on_foot", "walking", "running"]
+LOCAL_TZ = "Asia/Tokyo"  # Days are counted in local time, recordedat is UTC
+CHUNK_SIZE = 1_000_000
+
+# Set once per worker by _init_worker so the tree is not pickled with every chunk
+_buildings = {}
+
+
+def _init_worker(footprints_wkb, keyids, crs):
+    geoms = shapely.from_wkb(footprints_wkb)
+    _buildings["tree"] = shapely.STRtree(geoms)
+    _buildings["keyid"] = keyids
+    _buildings["crs"] = crs
+
+
+def assign_chunk(chunk):
+    """(KEYID, date, tripid) of every on-foot point in the chunk that lies in a footprint."""
+    chunk = chunk[chunk["transportmode"].isin(ON_FOOT_MODES)]
+    lat = pd.to_numeric(chunk["lat"], errors="coerce").to_numpy()
+    lon = pd.to_numeric(chunk["lon"], errors="coerce").to_numpy()
+    ok = ~(np.isnan(lat) | np.isnan(lon)) & chunk["tripid"].notna().to_numpy()
+    chunk, lat, lon = chunk[ok], lat[ok], lon[ok]
+
+    points = gpd.GeoSeries(shapely.points(lon, lat), crs="EPSG:4326").to_crs(_buildings["crs"]).values
+    point_idx, building_idx = _buildings["tree"].query(points, predicate="intersects")
+    dates = pd.to_datetime(chunk["recordedat"].to_numpy()[point_idx], format="ISO8601", utc=True)
+    return pd.DataFrame({
+        "KEYID": _buildings["keyid"][building_idx],
+        "date": dates.tz_convert(LOCAL_TZ).date,
+        "tripid": chunk["tripid"].to_numpy()[point_idx],
+    })
+
+
+def count_visits(pairs):
+    """t_visits (points) and uq_visitors (distinct trips) per (KEYID, date)."""
+    return pairs.groupby(["KEYID", "date"]).agg(
+        t_visits=("tripid", "size"),
+        uq_visitors=("tripid", "nunique"),
+    ).reset_index()
+
+
+def building_visits(buildings, gps_path, workers=None, chunk_size=CHUNK_SIZE):
+    """Visit counts per building and day from a GPS CSV, chunks assigned in parallel."""
+    footprints_wkb = shapely.to_wkb(buildings.geometry.values)
+    keyids = buildings["KEYID"].to_numpy()
+    reader = pd.read_csv(gps_path, usecols=GPS_COLUMNS, chunksize=chunk_size)
+    workers = workers or os.cpu_count()
+    pairs, pending = [], set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(footprints_wkb, keyids, buildings.crs.to_wkt())) as pool:
+        for chunk in reader:
+            # Keep at most two chunks per worker in flight so multi-day files are not read into memory at once
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pairs.extend(f.result() for f in done)
+            pending.add(pool.submit(assign_chunk, chunk))
+        pairs.extend(f.result() for f in wait(pending)[0])
+    pairs = pd.concat(pairs, ignore_index=True)
+    # A trip can span chunks, so distinct trips are only counted after all chunks are merged
+    return count_visits(pairs)
+
+
+def add_footsteps(visits, buildings, coverage_pct=100, stride_avg=STRIDE_AVG):
+    """footsteps = kinetic floor area / stride x visits, when buildings carry TFA and NFloor."""
+    if not {"TFA", "NFloor"} <= set(buildings.columns):
+        return visits
+    n_floor = pd.to_numeric(buildings["NFloor"], errors="coerce")
+    gf_area = (pd.to_numeric(buildings["TFA"], errors="coerce") / n_floor.where(n_floor > 0)).fillna(0)
+    kf_area = pd.Series((gf_area * coverage_pct / 100).to_numpy(), index=buildings["KEYID"].to_numpy())
+    visits["footsteps"] = np.round(visits["KEYID"].map(kf_area).fillna(0) / stride_avg * visits["t_visits"]).astype(np.int64)
+    return visits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("buildings", help="building footprints with KEYID (and TFA/NFloor for footsteps)")
+    parser.add_argument("gps", help="GPS CSV with tripid, recordedat, lat, lon, transportmode")
+    parser.add_argument("output", help="output Parquet table")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--coverage", type=float, default=100, help="kinetic floor coverage (%%) for footsteps")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    buildings = gpd.read_file(args.buildings)
+    visits = building_visits(buildings, args.gps, args.workers, args.chunk_size)
+    visits = add_footsteps(visits, buildings, args.coverage)
+    visits.to_parquet(args.output, index=False)
+    print(f"{len(visits)} building-days from {visits['date'].nunique()} days, "
+          f"{visits['KEYID'].nunique()} buildings visited ({time.perf_counter() - start:.1f} s)")
+    print(f"Results saved to '{args.output}'")